@@ -0,0 +1,326 @@
+"""
+Tipos de índice FAISS para el índice documental
+================================================
+
+Permite elegir en tiempo de construcción entre:
+
+- `flat`     : IndexFlatIP, búsqueda exacta (línea base)
+- `hnsw`     : IndexHNSWFlat, grafo HNSW (efSearch ajustable)
+- `ivf_flat` : IndexIVFFlat, listas invertidas (nprobe ajustable)
+- `ivf_pq`   : IndexIVFPQ, listas invertidas + product quantization
+- `sq8`      : IndexScalarQuantizer 8 bits (4x menos memoria que float32)
+- `fp16`     : IndexScalarQuantizer float16 (2x menos, sin entrenamiento)
+- `pq`       : IndexPQ, product quantization sin listas invertidas
+
+Cualquier tipo acepta `pca_dim`: reduce dimensiones con PCA antes de
+indexar (IndexPreTransform) y re-normaliza el resultado. La consulta se
+proyecta automáticamente.
+
+El índice entrenado se guarda con `faiss.write_index` y junto a él un
+manifiesto JSON (`<índice>.json`) con el tipo y los parámetros de
+construcción y de búsqueda, que `HybridRetriever` aplica al cargar.
+
+En modo servicio el índice se abre con mmap de solo lectura: los workers
+comparten una sola copia en el page cache y solo se cargan las páginas
+que se tocan. Un índice mapeado NO admite `add`; usar
+`load_index(..., mmap=False)` para obtener una copia modificable.
+
+Con `ids` (rowids de `fts_chunks`) el índice se construye direccionado por
+id: los tipos IVF guardan los ids de forma nativa y el resto se envuelve en
+IndexIDMap2. Así la ingesta incremental puede borrar y agregar chunks
+(`remove_ids` / `add_with_ids`) sin reconstruir; el manifiesto lleva
+`"id_map": true` y la búsqueda devuelve rowids en lugar de posiciones.
+"""
+
+import os
+import json
+import math
+import numpy as np
+import faiss
+from typing import Dict, Optional, Tuple
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "fp16", "pq")
+
+DEFAULT_PARAMS = {
+    "hnsw": {"M": 32, "ef_construction": 200, "ef_search": 64},
+    "ivf_flat": {"nlist": None, "nprobe": None},
+    "ivf_pq": {"nlist": None, "nprobe": None, "pq_m": None, "pq_nbits": 8},
+    "pq": {"pq_m": None, "pq_nbits": 8},
+}
+
+# Tipos que se pueden crear vacíos y crecer con add() (sin entrenamiento)
+TRAINLESS_TYPES = ("flat", "fp16")
+
+# Tipos que admiten borrar vectores por id (HNSW no implementa remove_ids)
+ID_MAP_TYPES = ("flat", "ivf_flat", "ivf_pq", "sq8", "fp16", "pq")
+
+
+def manifest_path(index_path: str) -> str:
+    """Ruta del manifiesto que acompaña al índice"""
+    return os.path.splitext(index_path)[0] + ".json"
+
+
+def _default_nlist(n: int) -> int:
+    # ~4·sqrt(n) listas, con al menos 39 vectores de entrenamiento por lista
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def _default_pq_m(d: int) -> int:
+    # Subcuantizadores de ~8 dimensiones que dividan exactamente a d
+    for m in (d // 8, d // 12, d // 16, d // 4):
+        if m > 0 and d % m == 0:
+            return m
+    return 1
+
+
+def build_index(X: np.ndarray, index_type: str = "flat", ids: Optional[np.ndarray] = None,
+                **params) -> Tuple[faiss.Index, Dict]:
+    """
+    Construir (y entrenar si aplica) un índice de producto interno
+
+    Args:
+        X: Embeddings normalizados (n x d, float32)
+        index_type: Uno de INDEX_TYPES
+        ids: Ids int64 de cada vector (índice direccionado por id, ver ID_MAP_TYPES)
+        **params: Parámetros que sobrescriben DEFAULT_PARAMS
+
+    Returns:
+        Tuple de (índice con los vectores agregados, manifiesto)
+    """
+    index_type = (index_type or "flat").lower()
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconocido: {index_type}. Opciones: {', '.join(INDEX_TYPES)}")
+    if ids is not None and index_type not in ID_MAP_TYPES:
+        raise ValueError(f"{index_type} no admite borrar por id. Opciones: {', '.join(ID_MAP_TYPES)}")
+
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n, d_in = X.shape
+    p = dict(DEFAULT_PARAMS.get(index_type, {}))
+    p.update({k: v for k, v in params.items() if v is not None})
+    pca_dim = int(p.pop("pca_dim", 0) or 0)
+    d = pca_dim if 0 < pca_dim < d_in else d_in
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)
+
+    elif index_type in ("sq8", "fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(d, qtype, faiss.METRIC_INNER_PRODUCT)
+
+    elif index_type == "pq":
+        p["pq_m"] = int(p["pq_m"] or _default_pq_m(d))
+        while n < (1 << int(p["pq_nbits"])) * 39 and p["pq_nbits"] > 4:
+            p["pq_nbits"] = int(p["pq_nbits"]) - 1
+        index = faiss.IndexPQ(d, p["pq_m"], int(p["pq_nbits"]), faiss.METRIC_INNER_PRODUCT)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, int(p["M"]), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = int(p["ef_construction"])
+
+    else:
+        p["nlist"] = int(p["nlist"] or _default_nlist(n))
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf_pq":
+            p["pq_m"] = int(p["pq_m"] or _default_pq_m(d))
+            # PQ necesita al menos 2^nbits puntos de entrenamiento
+            while n < (1 << int(p["pq_nbits"])) and p["pq_nbits"] > 4:
+                p["pq_nbits"] = int(p["pq_nbits"]) - 1
+            index = faiss.IndexIVFPQ(quantizer, d, p["nlist"], p["pq_m"], int(p["pq_nbits"]),
+                                     faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, d, p["nlist"], faiss.METRIC_INNER_PRODUCT)
+        p["nprobe"] = int(p["nprobe"] or min(p["nlist"], max(4, p["nlist"] // 8)))
+
+    if d != d_in:
+        # PCA delante del índice (proyecta también las consultas). Se descarta el
+        # centrado (b = -A·media): restar la media altera el orden por producto interno
+        pca = faiss.PCAMatrix(d_in, d)
+        pca.train(X)
+        faiss.copy_array_to_vector(np.zeros(d, dtype=np.float32), pca.b)
+        # La proyección acorta los vectores de forma desigual: se re-normalizan para que
+        # el producto interno siga siendo un coseno en [-1, 1], comparable con el FTS
+        index = faiss.IndexPreTransform(faiss.NormalizationTransform(d, 2.0), index)
+        index.prepend_transform(pca)
+        p["pca_dim"] = d
+    if not index.is_trained:
+        index.train(X)
+
+    if ids is None:
+        index.add(X)
+    else:
+        if not index_type.startswith("ivf"):
+            # IVF guarda ids en sus listas; los índices de códigos planos necesitan el mapa
+            index = faiss.IndexIDMap2(index)
+        index.add_with_ids(X, np.ascontiguousarray(ids, dtype=np.int64))
+    manifest = {"index_type": index_type, "dimension": d_in, "ntotal": int(index.ntotal),
+                "metric": "inner_product", "params": p, "id_map": ids is not None,
+                "bytes_per_vector": _bytes_per_vector(index_type, d, p)}
+    apply_search_params(index, manifest)
+    return index, manifest
+
+
+def _bytes_per_vector(index_type: str, d: int, p: Dict) -> float:
+    """Bytes de los códigos por vector (sin listas/grafo), para comparar compresión"""
+    if index_type in ("pq", "ivf_pq"):
+        return p["pq_m"] * int(p["pq_nbits"]) / 8
+    if index_type == "sq8":
+        return float(d)
+    if index_type == "fp16":
+        return 2.0 * d
+    return 4.0 * d
+
+
+def empty_index(d: int, index_type: str = "flat") -> faiss.Index:
+    """Índice vacío de producto interno que crece con add() (solo TRAINLESS_TYPES)"""
+    if index_type == "fp16":
+        return faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    if index_type != "flat":
+        raise ValueError(f"{index_type} requiere entrenamiento; opciones sin entrenar: {', '.join(TRAINLESS_TYPES)}")
+    return faiss.IndexFlatIP(d)
+
+
+def update_ids(index: faiss.Index, remove: np.ndarray, X: Optional[np.ndarray] = None,
+               add: Optional[np.ndarray] = None) -> int:
+    """
+    Borrar y agregar vectores por id en un índice construido con `ids` (no mapeado).
+    Retorna cuántos vectores se borraron.
+    """
+    removed = 0
+    if len(remove):
+        removed = int(index.remove_ids(faiss.IDSelectorBatch(np.ascontiguousarray(remove, dtype=np.int64))))
+    if X is not None and len(X):
+        index.add_with_ids(np.ascontiguousarray(X, dtype=np.float32), np.ascontiguousarray(add, dtype=np.int64))
+    return removed
+
+
+def encode_vector_blob(vec: np.ndarray, dtype: str = "float16") -> bytes:
+    """Serializar un embedding para SQLite (float16 ocupa la mitad que float32)"""
+    return np.asarray(vec, dtype=dtype).tobytes()
+
+
+def decode_vector_blob(blob: bytes, dim: int) -> np.ndarray:
+    """Leer un embedding guardado como float16 o float32 (se distingue por el largo)"""
+    dtype = np.float16 if len(blob) == dim * 2 else np.float32
+    return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+
+def apply_search_params(index: faiss.Index, manifest: Optional[Dict],
+                        nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Dict:
+    """
+    Aplicar parámetros de búsqueda (nprobe / efSearch) al índice cargado.
+    Los argumentos explícitos tienen prioridad sobre el manifiesto.
+    """
+    params = dict((manifest or {}).get("params", {}))
+    if nprobe:
+        params["nprobe"] = int(nprobe)
+    if ef_search:
+        params["ef_search"] = int(ef_search)
+
+    base = faiss.downcast_index(index)
+    if hasattr(base, "index") and not hasattr(base, "nprobe") and not hasattr(base, "hnsw"):
+        base = faiss.downcast_index(base.index)  # IndexIDMap / IndexPreTransform
+    if hasattr(base, "nprobe") and params.get("nprobe"):
+        base.nprobe = int(params["nprobe"])
+    if hasattr(base, "hnsw") and params.get("ef_search"):
+        base.hnsw.efSearch = int(params["ef_search"])
+    return params
+
+
+def _mmap_flags() -> list:
+    # IO_FLAG_MMAP_IFC (FAISS >= 1.10) mapea los códigos flat/SQ/PQ/HNSW;
+    # IO_FLAG_MMAP solo mapea listas invertidas (IVF)
+    flags = []
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC") and _faiss_version() >= (1, 10):
+        flags.append(faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+    flags.append(faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    return flags
+
+
+def _faiss_version() -> Tuple[int, ...]:
+    parts = []
+    for part in getattr(faiss, "__version__", "0").split(".")[:3]:
+        digits = "".join(ch for ch in part if ch.isdigit())
+        parts.append(int(digits or 0))
+    return tuple(parts)
+
+
+def _is_ivf(index: faiss.Index) -> bool:
+    try:
+        return faiss.extract_index_ivf(index) is not None
+    except RuntimeError:
+        return False
+
+
+def _honors_mmap(index: faiss.Index, flags: int) -> bool:
+    """Si FAISS realmente mapeó el índice leído con `flags` (el resto se lee a RAM sin avisar)"""
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC") and flags & faiss.IO_FLAG_MMAP_IFC:
+        return not _is_ivf(index)
+    return _is_ivf(index)
+
+
+def load_index(index_path: str, mmap: bool = True) -> Tuple[faiss.Index, bool]:
+    """
+    Cargar índice FAISS, mapeado en memoria si es posible
+
+    Returns:
+        Tuple de (índice, True si quedó mapeado y es de solo lectura). Un tipo que la
+        versión de FAISS no mapea (flat/HNSW antes de 1.10) se lee a RAM y retorna False
+    """
+    if mmap:
+        loaded = None
+        for flags in _mmap_flags():
+            try:
+                index = faiss.read_index(index_path, flags)
+            except RuntimeError:
+                continue
+            if _honors_mmap(index, flags):
+                return index, True
+            loaded = loaded or index
+        if loaded is not None:
+            return loaded, False
+    return faiss.read_index(index_path), False
+
+
+def save_index_atomic(index: faiss.Index, index_path: str):
+    """
+    Escribir a un temporal y renombrar: los procesos que tienen el archivo
+    anterior mapeado siguen leyendo el inode viejo sin ver escrituras parciales
+    """
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    tmp = f"{index_path}.tmp.{os.getpid()}"
+    faiss.write_index(index, tmp)
+    os.replace(tmp, index_path)
+
+
+def write_index(index: faiss.Index, index_path: str, manifest: Optional[Dict] = None):
+    """Guardar índice y su manifiesto"""
+    save_index_atomic(index, index_path)
+    manifest = dict(manifest or {"index_type": "flat", "dimension": index.d, "params": {}})
+    manifest["ntotal"] = int(index.ntotal)
+    with open(manifest_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def read_manifest(index_path: str) -> Dict:
+    """Leer manifiesto del índice; índices antiguos sin manifiesto son `flat`"""
+    try:
+        with open(manifest_path(index_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"index_type": "flat", "params": {}}
+
+
+def selector_search_params(index: faiss.Index, params: Dict, ids: np.ndarray) -> faiss.SearchParameters:
+    """
+    Parámetros de búsqueda con IDSelector: FAISS solo evalúa los ids dados.
+    Se conserva nprobe/efSearch del índice (los SearchParameters no los heredan).
+    """
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype=np.int64))
+    base = faiss.downcast_index(index)
+    if hasattr(base, "index") and not hasattr(base, "nprobe") and not hasattr(base, "hnsw"):
+        base = faiss.downcast_index(base.index)
+    if hasattr(base, "nprobe"):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=int(params.get("nprobe") or base.nprobe))
+    if hasattr(base, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=int(params.get("ef_search") or base.hnsw.efSearch))
+    return faiss.SearchParameters(sel=sel)
@@ -2,12 +2,16 @@ from typing import Dict, List
 from openai import AzureOpenAI
 from .config import (
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_API_VERSION, 
-    AZURE_OPENAI_DEPLOYMENT_NAME
+    AZURE_OPENAI_DEPLOYMENT_NAME, CONTEXT_TOKEN_BUDGET
 )
 from .prompts import SYSTEM_RAG, USER_TEMPLATE
 from .retrieve import HybridRetriever
 from .semantic_memory import SemanticMemory
 from .db import get_conn
+from .tokenizer import count_tokens, truncate_to_tokens
+
+# Un chunk que no cabe entero se recorta solo si quedan al menos estos tokens
+MIN_PARTIAL_TOKENS = 64
 
 class AnswerEngine:
     def __init__(self, retriever: HybridRetriever, use_semantic_memory: bool = True):
@@ -44,15 +48,35 @@ class AnswerEngine:
             azure_endpoint=AZURE_OPENAI_ENDPOINT
         )
 
-    def format_context(self, items: List[Dict]) -> str:
-        lines = []
+    def format_context(self, items: List[Dict], max_tokens: int = CONTEXT_TOKEN_BUDGET) -> str:
+        """
+        Contexto numerado dentro de un presupuesto de tokens, en orden de ranking.
+        Usa el `n_tokens` precalculado en la ingesta; solo se tokeniza el texto
+        que no lo trae (fragmentos por cita, resultados sin metadatos) y el
+        último chunk, si hay que recortarlo.
+        """
+        lines, used = [], 0
         for i, it in enumerate(items, 1):
             cite = it.get("heading_path") or it.get("doc_id", "")
             pg = ""
             ps, pe = it.get("page_start"), it.get("page_end")
             if ps or pe:
                 pg = f", págs. {ps or ''}-{pe or ''}"
-            lines.append(f"[{i}] ({cite}{pg})\n{it.get('text','')[:1800]}")
+            # Near-duplicados colapsados en la ingesta: el mismo pasaje en otros documentos
+            also = sorted({a["doc_id"] for a in it.get("aliases") or []} - {it.get("doc_id")})
+            if also:
+                pg += f"; también en {', '.join(also[:3])}" + (" …" if len(also) > 3 else "")
+            header = f"[{i}] ({cite}{pg})\n"
+            text = it.get("text", "")
+            header_tokens = count_tokens(header) + 2          # + separador "\n\n"
+            text_tokens = (None if it.get("offsets") else it.get("n_tokens")) or count_tokens(text)
+            if used + header_tokens + text_tokens > max_tokens:
+                room = max_tokens - used - header_tokens
+                if room >= MIN_PARTIAL_TOKENS:
+                    lines.append(header + truncate_to_tokens(text, room))
+                break
+            lines.append(header + text)
+            used += header_tokens + text_tokens
         return "\n\n".join(lines)
 
     def answer(self, query: str, k=6, conversation_id: str = None) -> Dict:
@@ -120,7 +144,7 @@ class AnswerEngine:
             
             # Consolidar memorias periódicamente (cada 10 interacciones)
             try:
-                with get_conn(self.semantic_memory.memory_db_path) as conn:
+                with get_conn(self.semantic_memory.memory_db_path, readonly=True) as conn:
                     cursor = conn.execute("SELECT COUNT(*) FROM conversation_memories")
                     count = cursor.fetchone()[0]
                     if count % 10 == 0:  # Cada 10 memorias
@@ -1,13 +1,21 @@
-import os, glob, uuid, json, argparse, numpy as np
+import os, glob, json, argparse, numpy as np
 from tqdm import tqdm
 from openai import AzureOpenAI
 import faiss
 from .config import (
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH, FAISS_PATH
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH, FAISS_PATH, FAISS_INDEX_TYPE, FAISS_PCA_DIM,
+    CHUNK_EMBED_STORE_DIR, DEDUP_THRESHOLD, INDEX_SNAPSHOT_DIR
 )
-from .db import get_conn, upsert_chunk
-from chunker import split_into_blocks, guess_metadata_from_text
+from .db import (
+    get_conn, bulk_build, bulk_insert, bulk_upsert_chunks, fts_defer_merges, fts_optimize, next_rowid, reserve_rowids
+)
+from .ann_index import INDEX_TYPES, build_index, manifest_path, write_index
+from .citations import CITATION_SCHEMA, build_citation_index
+from .term_index import TERM_SCHEMA, build_term_index
+from .embedding_store import ChunkEmbeddingStore
+from .index_snapshots import SnapshotManager
+from .dedup import DEDUP_SCHEMA, NearDuplicateIndex, minhash
 
 os.makedirs(os.path.dirname(FAISS_PATH), exist_ok=True)
 
@@ -18,7 +26,7 @@ client = AzureOpenAI(
     api_version=AZURE_OPENAI_API_VERSION
 ) if AZURE_OPENAI_KEY else None
 
-def embed_texts(texts):
+def _embed_api(texts):
     # Llamada batcheada
     embs = []
     B = 64
@@ -28,48 +36,142 @@ def embed_texts(texts):
         embs.extend([d.embedding for d in resp.data])
     return np.array(embs, dtype="float32")
 
-def main(data_dir):
+def embed_texts(texts, store_dir=CHUNK_EMBED_STORE_DIR, store=None):
+    # Solo se pagan a la API los chunks cuyo hash no está en el almacén.
+    # Con varios hilos, compartir un mismo `store` (serializa las escrituras)
+    if store is None and store_dir:
+        store = ChunkEmbeddingStore(store_dir, AZURE_OPENAI_EMBEDDING_DEPLOYMENT)
+    if store is None:
+        return _embed_api(texts)
+    return store.embed(texts, _embed_api, batch_size=256)
+
+def load_chunks(con, chunks, aliases=()):
+    """
+    Carga masiva en fts_chunks/chunks_meta (mismo esquema que la ingesta,
+    executemany, sin merges FTS5 hasta el final), firmas MinHash y alias de
+    near-duplicados (`canonical` = posición en `chunks`), y reconstrucción de
+    los índices de citas y de términos. Retorna el rowid del primer chunk.
+    """
+    from .ingest import INGEST_SCHEMA, _insert_aliases
+    con.executescript(INGEST_SCHEMA + CITATION_SCHEMA + TERM_SCHEMA + DEDUP_SCHEMA)
+    # Reconstrucción completa: bulk_build parte de una copia de la BD publicada,
+    # así que los chunks anteriores se vacían (sus rowids no se reutilizan)
+    first_rowid = next_rowid(con)
+    for table in ("fts_chunks", "chunks_meta", "citation_index", "term_index", "ingest_files",
+                  "chunk_minhash", "chunk_aliases"):
+        con.execute(f"DELETE FROM {table}")
+    fts_defer_merges(con)
+    total = bulk_upsert_chunks(con, tqdm(chunks, desc="Carga SQLite"), first_rowid)
+    reserve_rowids(con, first_rowid + total)
+    bulk_insert(con, "INSERT INTO chunk_minhash(chunk_id, sig) VALUES(?, ?)",
+                ((rowid, c["minhash"].tobytes()) for rowid, c in enumerate(chunks, first_rowid)
+                 if c.get("minhash") is not None))
+    _insert_aliases(con, list(aliases), lambda pos: first_rowid + pos)
+    fts_optimize(con)
+    print(f"🗄️ SQLite: {total} chunks cargados")
+
+    # Índice de citas exactas (Regla/Sección -> chunk + offsets) sobre fts_chunks
+    print(f"📑 Índice de citas: {build_citation_index(con)} encabezados")
+    # Sin try: con TERM_LOOKUP activo, una tabla vacía dejaría las consultas por
+    # código sin resultados (ya no hay fallback LIKE); la carga falla y no se publica
+    print(f"🏷️ Índice de códigos/términos: {build_term_index(con)} entradas")
+    return first_rowid
+
+def refuse_if_snapshots(snapshot_dir=INDEX_SNAPSHOT_DIR):
+    """
+    Con un snapshot publicado (CURRENT), HybridRetriever ignora FAISS_PATH y
+    metas.jsonl: escribirlos no cambiaría nada. Reconstruir con la ingesta.
+    """
+    version = SnapshotManager(snapshot_dir).current_version()
+    if version is not None:
+        raise RuntimeError(f"Hay un snapshot publicado ({version} en {snapshot_dir}); el índice de FAISS_PATH "
+                           f"no se usaría. Reconstruir con: python -m ai_system.ingest --data_dir <dir> --full")
+
+def main(data_dir, index_type=FAISS_INDEX_TYPE, out_index=FAISS_PATH, db_path=DB_PATH,
+         embed_store=CHUNK_EMBED_STORE_DIR, in_place=False, snapshot_dir=INDEX_SNAPSHOT_DIR, **index_params):
+    # Índice "legacy" (FAISS_PATH + metas.jsonl): solo para instalaciones sin snapshots
+    refuse_if_snapshots(snapshot_dir)
+    from .ingest import iter_chunks
     txt_files = sorted(glob.glob(os.path.join(data_dir, "*.txt")))
-    all_texts, metas = [], []
+    chunks, aliases = [], []
+    # Near-duplicados: no se embeben; quedan en chunk_aliases apuntando al primer chunk con ese pasaje
+    lsh = NearDuplicateIndex(DEDUP_THRESHOLD) if DEDUP_THRESHOLD > 0 else None
     for path in txt_files:
-        doc_id = os.path.basename(path)
-        with open(path, "r", encoding="utf-8", errors="ignore") as f:
-            raw = f.read()
-        blocks = split_into_blocks(raw, max_chars=4000, overlap=600)
-        for b in blocks:
-            md = guess_metadata_from_text(b)
-            metas.append({
-                "chunk_id": str(uuid.uuid4()),
-                "doc_id": doc_id,
-                "page_start": None,
-                "page_end": None,
-                "heading_path": md.get("heading_path", "")
-            })
-            all_texts.append(b)
+        # Lectura en streaming; mismos chunks y columnas que la ingesta
+        # (alineados a TOMO/CAPÍTULO/REGLA, de hasta CHUNK_TOKENS)
+        for chunk in iter_chunks(path):
+            sig = minhash(chunk["text"]) if lsh is not None else None
+            hit = lsh.query(sig) if sig is not None else None
+            if hit:
+                chunk["canonical"], chunk["similarity"] = hit
+                aliases.append({k: v for k, v in chunk.items() if k != "text"})
+                continue
+            if sig is not None:
+                chunk["minhash"] = sig
+                lsh.add(len(chunks), sig)
+            chunks.append(chunk)
+    if aliases:
+        print(f"🧬 {len(aliases)} chunks near-duplicados colapsados en su canónico")
 
     # Embeddings
-    X = embed_texts(all_texts)
+    X = embed_texts([c["text"] for c in chunks], store_dir=embed_store)
     faiss.normalize_L2(X)
-    index = faiss.IndexFlatIP(X.shape[1])
-    index.add(X)
-    faiss.write_index(index, FAISS_PATH)
+    index_params.setdefault("pca_dim", FAISS_PCA_DIM)
+    index, manifest = build_index(X, index_type, **index_params)
+    # Índice y metas.jsonl a rutas temporales: se publican solo si la carga de la BD
+    # termina bien, para que índice, metas y fts_chunks nunca queden desalineados
+    metas_path = os.path.join(os.path.dirname(out_index), "metas.jsonl")
+    tmp_index, tmp_metas = f"{out_index}.tmp", f"{metas_path}.tmp"
+    try:
+        write_index(index, tmp_index, manifest)
 
-    # SQLite FTS + metadatos
-    with get_conn(DB_PATH) as con:
-        for t, m in tqdm(zip(all_texts, metas), total=len(all_texts), desc="Upsert SQLite"):
-            upsert_chunk(con, m["chunk_id"], m["doc_id"], m["page_start"], m["page_end"], m["heading_path"], t)
+        # SQLite FTS + metadatos + índices de citas/términos, en carga masiva
+        if in_place:
+            with get_conn(db_path) as con:
+                first_rowid = load_chunks(con, chunks, aliases)
+        else:
+            # Se construye en una BD temporal y se publica con un rename atómico
+            with bulk_build(db_path) as con:
+                first_rowid = load_chunks(con, chunks, aliases)
 
-    # Guarda espejo de metadatos para mapear FAISS -> chunk_id
-    with open(os.path.join(os.path.dirname(FAISS_PATH), "metas.jsonl"), "w", encoding="utf-8") as out:
-        for m in metas:
-            out.write(json.dumps(m, ensure_ascii=False) + "\n")
+        # Espejo de metadatos para mapear FAISS (posición) -> rowid de fts_chunks
+        with open(tmp_metas, "w", encoding="utf-8") as out:
+            for rowid, c in enumerate(chunks, first_rowid):
+                meta = {"rowid": rowid, "chunk_id": str(rowid), **{k: v for k, v in c.items() if k not in ("text", "minhash")}}
+                out.write(json.dumps(meta, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_metas, metas_path)
+        os.replace(manifest_path(tmp_index), manifest_path(out_index))
+        os.replace(tmp_index, out_index)
+    finally:
+        for path in (tmp_index, manifest_path(tmp_index), tmp_metas):
+            if os.path.exists(path):
+                os.remove(path)
 
-    print("✅ Índice construido:", FAISS_PATH)
+    print(f"✅ Índice {manifest['index_type']} construido:", out_index)
 
 if __name__ == "__main__":
-    ap = argparse.ArgumentParser()
+    ap = argparse.ArgumentParser(
+        description="Índice completo en FAISS_PATH + metas.jsonl (sin snapshots). Si ya hay un snapshot "
+                    "publicado (CURRENT en --snapshot_dir) se niega a correr: usar python -m ai_system.ingest --full")
     ap.add_argument("--data_dir", required=True)
     ap.add_argument("--out_index", default=FAISS_PATH)
     ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--snapshot_dir", default=INDEX_SNAPSHOT_DIR,
+                    help="Si aquí hay un snapshot publicado, este script no corre (el retriever lo ignoraría)")
+    ap.add_argument("--embed_store", default=CHUNK_EMBED_STORE_DIR,
+                    help="Almacén de embeddings por hash de contenido (vacío = re-embeber todo)")
+    ap.add_argument("--in_place", action="store_true",
+                    help="Escribir directo en la BD publicada en vez de construir una temporal y renombrarla")
+    ap.add_argument("--index_type", default=FAISS_INDEX_TYPE, choices=INDEX_TYPES)
+    ap.add_argument("--nlist", type=int, help="IVF: número de listas")
+    ap.add_argument("--nprobe", type=int, help="IVF: listas visitadas por búsqueda")
+    ap.add_argument("--hnsw_m", type=int, help="HNSW: vecinos por nodo")
+    ap.add_argument("--ef_search", type=int, help="HNSW: efSearch")
+    ap.add_argument("--pq_m", type=int, help="PQ / IVF-PQ: subcuantizadores")
+    ap.add_argument("--pca_dim", type=int, default=FAISS_PCA_DIM, help="Reducir dimensiones con PCA (0 = no)")
     args = ap.parse_args()
-    main(args.data_dir)
+    main(args.data_dir, args.index_type, out_index=args.out_index, db_path=args.db,
+         embed_store=args.embed_store, in_place=args.in_place, snapshot_dir=args.snapshot_dir, nlist=args.nlist, nprobe=args.nprobe,
+         M=args.hnsw_m, ef_search=args.ef_search, pq_m=args.pq_m, pca_dim=args.pca_dim)
@@ -1,5 +1,260 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterable, Iterator, NamedTuple, Optional, Callable
 import re
+from .config import CHUNK_TOKENS, CHUNK_OVERLAP
+from .query_filters import canonical_value
+
+
+class Block(NamedTuple):
+    text: str
+    start: int  # offset (caracteres) en el texto fuente
+    end: int
+
+
+def iter_blocks(lines: Iterable[str], max_chars: int = 4000, overlap: int = 600) -> Iterator[Block]:
+    """
+    Versión en streaming de split_into_blocks: consume líneas (p. ej. un archivo
+    abierto) y produce cada bloque con sus offsets en cuanto se completa.
+
+    Mismos bloques que split_into_blocks: párrafos separados por líneas en
+    blanco, agrupados hasta max_chars; un párrafo más largo va solo y se corta
+    con solapamiento a medida que se lee. La memoria queda acotada por un
+    bloque, no por el archivo.
+    """
+    step = max(1, max_chars - overlap)
+    buf, buf_start, buf_end = "", 0, 0                 # bloque en armado (párrafos unidos con \n\n)
+    para, para_start, para_end = "", 0, 0              # párrafo actual (texto idéntico a la fuente)
+    in_para = cutting = False                          # cutting: el párrafo superó max_chars
+    pos = 0
+
+    def end_para():
+        nonlocal buf, buf_start, buf_end, para, in_para, cutting
+        if cutting:
+            i = 0
+            while i < len(para):
+                yield Block(para[i:i + max_chars], para_start + i, para_start + min(len(para), i + max_chars))
+                i += step
+        elif buf and len(buf) + len(para) + 2 <= max_chars:
+            buf, buf_end = buf + "\n\n" + para, para_end
+        else:
+            if buf:
+                yield Block(buf, buf_start, buf_end)
+            buf, buf_start, buf_end = para, para_start, para_end
+        para, in_para, cutting = "", False, False
+
+    for line in lines:
+        content = line.rstrip("\n")
+        if not content.strip():
+            if in_para:
+                yield from end_para()
+            pos += len(line)
+            continue
+        if in_para:
+            para += "\n" + content
+        else:
+            para, para_start, in_para = content, pos, True
+        para_end = pos + len(content)
+        pos += len(line)
+
+        if not cutting and len(para) > max_chars:
+            cutting = True
+            if buf:
+                yield Block(buf, buf_start, buf_end)
+                buf = ""
+        while cutting and len(para) >= max_chars:
+            yield Block(para[:max_chars], para_start, para_start + max_chars)
+            para, para_start = para[step:], para_start + step
+
+    if in_para:
+        yield from end_para()
+    if buf:
+        yield Block(buf, buf_start, buf_end)
+
+
+def iter_file_blocks(path: str, max_chars: int = 4000, overlap: int = 600) -> Iterator[Block]:
+    """Bloques de un archivo leído línea a línea (sin cargarlo completo)"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        yield from iter_blocks(f, max_chars=max_chars, overlap=overlap)
+
+
+# ----------------------------------------------------------------------
+# Chunker estructural: TOMO > CAPÍTULO > REGLA/ARTÍCULO > SECCIÓN en una pasada
+# ----------------------------------------------------------------------
+CHUNKER_VERSION = "legal-2"
+# El número va entero: sin `(?!\.?\d)` el regex retrocede a un prefijo ("6.1" de "6.1.2")
+# que sí pasa la comprobación de prosa
+_NUM = r"(?:\d+(?:\.\d+)*(?!\.?\d)|[IVXLC]+)\b"
+# "Regla 2.1.19 del Capítulo..." al inicio de línea es una referencia, no un encabezado
+_NOT_PROSE = r"(?![ \t]+[a-zß-ÿ])"
+# Una sola gramática compilada; se prueba una vez al inicio de cada línea/segmento
+_LEGAL_LINE = re.compile(
+    r"^[ \t]*(?:"
+    r"(?P<pagina>TOMO[ \t]*" + _NUM + r"[ \t]*-[ \t]*P[ÁA]GINA[ \t]+(?P<pagina_n>\d+))"
+    r"|(?P<tomo>TOMO)[ \t]*(?P<tomo_n>" + _NUM + r")"
+    r"|(?P<capitulo>CAP[ÍI]TULO|Cap[íi]tulo)[ \t]+(?P<capitulo_n>" + _NUM + r")" + _NOT_PROSE +
+    r"|(?P<articulo>REGLA|ART[ÍI]CULO|Regla|Art[íi]culo)[ \t]+(?P<articulo_n>" + _NUM + r")" + _NOT_PROSE +
+    r"|(?P<seccion>SECCI[ÓO]N|Secci[óo]n)[ \t]+(?P<seccion_n>" + _NUM + r")" + _NOT_PROSE +
+    r")")
+_INLINE_HEADING = re.compile(r"(?<=[\s.])(?:CAP[ÍI]TULO|REGLA|ART[ÍI]CULO|SECCI[ÓO]N)[ \t]+" + _NUM)
+_BODY_TEXT = re.compile(r"[a-zß-ÿ]{3}")          # texto corrido (los encabezados van en mayúsculas)
+_HEADING_MAX_CHARS = 200
+_LEVELS = ("tomo", "capitulo", "articulo", "seccion")
+
+
+class LegalChunk(NamedTuple):
+    text: str
+    start: int                  # offsets en el texto fuente: text == fuente[start:end]
+    end: int
+    tomo: Optional[str]         # número canónico ('10')
+    capitulo: Optional[str]     # '8.5'
+    articulo: Optional[str]     # número de la Regla/Artículo ('10.1.5')
+    seccion: Optional[str]
+    heading_path: str           # 'TOMO 10 > CAPÍTULO 8.5 ... > REGLA 10.1.5 ...'
+    page_start: Optional[int]
+    page_end: Optional[int]
+    n_tokens: int               # tokens del texto según count_tokens
+
+
+def approx_tokens(text: str) -> int:
+    """Estimación rápida (~4 caracteres por token)"""
+    return (len(text) + 3) // 4
+
+
+def _heading_title(segment: str, number_end: int) -> str:
+    # Título = encabezado + texto siguiente hasta la primera minúscula (en OCR el cuerpo sigue en la misma línea)
+    title = segment[:number_end] + re.match(r"[^a-zß-ÿ\n]*", segment[number_end:]).group()
+    title = " ".join(title.split())
+    return re.sub(r"[\s|_.:,;(-]+$", "", title)[:120]
+
+
+def _segments(line: str, pos: int) -> Iterator[Tuple[int, str]]:
+    """
+    (offset, texto) de una línea. Las líneas largas (páginas OCR en una sola
+    línea) se parten donde empieza un encabezado en mayúsculas
+    """
+    if len(line) <= _HEADING_MAX_CHARS:
+        yield pos, line
+        return
+    last = 0
+    for m in _INLINE_HEADING.finditer(line, 1):
+        yield pos + last, line[last:m.start()]
+        last = m.start()
+    yield pos + last, line[last:]
+
+
+def iter_legal_chunks(lines: Iterable[str], max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP,
+                      count_tokens: Callable[[str], int] = approx_tokens) -> Iterator[LegalChunk]:
+    """
+    Chunks alineados a la estructura del reglamento, en una sola pasada.
+
+    Mientras recorre las líneas lleva el tomo, capítulo, regla/artículo y
+    sección vigentes (y la página de los marcadores "TOMO n - PÁGINA m"):
+    - un encabezado de TOMO (nuevo), CAPÍTULO o REGLA/ARTÍCULO cierra el chunk
+      (salvo que el chunk aún no tenga texto, p. ej. CAPÍTULO seguido de REGLA);
+      las SECCIONES no, solo actualizan la ruta
+    - una regla que supera max_tokens se parte por líneas y el siguiente trozo
+      repite las últimas líneas del anterior hasta `overlap` tokens
+    - los tokens se miden con `count_tokens` (ver tokenizer.count_tokens) y
+      cada chunk lleva su conteo exacto en n_tokens
+    - el texto de cada chunk es un segmento contiguo de la fuente
+    """
+    budget = max(1, max_tokens)
+    state = dict.fromkeys(_LEVELS)         # nivel -> (número, título)
+    page = None
+    pieces: List[Tuple] = []               # (texto, inicio, fin, tokens, página, sección vigente)
+    chunk_state, chunk_tokens = dict(state), 0
+    body = False                           # el chunk ya tiene texto además de encabezados
+    pos = 0
+
+    def emit():
+        filled = [p for p in pieces if p[0].strip()]
+        if not filled:
+            return None
+        first, last = filled[0], filled[-1]
+        text = "".join(p[0] for p in pieces).rstrip()
+        # Sección: la vigente en el primer renglón con texto (o la primera que aparezca)
+        headings = dict(chunk_state, seccion=next((p[5] for p in filled if p[5]), None))
+        path = [headings[level][1] for level in _LEVELS if headings[level]]
+        return LegalChunk(text, first[1], first[1] + len(text),
+                          *(headings[level][0] if headings[level] else None for level in _LEVELS),
+                          " > ".join(path), first[4], last[4], count_tokens(text))
+
+    def restart(keep_overlap: bool):
+        nonlocal pieces, chunk_state, chunk_tokens, body
+        tail, tail_tokens = [], 0
+        if keep_overlap:
+            for piece in reversed(pieces):
+                if tail_tokens + piece[3] > overlap:
+                    break
+                tail.insert(0, piece)
+                tail_tokens += piece[3]
+            while tail and not tail[0][0].strip():
+                tail.pop(0)
+        pieces, chunk_tokens = tail, sum(p[3] for p in tail)
+        chunk_state, body = dict(state), bool(tail)
+
+    def split_line(line: str, start: int):
+        # Líneas más largas que el presupuesto (OCR sin saltos): cortes en espacios
+        tokens = count_tokens(line)
+        if tokens <= budget // 2:
+            yield line, start, tokens
+            return
+        size = max(1, len(line) * (budget // 2) // tokens)
+        i = 0
+        while i < len(line):
+            j = min(len(line), i + size)
+            if j < len(line):
+                space = line.rfind(" ", i + 1, j)
+                j = space + 1 if space > i else j
+            yield line[i:j], start + i, count_tokens(line[i:j])
+            i = j
+
+    for line in lines:
+        for seg_start, seg in _segments(line, pos):
+            m = _LEGAL_LINE.match(seg)
+            level = next((g for g in ("pagina",) + _LEVELS if m.group(g)), None) if m else None
+            if level == "pagina":
+                page = int(m.group("pagina_n"))
+            elif level:
+                number = m.group(level + "_n")
+                number = canonical_value("tomo", number) if level == "tomo" else number.upper()
+                title = f"TOMO {number}" if level == "tomo" else _heading_title(seg, m.end())
+                if not (level == "tomo" and state["tomo"] and state["tomo"][0] == number):
+                    state[level] = (number, title)
+                    for lower in _LEVELS[_LEVELS.index(level) + 1:]:
+                        state[lower] = None
+                    if not body or (level == "tomo" and not chunk_state["tomo"]):
+                        # Encabezados seguidos (o la portada antes del primer TOMO): mismo chunk
+                        chunk_state = dict(state)
+                    elif level != "seccion":
+                        chunk = emit()
+                        if chunk:
+                            yield chunk
+                        restart(keep_overlap=False)
+
+            if not pieces and not seg.strip():
+                continue
+            for text, piece_start, tokens in split_line(seg, seg_start):
+                if chunk_tokens + tokens > budget and any(p[3] for p in pieces):
+                    chunk = emit()
+                    if chunk:
+                        yield chunk
+                    restart(keep_overlap=True)
+                pieces.append((text, piece_start, piece_start + len(text), tokens, page, state["seccion"]))
+                chunk_tokens += tokens
+            body = body or bool(_BODY_TEXT.search(seg, m.end() if level else 0))
+        pos += len(line)
+
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def iter_file_legal_chunks(path: str, max_tokens: int = CHUNK_TOKENS, overlap: int = CHUNK_OVERLAP,
+                           count_tokens: Callable[[str], int] = approx_tokens) -> Iterator[LegalChunk]:
+    """Chunks estructurales de un archivo leído línea a línea"""
+    with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
+        yield from iter_legal_chunks(f, max_tokens=max_tokens, overlap=overlap, count_tokens=count_tokens)
+
 
 def split_into_blocks(text: str, max_chars: int = 4000, overlap: int = 600) -> List[str]:
     # Split por dobles saltos + párrafos; si muy largos, corta por oraciones.
@@ -0,0 +1,200 @@
+"""
+Índice de citas exactas (Capítulo / Regla / Sección / Artículo)
+================================================================
+
+Los reglamentos numeran sus encabezados de forma jerárquica
+(CAPÍTULO 10.1 > REGLA 10.1.5 > SECCIÓN 10.1.5.1). En la ingesta se
+registra cada encabezado en la tabla `citation_index`:
+
+    kind, number, tomo, chunk_id (rowid en fts_chunks), start, end
+
+`start`/`end` son offsets (caracteres) dentro de `content`: desde el
+encabezado hasta el siguiente de igual o mayor jerarquía en el mismo chunk.
+
+En el request, `parse_citations` detecta referencias como
+"¿qué dice el Artículo 6.1.2?" o "Sección 2.3 del Tomo 8" y
+`lookup_citations` busca esos fragmentos. Los que coinciden en tipo (y en
+tomo, si la consulta lo nombra) se sirven directamente, sin embeddings ni
+FTS; los de otro tipo con el mismo número ("Regla 6.1" -> "Capítulo 6.1")
+entran a la fusión como una fuente más.
+"""
+
+import re
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional
+from .db import get_conn, fold_accents
+from .query_filters import canonical_value, parse_query_filters
+
+CITATION_KINDS = ("capitulo", "regla", "seccion", "articulo")
+_LABELS = {"capitulo": "Capítulo", "regla": "Regla", "seccion": "Sección", "articulo": "Artículo"}
+
+_NUMBER = r"(\d+(?:\.\d+)*|[IVXLC]+)\b"
+# Encabezados en el texto: al inicio de línea y en mayúsculas/capitalizados
+_HEADING = re.compile(r"(?m)^[ \t]*(CAP[ÍI]TULO|REGLA|SECCI[ÓO]N|ART[ÍI]CULO|Cap[íi]tulo|Regla|Secci[óo]n|Art[íi]culo)"
+                      r"[ \t]+" + _NUMBER)
+# Referencias en la consulta
+_REFERENCE = re.compile(r"\b(art[ií]culos?|art\.|secci[oó]n(?:es)?|sec\.|§|reglas?|cap[ií]tulos?|cap\.)\s*"
+                        + _NUMBER.replace("[IVXLC]", "[ivxlcIVXLC]"), re.IGNORECASE)
+
+CITATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS citation_index (
+    kind TEXT NOT NULL,          -- capitulo | regla | seccion | articulo
+    number TEXT NOT NULL,        -- '10.1.5.1', 'VI'
+    tomo TEXT,                   -- número de tomo canónico ('10')
+    chunk_id INTEGER NOT NULL,   -- rowid en fts_chunks
+    start INTEGER NOT NULL,      -- offset del encabezado en content
+    end INTEGER NOT NULL         -- offset del siguiente encabezado de igual o mayor nivel
+);
+CREATE INDEX IF NOT EXISTS idx_citation_number ON citation_index(number, kind);
+CREATE INDEX IF NOT EXISTS idx_citation_chunk ON citation_index(chunk_id);
+"""
+
+
+class Citation(NamedTuple):
+    kind: Optional[str]   # None = cualquier tipo con ese número (ningún acierto es exacto)
+    number: str
+    tomo: Optional[str]
+
+    def label(self) -> str:
+        text = f"{_LABELS.get(self.kind, 'Referencia')} {self.number}"
+        return f"{text} (Tomo {self.tomo})" if self.tomo else text
+
+
+def _kind_of(word: str) -> str:
+    word = fold_accents(word).lower().rstrip(".")
+    if word.startswith("art"):
+        return "articulo"
+    if word.startswith("sec") or word == "§":
+        return "seccion"
+    if word.startswith("regla"):
+        return "regla"
+    return "capitulo"
+
+
+def _normalize_number(number: str) -> str:
+    return number.upper() if re.fullmatch(r"[ivxlcIVXLC]+", number) else number
+
+
+def _depth(number: str) -> int:
+    return number.count(".") + 1 if number[0].isdigit() else 1
+
+
+def extract_headings(text: str) -> List[Dict]:
+    """Encabezados citables de un chunk con sus offsets"""
+    found = [{"kind": _kind_of(m.group(1)), "number": _normalize_number(m.group(2)), "start": m.start(1)}
+             for m in _HEADING.finditer(text or "")]
+    for i, h in enumerate(found):
+        depth = _depth(h["number"])
+        h["end"] = next((n["start"] for n in found[i + 1:] if _depth(n["number"]) <= depth), len(text))
+    return found
+
+
+def parse_citations(query: str) -> List[Citation]:
+    """
+    Referencias a encabezados numerados en la consulta
+
+    Capítulos con número simple ("Capítulo 3") se dejan a los filtros de
+    metadatos; aquí solo cuentan numeraciones jerárquicas ("Capítulo 10.2").
+    """
+    tomos = parse_query_filters(query).get("tomo") or [None]
+    citations = []
+    for m in _REFERENCE.finditer(query or ""):
+        kind, number = _kind_of(m.group(1)), _normalize_number(m.group(2))
+        if kind == "capitulo" and "." not in number:
+            continue
+        citations.append(Citation(kind, number, tomos[0]))
+    return citations
+
+
+def index_chunk(con: sqlite3.Connection, chunk_id: int, text: str, tomo: Optional[str]) -> int:
+    """Registrar los encabezados de un chunk (ingesta); retorna cuántos"""
+    tomo = canonical_value("tomo", tomo) if tomo else None
+    headings = extract_headings(text)
+    con.execute("DELETE FROM citation_index WHERE chunk_id = ?", (chunk_id,))
+    con.executemany(
+        "INSERT INTO citation_index(kind, number, tomo, chunk_id, start, end) VALUES(?,?,?,?,?,?)",
+        [(h["kind"], h["number"], tomo, chunk_id, h["start"], h["end"]) for h in headings])
+    return len(headings)
+
+
+def build_citation_index(con: sqlite3.Connection) -> int:
+    """Reconstruir el índice completo desde fts_chunks"""
+    con.executescript(CITATION_SCHEMA)
+    con.execute("DELETE FROM citation_index")
+    total = 0
+    for rowid, content, tomo in con.execute("SELECT rowid, content, tomo FROM fts_chunks").fetchall():
+        total += index_chunk(con, rowid, content, tomo)
+    return total
+
+
+def ensure_citation_index(db_path: str) -> bool:
+    """Crear y poblar el índice si no existe (BD anteriores a esta versión). True si lo construyó."""
+    with get_conn(db_path, readonly=True) as con:
+        exists = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'citation_index'").fetchone()
+        has_fts = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'fts_chunks'").fetchone()
+    if exists or not has_fts:
+        return False
+    with get_conn(db_path) as con:
+        total = build_citation_index(con)
+    print(f"📑 Índice de citas construido: {total} encabezados")
+    return True
+
+
+def lookup_citations(con: sqlite3.Connection, citations: List[Citation], limit: int = 6) -> List[Dict]:
+    """
+    Fragmentos de las citas pedidas, en orden de la consulta
+
+    Si el tipo pedido no existe se acepta cualquier encabezado con ese número
+    ("Artículo 6.1" suele ser la Regla/Sección 6.1); con tomo, "Sección 2.3 del
+    Tomo 8" también prueba la numeración completa 8.2.3. Cada fragmento lleva
+    `exact`: mismo tipo y, si la consulta nombra un tomo, mismo tomo.
+    """
+    results, seen = [], set()
+    for cit in citations:
+        numbers = [cit.number]
+        if cit.tomo and cit.number[0].isdigit() and not cit.number.startswith(f"{cit.tomo}."):
+            numbers.append(f"{cit.tomo}.{cit.number}")
+        rows = []
+        # Primero el tipo pedido con cualquiera de las numeraciones; luego cualquier tipo
+        for number, kind in [(n, k) for k in ([cit.kind, None] if cit.kind else [None]) for n in numbers]:
+            sql = """SELECT c.kind, c.number, c.tomo AS cited_tomo, c.chunk_id, c.start, c.end, f.content,
+                            f.tomo, f.capitulo, f.articulo, f.tipo_seccion, f.fuente
+                     FROM citation_index c JOIN fts_chunks f ON f.rowid = c.chunk_id
+                     WHERE c.number = ?"""
+            params = [number]
+            if kind:
+                sql += " AND c.kind = ?"
+                params.append(kind)
+            if cit.tomo:
+                sql += " AND (c.tomo = ? OR c.tomo IS NULL)"
+                params.append(cit.tomo)
+            # El fragmento más largo primero: el encabezado con su cuerpo, no una mención al pie
+            rows = con.execute(sql + " ORDER BY (c.end - c.start) DESC LIMIT ?", params + [limit]).fetchall()
+            if rows:
+                break
+        for row in rows:
+            key = (row["chunk_id"], row["start"])
+            if key in seen:
+                continue
+            seen.add(key)
+            heading = f"TOMO {row['tomo']}" if row["tomo"] else ""
+            results.append({
+                "chunk_id": str(row["chunk_id"]),
+                "doc_id": row["fuente"] or row["tomo"] or "",
+                "heading_path": f"{heading} > {_LABELS[row['kind']].upper()} {row['number']}".strip(" >"),
+                "text": row["content"][row["start"]:row["end"]],
+                "citation": f"{_LABELS[row['kind']]} {row['number']}",
+                "offsets": (row["start"], row["end"]),
+                "tomo": row["tomo"],
+                "capitulo": row["capitulo"],
+                "tipo_seccion": row["tipo_seccion"],
+                "fuente": row["fuente"],
+                "page_start": None,
+                "page_end": None,
+                "score": 1.0,
+                "search_type": "citation",
+                "exact": row["kind"] == cit.kind and (not cit.tomo or row["cited_tomo"] == cit.tomo),
+            })
+    return results[:limit]
@@ -21,3 +21,77 @@ FAISS_PATH = os.getenv("FAISS_PATH", "database/faiss_index.bin")
 # Chunking
 CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "1000"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+# Tokenizer local compatible con el deployment (tiktoken; o200k_base = gpt-4o / gpt-4.1)
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "o200k_base")
+# Tokens de contexto documental por respuesta (AnswerEngine.format_context)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# Chunks por lote en el pipeline de ingesta (embeddings + INSERT)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+# Procesos de chunking (1 = secuencial en streaming, 0 = todos los núcleos) e hilos de embeddings
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+# Near-duplicados en la ingesta (MinHash LSH): similitud de Jaccard estimada a partir de la
+# cual un chunk se registra como alias de uno canónico en vez de indexarse (0 = desactivado)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+
+# Cache de embeddings de consultas (LRU en memoria + tabla SQLite opcional)
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "2048"))
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB", "database/embedding_cache.db")  # "" desactiva el nivel persistente
+# Embeddings de chunks por hash de contenido: las reconstrucciones solo embeben lo nuevo ("" = desactivado)
+CHUNK_EMBED_STORE_DIR = os.getenv("CHUNK_EMBED_STORE_DIR", "database/chunk_embeddings")
+
+# Tipo de índice FAISS al construir: flat | hnsw | ivf_flat | ivf_pq | sq8 | fp16 | pq
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+# Reducción PCA antes de indexar (0 = sin PCA)
+FAISS_PCA_DIM = int(os.getenv("FAISS_PCA_DIM", "0"))
+# Parámetros de búsqueda (vacío = usar los del manifiesto del índice)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "0")) or None
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "0")) or None
+
+# Abrir índices FAISS con mmap de solo lectura (compartidos entre workers)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "1").lower() in ("1", "true", "yes")
+
+# Snapshots versionados del índice (hot-swap sin reinicio)
+INDEX_SNAPSHOT_DIR = os.getenv("INDEX_SNAPSHOT_DIR", "database/index_snapshots")
+INDEX_SNAPSHOT_KEEP = int(os.getenv("INDEX_SNAPSHOT_KEEP", "2"))
+INDEX_SNAPSHOT_POLL_SECONDS = float(os.getenv("INDEX_SNAPSHOT_POLL_SECONDS", "5"))
+
+# SQLite: PRAGMAs aplicados al abrir conexiones del pool
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Fusión de resultados en hybrid(): rrf | minmax | zscore
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf")
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", "1.0"))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "1.0"))
+# Solapar embedding+FAISS con la consulta FTS dentro de hybrid()
+HYBRID_CONCURRENT = os.getenv("HYBRID_CONCURRENT", "1").lower() in ("1", "true", "yes")
+HYBRID_WORKERS = int(os.getenv("HYBRID_WORKERS", "4"))
+
+# Cache de resultados de hybrid() (0 = desactivado)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+
+# Detectar "TOMO 6", "Capítulo 3", ... en la consulta y filtrar la búsqueda por esos metadatos
+SEARCH_AUTO_FILTERS = os.getenv("SEARCH_AUTO_FILTERS", "1").lower() in ("1", "true", "yes")
+
+# Memoria semántica: índice sin entrenamiento (flat | fp16) y tipo de los blobs de embeddings
+MEMORY_INDEX_TYPE = os.getenv("MEMORY_INDEX_TYPE", "fp16")
+MEMORY_VECTOR_DTYPE = os.getenv("MEMORY_VECTOR_DTYPE", "float16")
+
+# Rerank con cross-encoder local después de la fusión (requiere sentence-transformers)
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "12"))  # candidatos fusionados que se puntúan
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))             # resultados que se devuelven
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_MAX_CHARS = int(os.getenv("RERANK_MAX_CHARS", "1200"))
+
+# Consultas que citan "Regla 8.2.3" / "Sección 10.1.5.1" se sirven desde el índice de citas
+CITATION_LOOKUP = os.getenv("CITATION_LOOKUP", "1").lower() in ("1", "true", "yes")
+
+# Códigos de zonificación (R-1, C-2, ...) y términos del glosario se resuelven con un índice exacto
+TERM_LOOKUP = os.getenv("TERM_LOOKUP", "1").lower() in ("1", "true", "yes")
@@ -1,75 +1,532 @@
-import sqlite3, json
+import sqlite3, json, os, re, hashlib, threading, time, unicodedata
 from contextlib import contextmanager
+from .config import SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE_KB, SQLITE_BUSY_TIMEOUT_MS
+
+
+class ConnectionPool:
+    """
+    Conexiones reutilizables para una base SQLite:
+    - lectura: una conexión por hilo, con `query_only` activado
+    - escritura: una sola conexión compartida, serializada con un lock; un
+      `writer()` anidado en el mismo hilo usa un savepoint y solo el externo
+      hace commit
+    Los PRAGMAs se aplican una vez al abrir, no en cada consulta.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._ino = _inode(db_path)
+        self._generation = 0
+        self._pid = os.getpid()
+        self._local = threading.local()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._depth = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {"readers_opened": 0, "writer_opened": 0, "reads": 0, "writes": 0,
+                      "write_wait_ms": 0.0, "max_write_wait_ms": 0.0}
+
+    def _open(self, readonly: bool) -> sqlite3.Connection:
+        con = sqlite3.connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+                              check_same_thread=readonly)
+        con.row_factory = sqlite3.Row
+        if not readonly:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+        con.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        con.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+        con.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB)}")
+        con.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            con.execute("PRAGMA query_only=ON")
+        self._count("readers_opened" if readonly else "writer_opened")
+        return con
+
+    def _count(self, key: str, value: float = 1):
+        with self._stats_lock:
+            self.stats[key] += value
+
+    def _check_fork(self):
+        # Conexiones heredadas de un fork no deben usarse en el hijo
+        if os.getpid() != self._pid:
+            self._pid = os.getpid()
+            self._local = threading.local()
+            self._writer = None
+            self._writer_lock = threading.RLock()
+            self._depth = 0
+
+    def _check_replaced(self):
+        # bulk_build publica una BD nueva con os.replace: las conexiones abiertas
+        # siguen en el inode viejo y hay que reabrirlas
+        ino = _inode(self.db_path)
+        if ino == self._ino:
+            return
+        with self._writer_lock:
+            if ino != self._ino:
+                self._ino = ino
+                self._generation += 1
+                if self._writer is not None:
+                    self._writer.close()
+                    self._writer = None
+
+    @contextmanager
+    def reader(self):
+        self._check_fork()
+        self._check_replaced()
+        con = getattr(self._local, "con", None)
+        if con is not None and getattr(self._local, "generation", 0) != self._generation:
+            con.close()
+            con = None
+        if con is None:
+            con = self._local.con = self._open(readonly=True)
+            self._local.generation = self._generation
+        self._count("reads")
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                con.rollback()
+
+    @contextmanager
+    def writer(self):
+        self._check_fork()
+        t0 = time.perf_counter()
+        with self._writer_lock:
+            if self._depth:
+                # Anidado en el mismo hilo: un savepoint dentro de la transacción externa,
+                # que es la única que hace commit
+                yield from self._nested()
+                return
+            self._check_replaced()
+            waited = (time.perf_counter() - t0) * 1000
+            with self._stats_lock:
+                self.stats["writes"] += 1
+                self.stats["write_wait_ms"] += waited
+                self.stats["max_write_wait_ms"] = max(self.stats["max_write_wait_ms"], waited)
+            if self._writer is None:
+                self._writer = self._open(readonly=False)
+            self._depth = 1
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+            finally:
+                self._depth = 0
+
+    def _nested(self):
+        name = f"nested_{self._depth}"
+        self._depth += 1
+        self._writer.execute(f"SAVEPOINT {name}")
+        try:
+            yield self._writer
+            self._writer.execute(f"RELEASE {name}")
+        except BaseException:
+            self._writer.execute(f"ROLLBACK TO {name}")
+            self._writer.execute(f"RELEASE {name}")
+            raise
+        finally:
+            self._depth -= 1
+
+    def close(self):
+        """Cerrar el escritor y la conexión de lectura del hilo actual"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        con = getattr(self._local, "con", None)
+        if con is not None:
+            con.close()
+            self._local.con = None
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self.stats, db_path=self.db_path)
+
+
+def _inode(path: str):
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(db_path))
+    return pool
+
 
 @contextmanager
-def get_conn(db_path: str):
-    con = sqlite3.connect(db_path)
+def get_conn(db_path: str, readonly: bool = False):
+    """
+    Conexión del pool. `readonly=True` usa la conexión de lectura del hilo
+    (query_only); por defecto se usa el escritor serializado y se hace commit al salir.
+    """
+    pool = get_pool(db_path)
+    with (pool.reader() if readonly else pool.writer()) as con:
+        yield con
+
+
+def pool_stats() -> list:
+    """Estadísticas de todos los pools abiertos"""
+    return [p.get_stats() for p in list(_pools.values())]
+
+
+def close_pools():
+    for pool in list(_pools.values()):
+        pool.close()
+
+# ----------------------------------------------------------------------
+# Carga masiva: BD temporal, PRAGMAs relajados, executemany y rename atómico
+# ----------------------------------------------------------------------
+BULK_BATCH_ROWS = 5000
+
+
+@contextmanager
+def bulk_build(db_path: str, copy_existing: bool = True):
+    """
+    Construir la BD en `<db_path>.build-<pid>` y reemplazar db_path al terminar.
+
+    - se parte de una copia (backup API) para conservar el resto de tablas
+    - journal_mode=OFF, synchronous=OFF y lock exclusivo: un corte deja un
+      temporal inservible, nunca toca la BD publicada
+    - al salir sin error: commit, fsync y os.replace; los lectores ven la BD
+      vieja o la nueva completa y los pools reabren al detectar el nuevo inode
+    - el reemplazo ocurre antes de que el llamador publique su snapshot: los
+      procesos que sirven siguen unos segundos con los rowids anteriores, así
+      que las filas nuevas deben tomar rowids con `next_rowid` (antes de borrar
+      las viejas) y no reiniciarlos en 1
+    Lo que se escriba en db_path durante la construcción se pierde (uso offline).
+    """
+    tmp = f"{db_path}.build-{os.getpid()}"
+    for path in (tmp, tmp + "-journal"):
+        if os.path.exists(path):
+            os.remove(path)
+    con = sqlite3.connect(tmp)
     con.row_factory = sqlite3.Row
     try:
+        if copy_existing and os.path.exists(db_path):
+            src = sqlite3.connect(db_path)
+            try:
+                src.backup(con)
+            finally:
+                src.close()
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA locking_mode=EXCLUSIVE")
+        con.execute("PRAGMA temp_store=MEMORY")
+        con.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB) * 4}")
         yield con
         con.commit()
-    finally:
+        con.execute("PRAGMA journal_mode=DELETE")
+        con.close()
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        replace_database(tmp, db_path)
+        print(f"🔁 Base de datos reemplazada: {db_path}")
+    except BaseException:
         con.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
-def upsert_chunk(con, chunk_id, doc_id, page_start, page_end, heading_path, text):
-    con.execute("""INSERT OR REPLACE INTO chunks_meta(chunk_id, doc_id, page_start, page_end, heading_path, hash)
-                 VALUES(?, ?, ?, ?, ?, HEX(RANDOMBLOB(8)))""", 
-                 (chunk_id, doc_id, page_start, page_end, heading_path))
-    con.execute("""INSERT INTO fts_chunks(chunk_text, chunk_id, doc_id, heading_path, page_start, page_end)
-                 VALUES(?,?,?,?,?,?)""", 
-                 (text, chunk_id, doc_id, heading_path, page_start, page_end))
 
-def fts_search(con, query: str, limit: int = 24):
-    # Adaptado para la estructura real de la base de datos existente
+def replace_database(src: str, db_path: str):
+    """
+    Publicar una BD construida aparte. Se borran el -wal/-shm de la anterior
+    para que nadie los aplique sobre la nueva.
+    """
+    os.replace(src, db_path)
+    for suffix in ("-wal", "-shm"):
+        try:
+            os.remove(db_path + suffix)
+        except FileNotFoundError:
+            pass
+    fd = os.open(os.path.dirname(os.path.abspath(db_path)), os.O_RDONLY)
     try:
-        # Sanitizar la consulta para FTS5 - remover caracteres problemáticos
-        import re
-        # Mantener solo letras, números, espacios y operadores FTS básicos
-        sanitized_query = re.sub(r'[^\w\s]', ' ', query)
-        # Normalizar espacios múltiples
-        sanitized_query = ' '.join(sanitized_query.split())
-        # Si la consulta queda vacía, usar la original
-        if not sanitized_query.strip():
-            sanitized_query = query
-
-        print(f"🔍 Consulta FTS: '{sanitized_query}' (original: '{query}')")
-
-        # La tabla fts_chunks actual tiene columnas: content, tomo, capitulo, articulo, tipo_seccion, fuente
-        cur = con.execute("""
-            SELECT rowid, content, tomo, capitulo, articulo, tipo_seccion, fuente,
-                   snippet(fts_chunks, 0, '«', '»', ' … ', 10) AS snip
-            FROM fts_chunks WHERE fts_chunks MATCH ? LIMIT ?
-        """, (sanitized_query, limit))
-
-        results = []
-        for row in cur.fetchall():
-            # Adaptar nombres de columnas a la estructura esperada
-            text = row['content'] if 'content' in row.keys() else row[1]
-            doc_id = row['fuente'] if 'fuente' in row.keys() else (row['tomo'] if 'tomo' in row.keys() else None)
-            heading = f"TOMO {row['tomo']}" if row['tomo'] else ""
-            if row['capitulo']:
-                heading += f" > CAPÍTULO {row['capitulo']}"
-            if row['articulo']:
-                heading += f" > ARTÍCULO {row['articulo']}"
-            page_start = None  # No disponible en estructura actual
-            page_end = None    # No disponible en estructura actual
-            snip = row['snip'] if 'snip' in row.keys() else (text[:200] if text else '')
-
-            result = {
-                'rowid': row['rowid'] if 'rowid' in row.keys() else row[0],
-                'chunk_id': str(row['rowid'] if 'rowid' in row.keys() else row[0]),  # Agregar chunk_id como rowid
-                'text': text,
-                'doc_id': doc_id or '',
-                'heading_path': heading,
-                'page_start': page_start,
-                'page_end': page_end,
-                'snip': snip
-            }
-            results.append(result)
-        return results
-    except Exception as e:
-        print(f"Error en fts_search: {e}")
-        return []
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fts_defer_merges(con, table: str = "fts_chunks"):
+    """Sin merges automáticos de segmentos FTS5 durante la carga (optimize al final)"""
+    con.execute(f"INSERT INTO {table}({table}, rank) VALUES('automerge', 0)")
+
+
+def fts_optimize(con, table: str = "fts_chunks", automerge: int = 4):
+    """Fusionar los segmentos en uno y restaurar el automerge por defecto"""
+    con.execute(f"INSERT INTO {table}({table}) VALUES('optimize')")
+    con.execute(f"INSERT INTO {table}({table}, rank) VALUES('automerge', {int(automerge)})")
+
+
+# Una sola sentencia: se crea con execute() dentro de la transacción del llamador
+ROWID_STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rowid_state (
+    tbl TEXT PRIMARY KEY,
+    next_rowid INTEGER NOT NULL      -- marca alta: rowids por debajo ya se usaron
+)
+"""
+
+
+def next_rowid(con, table: str = "fts_chunks") -> int:
+    """
+    Primer rowid libre: con rowids explícitos se puede insertar con executemany.
+
+    Nunca retrocede (ver `reserve_rowids`): un rowid borrado, o de la BD que
+    reemplaza una reconstrucción, no se reasigna. Un snapshot anterior que
+    todavía sirve ese rowid no encuentra el texto, en vez de recibir el de otro chunk.
+    """
+    con.execute(ROWID_STATE_SCHEMA)
+    top = (con.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0) + 1
+    row = con.execute("SELECT next_rowid FROM rowid_state WHERE tbl = ?", (table,)).fetchone()
+    return max(top, row[0] if row else 0)
+
+
+def reserve_rowids(con, next_id: int, table: str = "fts_chunks"):
+    """Guardar la marca alta de rowids asignados (sobrevive a DELETE y a bulk_build)"""
+    con.execute(ROWID_STATE_SCHEMA)
+    con.execute("INSERT OR REPLACE INTO rowid_state(tbl, next_rowid) VALUES(?, ?)", (table, int(next_id)))
+
+
+def bulk_insert(con, sql: str, rows, batch: int = BULK_BATCH_ROWS) -> int:
+    """executemany por tandas de `batch` filas desde cualquier iterable; retorna cuántas"""
+    total, buf = 0, []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= batch:
+            con.executemany(sql, buf)
+            total, buf = total + len(buf), []
+    if buf:
+        con.executemany(sql, buf)
+        total += len(buf)
+    return total
+
+def content_hash(text: str) -> str:
+    """SHA-256 del texto normalizado (NFC, espacios colapsados): no cambia si el contenido no cambia"""
+    normalized = " ".join(unicodedata.normalize("NFC", text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+def upsert_chunk(con, rowid: int, chunk: dict):
+    """Un chunk en fts_chunks (rowid explícito) + chunks_meta; ver bulk_upsert_chunks"""
+    bulk_upsert_chunks(con, [chunk], rowid)
+
+def bulk_upsert_chunks(con, chunks, first_rowid: int) -> int:
+    """
+    upsert_chunk en bloque, con rowids consecutivos desde `first_rowid`.
+
+    `chunks` son dicts como los de `ingest.iter_chunks`: text, tomo, capitulo,
+    articulo, tipo_seccion, fuente (columnas de fts_chunks) y doc_id, page_start,
+    page_end, heading_path, hash opcional (chunks_meta). El chunk_id es
+    str(rowid), el mismo id que usan el índice FAISS y MetaStore.
+    """
+    chunks = list(chunks)
+    bulk_insert(con, """INSERT INTO fts_chunks(rowid, content, tomo, capitulo, articulo, tipo_seccion, fuente)
+                        VALUES(?,?,?,?,?,?,?)""",
+                ((r, c["text"], c["tomo"], c["capitulo"], c["articulo"], c["tipo_seccion"], c["fuente"])
+                 for r, c in enumerate(chunks, first_rowid)))
+    return bulk_insert(con, """INSERT OR REPLACE INTO chunks_meta(chunk_id, doc_id, page_start, page_end, heading_path, hash)
+                               VALUES(?, ?, ?, ?, ?, ?)""",
+                       ((str(r), c["doc_id"], c["page_start"], c["page_end"], c["heading_path"],
+                         c.get("hash") or content_hash(c["text"])) for r, c in enumerate(chunks, first_rowid)))
+
+# ----------------------------------------------------------------------
+# Motor léxico FTS5: ranking bm25, tokenizer sin acentos y planificador
+# ----------------------------------------------------------------------
+FTS_TOKENIZER = "unicode61 remove_diacritics 2"
+
+# Pesos bm25 por columna, en el orden de fts_chunks:
+# content, tomo, capitulo, articulo, tipo_seccion, fuente
+FTS_COLUMN_WEIGHTS = (1.0, 0.5, 2.0, 2.0, 0.5, 0.25)
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquel aquella aquellas aquellos aqui asi
+como con contra cual cuales cuando cuanto de del desde donde dos el ella ellas ello ellos en entre
+era eran es esa esas ese eso esos esta estan estas este esto estos fue fueron ha hay la las le les
+lo los mas me mi mis mucho muy ni no nos o os otra otras otro otros para pero poco por porque puede
+pueden que quien quienes se sea segun ser si sin sobre son su sus tambien tanto te tiene tienen
+todo todos tu tus un una unas uno unos y ya yo
+dice dicen explica explicame cual cuales debo decir hacer necesito quiero saber puedo
+""".split())
+
+# Rótulos de encabezados: solos no discriminan (aparecen en casi todos los chunks);
+# con su número forman una frase ("Regla 6.1.2" -> "regla 6 1 2"). "Tomo N" queda
+# para los filtros de metadatos
+_HEADING_LABELS = {
+    "articulo": "articulo", "articulos": "articulo", "art": "articulo",
+    "seccion": "seccion", "secciones": "seccion", "sec": "seccion",
+    "regla": "regla", "reglas": "regla",
+    "capitulo": "capitulo", "capitulos": "capitulo", "cap": "capitulo",
+    "tomo": "tomo", "tomos": "tomo",
+}
+_LABELED_NUMBER = re.compile(r"\b(" + "|".join(sorted(_HEADING_LABELS, key=len, reverse=True))
+                             + r")\b\.?\s*(\d+(?:\.\d+)*|[ivxlc]{1,6})\b")
+
+_FTS_OPERATORS = re.compile(r'"|\b(?:AND|OR|NOT|NEAR)\b')
+_CODE_TOKEN = re.compile(r"\b([A-Za-z]{1,3})-(\d{1,2}[A-Za-z]?)\b")
+_WORD_TOKEN = re.compile(r"\w+", re.UNICODE)
+_FTS_KEYWORDS = frozenset(("and", "or", "not", "near"))
+
+
+def fold_accents(text: str) -> str:
+    """Quitar diacríticos (mismo criterio que el tokenizer `remove_diacritics`)"""
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(c for c in decomposed if unicodedata.category(c) != "Mn")
+
+
+def build_fts_query(query: str, max_terms: int = 8) -> str:
+    """
+    Planificar una expresión FTS5 a partir de lenguaje natural:
+    - códigos tipo "R-1" pasan como frase exacta ("r 1")
+    - "Regla 6.1.2", "Art. 5": rótulo + número como frase ("regla 6 1 2");
+      los rótulos sin número se descartan como stopwords
+    - se eliminan stopwords en español
+    - términos de 5+ letras se buscan por prefijo (zonificación → zonificacion*)
+    - los términos se combinan con OR (bm25 premia documentos con más términos)
+      más un NEAR de los primeros términos para premiar la proximidad; los
+      números sueltos solo cuentan dentro del NEAR, nunca como término propio
+    - si no queda nada ("¿qué dice el tomo 6?"), se usan las frases de tomo,
+      los números y los rótulos descartados antes que devolver una consulta vacía
+    """
+    phrases = [f'"{a.lower()} {b.lower()}"' for a, b in _CODE_TOKEN.findall(query)]
+    fallback = []
+    rest = fold_accents(_CODE_TOKEN.sub(" ", query).lower())
+    for label, number in _LABELED_NUMBER.findall(rest):
+        label = _HEADING_LABELS[label]
+        phrase = f'"{label} {" ".join(number.split("."))}"'
+        if phrase in phrases or phrase in fallback:
+            continue
+        (fallback if label == "tomo" else phrases).append(phrase)
+    rest = _LABELED_NUMBER.sub(" ", rest)
+
+    terms, seen = [], set()
+    for word in _WORD_TOKEN.findall(rest):
+        if word in _HEADING_LABELS and _HEADING_LABELS[word] not in fallback:
+            fallback.append(_HEADING_LABELS[word])
+        if (word in SPANISH_STOPWORDS or word in _HEADING_LABELS or word in _FTS_KEYWORDS or word in seen
+                or (len(word) < 2 and not word.isdigit())):
+            continue
+        seen.add(word)
+        terms.append(word)
+    terms = terms[:max_terms]
+
+    parts = list(phrases)
+    parts += [f"{t}*" if len(t) >= 5 else t for t in terms if not t.isdigit()]
+    if not parts:
+        # Solo estructura o números: mejor eso que ninguna consulta léxica
+        return " OR ".join(fallback + [t for t in terms if t.isdigit()])
+    if len(terms) >= 2:
+        parts.append(f"NEAR({' '.join(terms[:4])}, 10)")
+    return " OR ".join(parts)
+
+
+def fts_search(con, query: str, limit: int = 24):
+    """
+    Búsqueda léxica rankeada por bm25 (top-k desde el índice, sin escaneo completo).
+    Consultas con operadores FTS explícitos ("...", AND/OR/NOT/NEAR) se respetan.
+    """
+    weights = ", ".join(str(w) for w in FTS_COLUMN_WEIGHTS)
+    sql = f"""
+        SELECT rowid, content, tomo, capitulo, articulo, tipo_seccion, fuente,
+               snippet(fts_chunks, 0, '«', '»', ' … ', 10) AS snip,
+               bm25(fts_chunks, {weights}) AS rank
+        FROM fts_chunks WHERE fts_chunks MATCH ? ORDER BY rank LIMIT ?
+    """
+
+    planned = build_fts_query(query)
+    candidates = [query, planned] if _FTS_OPERATORS.search(query) else [planned]
+    rows = []
+    for fts_query in candidates:
+        if not fts_query:
+            continue
+        try:
+            rows = con.execute(sql, (fts_query, limit)).fetchall()
+            print(f"🔍 Consulta FTS: '{fts_query}' (original: '{query}') → {len(rows)}")
+            break
+        except sqlite3.OperationalError as e:
+            print(f"Error en fts_search ({fts_query}): {e}")
+    results = [_fts_row_to_result(row) for row in rows]
+
+    # bm25() es negativo (menor = mejor) y su escala depende del corpus y la consulta:
+    # se normaliza contra el mejor resultado para que la fusión híbrida pueda usarlo
+    best = max((r['bm25'] for r in results), default=0.0)
+    for r in results:
+        r['score'] = r['bm25'] / best if best > 0 else 0.0
+    return results
+
+
+def _fts_row_to_result(row) -> dict:
+    # Adaptar la estructura de fts_chunks (content, tomo, capitulo, articulo, tipo_seccion, fuente)
+    text = row['content']
+    heading = f"TOMO {row['tomo']}" if row['tomo'] else ""
+    if row['capitulo']:
+        heading += f" > CAPÍTULO {row['capitulo']}"
+    if row['articulo']:
+        heading += f" > ARTÍCULO {row['articulo']}"
+    return {
+        'rowid': row['rowid'],
+        'chunk_id': str(row['rowid']),
+        'text': text,
+        'doc_id': row['fuente'] or row['tomo'] or '',
+        'heading_path': heading,
+        'page_start': None,  # No disponible en estructura actual
+        'page_end': None,
+        'snip': row['snip'] or (text[:200] if text else ''),
+        'bm25': -float(row['rank']),
+        'tomo': row['tomo'],
+        'capitulo': row['capitulo'],
+        'tipo_seccion': row['tipo_seccion'],
+        'fuente': row['fuente'],
+    }
+
+
+def fts_needs_migration(con) -> bool:
+    row = con.execute("SELECT sql FROM sqlite_master WHERE name = 'fts_chunks'").fetchone()
+    return bool(row) and "remove_diacritics" not in (row[0] or "")
+
+
+def migrate_fts_tokenizer(con) -> bool:
+    """
+    Recrear fts_chunks con tokenizer sin acentos conservando columnas y rowids.
+    Retorna True si migró. Debe ejecutarse con la conexión de escritura.
+    """
+    row = con.execute("SELECT sql FROM sqlite_master WHERE name = 'fts_chunks'").fetchone()
+    if not row or "remove_diacritics" in (row[0] or ""):
+        return False
+
+    create_sql = re.sub(r",\s*tokenize\s*=\s*('[^']*'|\"[^\"]*\"|\w+)", "", row[0], flags=re.IGNORECASE)
+    create_sql = re.sub(r"(?i)CREATE\s+VIRTUAL\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?\"?fts_chunks\"?",
+                        "CREATE VIRTUAL TABLE fts_chunks_migr", create_sql, count=1)
+    create_sql = create_sql.rstrip().rstrip(")") + f", tokenize = '{FTS_TOKENIZER}')"
+    columns = ", ".join(r[1] for r in con.execute("PRAGMA table_info(fts_chunks)").fetchall())
+
+    print("🔧 Migrando fts_chunks a tokenizer sin acentos...")
+    con.execute("DROP TABLE IF EXISTS fts_chunks_migr")
+    con.execute(create_sql)
+    con.execute(f"INSERT INTO fts_chunks_migr(rowid, {columns}) SELECT rowid, {columns} FROM fts_chunks")
+    con.execute("DROP TABLE fts_chunks")
+    con.execute("ALTER TABLE fts_chunks_migr RENAME TO fts_chunks")
+    con.execute("INSERT INTO fts_chunks(fts_chunks) VALUES('optimize')")
+    print("✅ fts_chunks migrada")
+    return True
+
+
+def ensure_fts_schema(db_path: str):
+    """Migrar el tokenizer de fts_chunks si hace falta (chequeo barato en cada arranque)"""
+    with get_conn(db_path, readonly=True) as con:
+        if not fts_needs_migration(con):
+            return
+    with get_conn(db_path) as con:
+        migrate_fts_tokenizer(con)
 
 def insert_knowledge_fact(con, fact_id, content, citation, type_, tags=None):
     con.execute("""INSERT OR REPLACE INTO knowledge_facts(id, content, citation, type, tags)
@@ -0,0 +1,146 @@
+"""
+Near-duplicados de chunks en la ingesta (MinHash LSH)
+======================================================
+
+El corpus repite pasajes: copias de los mismos tomos con otro nombre, reglas
+transcritas en varios documentos y el solapamiento entre chunks. Indexarlos
+todos agranda FAISS/FTS y hace que varios de los pocos chunks de contexto de
+una respuesta sean el mismo texto.
+
+Cada chunk se resume en una firma MinHash de NUM_PERM valores sobre shingles
+de SHINGLE_WORDS palabras (sin acentos, en minúsculas). El LSH por bandas
+(BANDS × ROWS) propone candidatos y la fracción de valores iguales estima la
+similitud de Jaccard; desde DEDUP_THRESHOLD el chunk es un alias:
+
+- `chunk_minhash`: firma de cada chunk canónico (rowid en fts_chunks), para
+  que las ingestas incrementales comparen contra lo ya indexado
+- `chunk_aliases`: procedencia de cada duplicado (documento, offsets, ruta,
+  páginas) -> chunk canónico; no tiene vector ni fila en fts_chunks
+
+Las permutaciones salen de una semilla fija: las firmas guardadas siguen
+siendo comparables entre procesos y corridas.
+"""
+
+import re
+import sqlite3
+import zlib
+import numpy as np
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+from .config import DEDUP_THRESHOLD
+from .db import fold_accents
+
+NUM_PERM = 128
+BANDS, ROWS = 16, 8                 # umbral efectivo del LSH ~ (1/16)^(1/8) ≈ 0.71
+SHINGLE_WORDS = 5
+MIN_SHINGLES = 8                    # chunks más cortos (p. ej. solo encabezados) no se deduplican
+_PRIME = np.uint64((1 << 31) - 1)     # a·h + b < 2^63: sin desborde en uint64
+_rng = np.random.RandomState(20250811)
+_A = _rng.randint(1, int(_PRIME), NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, int(_PRIME), NUM_PERM).astype(np.uint64)
+_WORD = re.compile(r"\w+")
+
+DEDUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunk_minhash (
+    chunk_id INTEGER PRIMARY KEY,    -- rowid en fts_chunks (chunk canónico)
+    sig BLOB NOT NULL                -- NUM_PERM x uint32
+);
+CREATE TABLE IF NOT EXISTS chunk_aliases (
+    doc_id TEXT NOT NULL,
+    hash TEXT NOT NULL,              -- content_hash del texto duplicado
+    start INTEGER,
+    end INTEGER,
+    heading_path TEXT,
+    page_start INTEGER,
+    page_end INTEGER,
+    canonical_id INTEGER NOT NULL,   -- rowid del chunk canónico en fts_chunks
+    similarity REAL
+);
+CREATE INDEX IF NOT EXISTS idx_chunk_aliases_doc ON chunk_aliases(doc_id);
+CREATE INDEX IF NOT EXISTS idx_chunk_aliases_canonical ON chunk_aliases(canonical_id);
+"""
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """Firma MinHash (uint32[NUM_PERM]) o None si el texto es muy corto"""
+    words = _WORD.findall(fold_accents(text or "").lower())
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles),
+                    dtype=np.uint64, count=len(shingles)) % _PRIME
+    return ((_A[:, None] * h[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard estimado: fracción de permutaciones con el mismo mínimo"""
+    return float(np.mean(a == b))
+
+
+class NearDuplicateIndex:
+    """
+    Índice LSH en memoria: clave -> firma, y bandas -> claves candidatas
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self.sigs: Dict[Hashable, np.ndarray] = {}
+        self.buckets: Dict[Tuple[int, bytes], set] = {}
+
+    @staticmethod
+    def _bands(sig: np.ndarray):
+        for band in range(BANDS):
+            yield band, sig[band * ROWS:(band + 1) * ROWS].tobytes()
+
+    @classmethod
+    def load(cls, con: sqlite3.Connection, threshold: float = DEDUP_THRESHOLD) -> "NearDuplicateIndex":
+        """Firmas de los chunks canónicos ya indexados"""
+        index = cls(threshold)
+        for chunk_id, blob in con.execute("SELECT chunk_id, sig FROM chunk_minhash"):
+            index.add(int(chunk_id), np.frombuffer(blob, dtype=np.uint32))
+        return index
+
+    def __len__(self) -> int:
+        return len(self.sigs)
+
+    def add(self, key: Hashable, sig: np.ndarray):
+        self.sigs[key] = sig
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key: Hashable):
+        sig = self.sigs.pop(key, None)
+        if sig is None:
+            return
+        for band in self._bands(sig):
+            keys = self.buckets.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.buckets[band]
+
+    def query(self, sig: np.ndarray) -> Optional[Tuple[Hashable, float]]:
+        """Canónico más parecido con similitud >= threshold, o None"""
+        candidates = set()
+        for band in self._bands(sig):
+            candidates |= self.buckets.get(band, set())
+        best, best_sim = None, self.threshold
+        for key in candidates:
+            sim = similarity(sig, self.sigs[key])
+            if sim >= best_sim:
+                best, best_sim = key, sim
+        return (best, best_sim) if best is not None else None
+
+
+def aliases_for(con: sqlite3.Connection, chunk_ids: Iterable[int]) -> Dict[int, List[Dict]]:
+    """Procedencia de los duplicados colapsados en cada chunk canónico"""
+    ids = sorted({int(c) for c in chunk_ids})
+    if not ids:
+        return {}
+    qmarks = ",".join("?" * len(ids))
+    out: Dict[int, List[Dict]] = {}
+    for r in con.execute(f"""SELECT canonical_id, doc_id, heading_path, page_start, page_end, similarity
+                             FROM chunk_aliases WHERE canonical_id IN ({qmarks})
+                             ORDER BY canonical_id, doc_id, start""", ids):
+        out.setdefault(int(r[0]), []).append({"doc_id": r[1], "heading_path": r[2], "page_start": r[3],
+                                              "page_end": r[4], "similarity": r[5]})
+    return out
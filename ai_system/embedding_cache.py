@@ -0,0 +1,143 @@
+"""
+Cache de embeddings para consultas de JP-LegalBot
+Nivel 1: LRU acotado en memoria. Nivel 2 (opcional): tabla SQLite que sobrevive reinicios.
+"""
+
+import os
+import re
+import threading
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Optional
+from .db import get_conn
+
+_PUNCT_EDGES = re.compile(r"^[\s¿?¡!.,;:\"'«»()]+|[\s¿?¡!.,;:\"'«»()]+$")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Normalizar consulta para usarla como clave (NFKC, minúsculas, espacios y signos de borde)"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = _SPACES.sub(" ", text)
+    return _PUNCT_EDGES.sub("", text)
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings de consultas con clave (modelo, consulta normalizada)
+    """
+
+    def __init__(self, max_size: int = 2048, db_path: Optional[str] = None):
+        self.max_size = max_size
+        self.db_path = db_path or None
+        self._lru: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            try:
+                self._init_db()
+            except Exception as e:
+                print(f"⚠️ Cache persistente de embeddings no disponible ({e}), usando solo memoria")
+                self.db_path = None
+
+    def _init_db(self):
+        """Crear tabla del nivel persistente"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with get_conn(self.db_path) as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    model TEXT NOT NULL,
+                    query_key TEXT NOT NULL,
+                    dim INTEGER NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (model, query_key)
+                )
+            """)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Retornar el vector (1 x dim) si está en cache, None si no"""
+        key = (model, normalize_query(text))
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vec
+
+        vec = self._disk_get(key)
+        with self._lock:
+            if vec is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vec)
+        return vec
+
+    def put(self, model: str, text: str, vec: np.ndarray):
+        """Guardar vector en ambos niveles"""
+        key = (model, normalize_query(text))
+        vec = np.ascontiguousarray(vec, dtype=np.float32).reshape(1, -1)
+        vec.setflags(write=False)
+        with self._lock:
+            self._remember(key, vec)
+        self._disk_put(key, vec)
+
+    def _remember(self, key: tuple, vec: np.ndarray):
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def _disk_get(self, key: tuple) -> Optional[np.ndarray]:
+        if not self.db_path:
+            return None
+        try:
+            with get_conn(self.db_path, readonly=True) as con:
+                row = con.execute(
+                    "SELECT dim, vector FROM query_embeddings WHERE model = ? AND query_key = ?", key
+                ).fetchone()
+        except Exception as e:
+            print(f"⚠️ Error leyendo cache de embeddings: {e}")
+            return None
+        if row is None:
+            return None
+        vec = np.frombuffer(row[1], dtype=np.float32).reshape(1, row[0])
+        return vec
+
+    def _disk_put(self, key: tuple, vec: np.ndarray):
+        if not self.db_path:
+            return
+        try:
+            with get_conn(self.db_path) as con:
+                con.execute(
+                    "INSERT OR REPLACE INTO query_embeddings(model, query_key, dim, vector) VALUES(?,?,?,?)",
+                    (key[0], key[1], vec.shape[1], vec.tobytes())
+                )
+        except Exception as e:
+            print(f"⚠️ Error guardando cache de embeddings: {e}")
+
+    def clear(self):
+        """Vaciar el nivel en memoria (el persistente se conserva)"""
+        with self._lock:
+            self._lru.clear()
+
+    def get_stats(self) -> Dict:
+        """Contadores de aciertos/fallos"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._lru),
+                "max_size": self.max_size,
+                "persistent": bool(self.db_path),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,187 @@
+"""
+Almacén persistente de embeddings de chunks (reconstrucciones incrementales)
+============================================================================
+
+Clave: (modelo, SHA-256 del texto normalizado del chunk). Una reconstrucción
+del índice solo llama a la API / al modelo para los chunks nuevos o
+modificados; el resto se lee del almacén.
+
+Por modelo se guarda un directorio:
+
+    <root>/<modelo>/vectors.bin   matriz (filas x dim) cruda, abierta con mmap
+    <root>/<modelo>/keys.db       tabla hash -> fila
+    <root>/<modelo>/manifest.json modelo, dim, dtype
+
+Los vectores se agregan al final del archivo y la tabla de claves se
+confirma después: una escritura interrumpida deja filas huérfanas (se
+ignoran), nunca claves que apunten a vectores incompletos.
+"""
+
+import os
+import re
+import json
+import threading
+import numpy as np
+from typing import Callable, Dict, List, Optional
+from .db import get_conn, content_hash
+
+STORE_DTYPES = ("float32", "float16")
+
+
+class ChunkEmbeddingStore:
+    """
+    Embeddings de chunks por hash de contenido, en una matriz mmap + tabla de claves
+    """
+
+    def __init__(self, root: str, model_id: str, dtype: str = "float32"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"dtype no soportado: {dtype}. Opciones: {', '.join(STORE_DTYPES)}")
+        self.model_id = model_id
+        self.path = os.path.join(root, re.sub(r"[^\w.-]+", "_", model_id) or "default")
+        os.makedirs(self.path, exist_ok=True)
+        self.vectors_path = os.path.join(self.path, "vectors.bin")
+        self.keys_path = os.path.join(self.path, "keys.db")
+        self.manifest_path = os.path.join(self.path, "manifest.json")
+        self._lock = threading.Lock()
+        self._matrix = None
+        self.hits = 0
+        self.misses = 0
+
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.dim = manifest["dim"]
+            self.dtype = np.dtype(manifest["dtype"])  # el dtype guardado manda
+
+        with get_conn(self.keys_path) as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_embeddings (
+                    hash TEXT PRIMARY KEY,
+                    row INTEGER NOT NULL
+                ) WITHOUT ROWID
+            """)
+
+    def __len__(self) -> int:
+        with get_conn(self.keys_path, readonly=True) as con:
+            return con.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+
+    @property
+    def _row_bytes(self) -> int:
+        return self.dim * self.dtype.itemsize
+
+    def _rows_on_disk(self) -> int:
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return 0
+        return os.path.getsize(self.vectors_path) // self._row_bytes
+
+    def _get_matrix(self) -> Optional[np.ndarray]:
+        rows = self._rows_on_disk()
+        if rows == 0:
+            return None
+        if self._matrix is None or len(self._matrix) != rows:
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def _lookup_rows(self, hashes: List[str]) -> Dict[str, int]:
+        found = {}
+        with get_conn(self.keys_path, readonly=True) as con:
+            # SQLite limita los parámetros por consulta
+            for start in range(0, len(hashes), 900):
+                part = hashes[start:start + 900]
+                qmarks = ",".join("?" * len(part))
+                found.update(con.execute(
+                    f"SELECT hash, row FROM chunk_embeddings WHERE hash IN ({qmarks})", part).fetchall())
+        return found
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Vectores (float32) de los hashes presentes en el almacén"""
+        if not hashes or self.dim is None:
+            return {}
+        found = self._lookup_rows(hashes)
+        with self._lock:
+            matrix = self._get_matrix()
+        if matrix is None:
+            return {}
+        rows = {h: r for h, r in found.items() if r < len(matrix)}
+        if not rows:
+            return {}
+        vectors = np.asarray(matrix[list(rows.values())], dtype=np.float32)
+        return dict(zip(rows.keys(), vectors))
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray):
+        """Agregar vectores nuevos (los hashes ya presentes se ignoran)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(hashes) == 0:
+            return
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                with open(self.manifest_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_id, "dim": self.dim, "dtype": self.dtype.name}, f)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Dimensión {vectors.shape[1]} no coincide con el almacén ({self.dim})")
+
+            new, seen = [], set(self._lookup_rows(list(hashes)))
+            for i, h in enumerate(hashes):
+                if h not in seen:
+                    seen.add(h)
+                    new.append(i)
+            if not new:
+                return
+
+            # Vectores primero (alineados a fila completa), claves después
+            first = self._rows_on_disk()
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(first * self._row_bytes)
+                f.write(np.ascontiguousarray(vectors[new], dtype=self.dtype).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with get_conn(self.keys_path) as con:
+                con.executemany("INSERT OR IGNORE INTO chunk_embeddings(hash, row) VALUES(?, ?)",
+                                [(hashes[i], first + n) for n, i in enumerate(new)])
+            self._matrix = None
+
+    def embed(self, texts: List[str], embed_fn: Callable[[List[str]], np.ndarray],
+              batch_size: int = 64) -> np.ndarray:
+        """
+        Embeddings de `texts` en orden, llamando a `embed_fn` solo para los que faltan
+
+        Args:
+            embed_fn: lista de textos -> array (n x dim); se llama por lotes de batch_size
+        """
+        hashes = [content_hash(t) for t in texts]
+        cached = self.get_many(list(dict.fromkeys(hashes)))
+
+        missing: Dict[str, str] = {}
+        for h, t in zip(hashes, texts):
+            if h not in cached:
+                missing.setdefault(h, t)
+        pending = list(missing.items())
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            vectors = np.asarray(embed_fn([t for _, t in batch]), dtype=np.float32)
+            self.put_many([h for h, _ in batch], vectors)  # persistido por lote: un corte no pierde lo pagado
+            cached.update(zip((h for h, _ in batch), vectors))
+
+        with self._lock:
+            self.hits += len(texts) - len(pending)
+            self.misses += len(pending)
+        print(f"♻️ Embeddings reutilizados: {len(texts) - len(pending)} de {len(texts)} "
+              f"({len(pending)} nuevos o modificados)")
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.stack([cached[h] for h in hashes]).astype(np.float32, copy=False)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "model": self.model_id,
+                "path": self.path,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "rows": self._rows_on_disk(),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
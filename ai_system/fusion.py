@@ -0,0 +1,108 @@
+"""
+Fusión de rankings para la búsqueda híbrida
+============================================
+
+Combina listas de resultados de varias fuentes (vectorial, léxica, ...)
+en un solo ranking. Métodos disponibles:
+
+- `rrf`    : Reciprocal Rank Fusion, w / (k + rango). Solo usa posiciones,
+             así que no depende de la escala de cada fuente.
+- `minmax` : puntajes normalizados a [0, 1] por fuente y sumados con pesos
+- `zscore` : puntajes estandarizados por fuente, llevados a (0, 1) con una
+             logística y sumados con pesos
+
+Una fuente que no devolvió un chunk aporta 0 a ese chunk. Cada resultado
+fusionado lleva `fused_score` y `contributions` (aporte de cada fuente).
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+FUSION_METHODS = ("rrf", "minmax", "zscore")
+
+# Campo de puntaje "crudo" de cada fuente (el resto usa `score`)
+SCORE_FIELDS = {"semantic": "score", "lexical": "bm25"}
+
+
+def _source_scores(items: Sequence[Dict], source: str) -> np.ndarray:
+    field = SCORE_FIELDS.get(source, "score")
+    return np.array([float(it.get(field) if it.get(field) is not None else it.get("score", 0.0))
+                     for it in items], dtype=np.float64)
+
+
+def _normalize(scores: np.ndarray, method: str) -> np.ndarray:
+    if method == "minmax":
+        lo, hi = scores.min(), scores.max()
+        return (scores - lo) / (hi - lo) if hi > lo else np.ones_like(scores)
+    # zscore -> (0, 1): logística 1.702·z ~ CDF normal
+    std = scores.std()
+    z = (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+    return 1.0 / (1.0 + np.exp(-1.702 * z))
+
+
+def fuse(results: Dict[str, List[Dict]], method: str = "rrf",
+         weights: Optional[Dict[str, float]] = None, rrf_k: int = 60,
+         limit: Optional[int] = None) -> List[Dict]:
+    """
+    Fusionar resultados por `chunk_id`
+
+    Args:
+        results: {fuente: lista ordenada de mejor a peor}
+        method: Uno de FUSION_METHODS
+        weights: Peso por fuente (1.0 por defecto)
+        rrf_k: Constante de RRF (amortigua el peso de los primeros rangos)
+        limit: Máximo de resultados a retornar
+
+    Returns:
+        Lista ordenada por `fused_score`. Si un chunk aparece en varias fuentes
+        se conserva el dict de la primera fuente y `search_type` = "hybrid".
+    """
+    method = (method or "rrf").lower()
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Método de fusión desconocido: {method}. Opciones: {', '.join(FUSION_METHODS)}")
+    weights = weights or {}
+    sources = [s for s, items in results.items() if items]
+    if not sources:
+        return []
+
+    # Unión de chunks y matriz de aportes (chunks x fuentes)
+    position: Dict[str, int] = {}
+    items: List[Dict] = []
+    found_in: List[List[str]] = []
+    rows, cols, values = [], [], []
+    for j, source in enumerate(sources):
+        ranked = results[source]
+        if method == "rrf":
+            contrib = 1.0 / (rrf_k + np.arange(1, len(ranked) + 1, dtype=np.float64))
+        else:
+            contrib = _normalize(_source_scores(ranked, source), method)
+        contrib *= float(weights.get(source, 1.0))
+        for item, value in zip(ranked, contrib):
+            cid = item["chunk_id"]
+            i = position.get(cid)
+            if i is None:
+                i = position[cid] = len(items)
+                items.append(item)
+                found_in.append([])
+            elif source in found_in[i]:
+                continue  # duplicado dentro de la misma fuente: vale el mejor rango
+            found_in[i].append(source)
+            rows.append(i)
+            cols.append(j)
+            values.append(value)
+
+    matrix = np.zeros((len(items), len(sources)), dtype=np.float64)
+    matrix[rows, cols] = values
+    fused_scores = matrix.sum(axis=1)
+    order = np.argsort(-fused_scores, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+
+    fused = []
+    for i in order:
+        item = items[i]
+        item["fused_score"] = float(fused_scores[i])
+        item["contributions"] = {s: float(matrix[i, j]) for j, s in enumerate(sources)}
+        item["search_type"] = found_in[i][0] if len(found_in[i]) == 1 else "hybrid"
+        fused.append(item)
+    return fused
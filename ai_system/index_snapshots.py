@@ -0,0 +1,211 @@
+"""
+Snapshots versionados del índice documental
+============================================
+
+Cada versión vive en su propio directorio, inmutable una vez publicado:
+
+    database/index_snapshots/
+        CURRENT                      <- nombre de la versión activa (puntero)
+        v20261016T183000-0001/
+            faiss_index.bin          <- índice FAISS
+            faiss_index.json         <- manifiesto del índice (ann_index)
+            metas.jsonl, metas_store/
+            manifest.json            <- versión, origen, filas, fecha
+
+Una reconstrucción escribe en `.staging-<versión>/`, lo renombra a su
+directorio final y luego reemplaza `CURRENT` con `os.replace` (atómico).
+
+En memoria, `IndexSnapshot` lleva un contador de referencias: las búsquedas
+en curso terminan sobre la versión que tomaron, las nuevas usan la nueva, y
+la vieja se libera (munmap) cuando su contador llega a cero.
+"""
+
+import os
+import json
+import shutil
+import itertools
+import threading
+import faiss
+import numpy as np
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from .config import FAISS_MMAP, FAISS_NPROBE, FAISS_EF_SEARCH
+from .ann_index import load_index, read_manifest, apply_search_params, write_index
+from .meta_store import MetaStore
+
+# Secuencia del proceso, no de cada SnapshotManager: cada ingesta crea el suyo y dos
+# en el mismo segundo repetían la versión
+_VERSION_SEQ = itertools.count(1)
+
+INDEX_FILENAME = "faiss_index.bin"
+POINTER_FILENAME = "CURRENT"
+LEGACY_VERSION = "legacy"
+
+
+class IndexSnapshot:
+    """
+    Par (índice FAISS, metadatos) de una versión, con contador de referencias
+    """
+
+    def __init__(self, version: str, index_path: str, db_path: str,
+                 mmap: bool = FAISS_MMAP, index: faiss.Index = None, metas: MetaStore = None,
+                 index_manifest: Dict = None):
+        self.version = version
+        self.index_path = index_path
+        self.db_path = db_path
+        if index is None:
+            index, self.index_mmapped = load_index(index_path, mmap=mmap)
+        else:
+            self.index_mmapped = False
+        self.index = index
+        self.index_manifest = index_manifest if index_manifest is not None else read_manifest(index_path)
+        self.search_params = apply_search_params(self.index, self.index_manifest,
+                                                 nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH)
+        self.metas = metas if metas is not None else MetaStore.open(os.path.dirname(index_path), db_path)
+        # Índices de la ingesta incremental devuelven rowids de fts_chunks, no posiciones
+        self.id_map = bool(self.index_manifest.get("id_map"))
+
+        self.refcount = 0
+        self.retired = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> "IndexSnapshot":
+        with self._lock:
+            self.refcount += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self.refcount -= 1
+            reclaim = self.retired and self.refcount == 0
+        if reclaim:
+            self._close()
+
+    def retire(self):
+        """Marcar como reemplazado; se libera al soltar la última referencia"""
+        with self._lock:
+            self.retired = True
+            reclaim = self.refcount == 0
+        if reclaim:
+            self._close()
+
+    def _close(self):
+        self.index = None
+        self.metas = None
+        print(f"♻️ Snapshot de índice {self.version} liberado")
+
+    def selector_ids(self, positions: np.ndarray) -> np.ndarray:
+        """Ids que entiende el índice para un conjunto de posiciones del MetaStore"""
+        return np.asarray(self.metas.rowids)[positions] if self.id_map else positions
+
+    def to_positions(self, ids: np.ndarray) -> np.ndarray:
+        """Resultado de index.search -> posiciones del MetaStore (-1 se conserva)"""
+        return self.metas.positions_of(ids) if self.id_map else ids
+
+    def writable_copy(self) -> "IndexSnapshot":
+        """Copia propia (no mapeada) de índice y metadatos para crear una versión nueva"""
+        if self.index_mmapped:
+            index, _ = load_index(self.index_path, mmap=False)
+        else:
+            index = faiss.clone_index(self.index)
+        return IndexSnapshot(None, self.index_path, self.db_path, index=index,
+                             metas=self.metas.copy(), index_manifest=dict(self.index_manifest))
+
+    def save(self, index_path: str):
+        """Escribir índice, manifiesto del índice y metadatos en el directorio de index_path"""
+        write_index(self.index, index_path, self.index_manifest)
+        self.metas.write_jsonl(os.path.join(os.path.dirname(index_path), "metas.jsonl"))
+        self.index_path = index_path
+
+    def describe(self) -> Dict:
+        return {
+            "version": self.version,
+            "index_type": self.index_manifest.get("index_type", "flat"),
+            "vectors": self.index.ntotal if self.index is not None else 0,
+            "search_params": self.search_params,
+            "index_mmap": self.index_mmapped,
+            "refcount": self.refcount,
+        }
+
+
+class SnapshotManager:
+    """
+    Directorios de versiones + puntero CURRENT en disco
+    """
+
+    def __init__(self, root: str, keep: int = 2):
+        self.root = root
+        self.keep = max(1, keep)
+
+    @property
+    def pointer_path(self) -> str:
+        return os.path.join(self.root, POINTER_FILENAME)
+
+    def path_for(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def index_path(self, version: str) -> str:
+        return os.path.join(self.path_for(version), INDEX_FILENAME)
+
+    def current_version(self) -> Optional[str]:
+        """Versión publicada, o None si no hay snapshots"""
+        try:
+            with open(self.pointer_path, "r", encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version if version and os.path.isdir(self.path_for(version)) else None
+
+    def pointer_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.pointer_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def new_version(self) -> str:
+        return f"v{datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{next(_VERSION_SEQ):04d}"
+
+    def stage(self, version: str) -> str:
+        """Directorio temporal donde se construye la versión"""
+        staging = os.path.join(self.root, f".staging-{version}")
+        os.makedirs(staging, exist_ok=True)
+        return staging
+
+    def commit(self, version: str, source: str, extra: Dict = None) -> str:
+        """Mover staging a su directorio final, escribir manifest.json y publicar"""
+        staging = os.path.join(self.root, f".staging-{version}")
+        final = self.path_for(version)
+        index_manifest = read_manifest(os.path.join(staging, INDEX_FILENAME))
+        manifest = {
+            "version": version,
+            "source": source,
+            "created_at": datetime.now().isoformat(),
+            "index": index_manifest,
+            **(extra or {}),
+        }
+        with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.rename(staging, final)
+        self.publish(version)
+        return final
+
+    def publish(self, version: str):
+        """Swap atómico del puntero CURRENT"""
+        tmp = f"{self.pointer_path}.tmp.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp, self.pointer_path)
+        print(f"🔀 Snapshot de índice publicado: {version}")
+
+    def prune(self, in_use: Iterable[str] = ()):
+        """
+        Borrar versiones viejas (se conservan `keep` más las que estén en uso).
+        Procesos que aún mapean archivos borrados siguen leyendo el inode.
+        """
+        protected = set(in_use) | {self.current_version()}
+        versions = sorted(v for v in os.listdir(self.root)
+                          if v.startswith("v") and os.path.isdir(self.path_for(v)))
+        for version in versions[:-self.keep]:
+            if version not in protected:
+                shutil.rmtree(self.path_for(version), ignore_errors=True)
+                print(f"🧹 Snapshot de índice eliminado: {version}")
@@ -0,0 +1,663 @@
+"""
+Ingesta incremental de los tomos en data/
+==========================================
+
+`build_index.main` reconstruye todo en cada corrida. Esta ingesta compara
+cada corrida contra un manifiesto y solo toca lo que cambió:
+
+- `ingest_files`: por archivo, SHA-256 del contenido, tamaño y mtime
+- `chunks_meta`: por chunk, rowid en `fts_chunks` (chunk_id) y hash del texto
+
+Un archivo con el mismo hash se salta sin leer sus chunks. En un archivo
+modificado se comparan los hashes de sus chunks: los que siguen iguales
+conservan su rowid y su vector, los que desaparecieron se borran de
+`fts_chunks`, `citation_index`, `term_index` y del índice FAISS, y solo los
+nuevos se embeben (con el almacén por hash de contenido) y se insertan.
+
+Los archivos se leen en streaming (`chunker.iter_file_legal_chunks`: chunks
+alineados a TOMO/CAPÍTULO/REGLA de hasta CHUNK_TOKENS tokens) y los chunks
+nuevos pasan por lotes de INGEST_BATCH_SIZE a embeddings e INSERT: la
+memoria no depende del tamaño de los tomos ni del corpus (de cada chunk
+solo se retienen su vector y sus metadatos para el índice).
+
+Todo el cambio en SQLite va en una sola transacción, que se abre recién
+cuando los chunks nuevos ya están embebidos: la app no espera a la API de
+embeddings para escribir. El índice FAISS está
+direccionado por rowid (ver `ann_index`), así que borrar y agregar no
+requiere reconstruir; la versión nueva se publica como snapshot y los
+procesos que sirven la toman sin reiniciar.
+
+Los near-duplicados (DEDUP_THRESHOLD, ver `dedup`) no se embeben ni se
+insertan en `fts_chunks`: quedan en `chunk_aliases` apuntando al chunk
+canónico, con su documento, offsets y páginas. Si un canónico se borra, los
+documentos con alias suyos se reevalúan en la misma corrida.
+
+Con `--workers N` los archivos se reparten a un pool de procesos (chunking,
+metadatos y diff), los embeddings corren en `--embed_workers` hilos y un
+único escritor inserta en SQLite; al final se reporta el throughput.
+
+La primera corrida (sin manifiesto), un índice anterior sin ids o `--full`
+reconstruyen desde cero: carga masiva (executemany, rowids explícitos, sin
+merges FTS5 hasta el final) en una BD temporal que reemplaza a la publicada
+con un rename atómico (`db.bulk_build`).
+
+    python -m ai_system.ingest --data_dir data
+"""
+
+import os
+import glob
+import json
+import shutil
+import hashlib
+import time
+import argparse
+import numpy as np
+import faiss
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+from .config import (
+    AZURE_OPENAI_KEY, AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH, FAISS_PATH, FAISS_INDEX_TYPE, FAISS_PCA_DIM,
+    CHUNK_EMBED_STORE_DIR, CHUNK_TOKENS, CHUNK_OVERLAP, INDEX_SNAPSHOT_DIR, INDEX_SNAPSHOT_KEEP, INGEST_BATCH_SIZE,
+    INGEST_WORKERS, INGEST_EMBED_WORKERS, DEDUP_THRESHOLD
+)
+from .db import (
+    get_conn, bulk_build, bulk_upsert_chunks, content_hash, fts_defer_merges, fts_optimize, next_rowid,
+    reserve_rowids, FTS_TOKENIZER
+)
+from .chunker import CHUNKER_VERSION, LegalChunk, iter_file_legal_chunks
+from .tokenizer import count_tokens, tokenizer_name
+from .ann_index import ID_MAP_TYPES, build_index, update_ids
+from .citations import CITATION_SCHEMA, index_chunk, build_citation_index
+from .term_index import TERM_SCHEMA, index_chunk_terms, build_term_index
+from .index_snapshots import IndexSnapshot, SnapshotManager, INDEX_FILENAME, LEGACY_VERSION
+from .meta_store import MetaStore
+from .dedup import DEDUP_SCHEMA, NearDuplicateIndex, minhash
+
+# Firma del chunking: si cambia, la próxima ingesta reconstruye desde cero
+CHUNKING = f"{CHUNKER_VERSION}:{tokenizer_name()}:{CHUNK_TOKENS}:{CHUNK_OVERLAP}:dedup{DEDUP_THRESHOLD:g}"
+
+INGEST_SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS fts_chunks USING fts5(
+    content, tomo, capitulo, articulo, tipo_seccion, fuente,
+    tokenize = '{FTS_TOKENIZER}'
+);
+CREATE TABLE IF NOT EXISTS chunks_meta (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT,
+    page_start INTEGER,
+    page_end INTEGER,
+    heading_path TEXT,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chunks_meta_doc ON chunks_meta(doc_id);
+CREATE TABLE IF NOT EXISTS ingest_files (
+    doc_id TEXT PRIMARY KEY,     -- nombre del archivo en data/
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    chunks INTEGER NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+def file_digest(path: str) -> Dict:
+    """SHA-256, tamaño y mtime de un archivo fuente"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    st = os.stat(path)
+    return {"sha256": h.hexdigest(), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def chunk_metadata(doc_id: str, chunk: LegalChunk) -> Dict:
+    """
+    Columnas de fts_chunks para un chunk (mismo formato que el índice existente:
+    tomo/fuente = nombre del archivo); capítulo, regla y ruta vienen del chunker
+    """
+    stem = os.path.splitext(doc_id)[0]
+    return {
+        "tomo": stem,
+        "capitulo": chunk.capitulo,
+        "articulo": chunk.articulo,
+        "tipo_seccion": "general",
+        "fuente": stem,
+        "doc_id": doc_id,
+        "heading_path": chunk.heading_path,
+        "page_start": chunk.page_start,
+        "page_end": chunk.page_end,
+        "n_tokens": chunk.n_tokens,
+    }
+
+
+def iter_chunks(path: str) -> Iterator[Dict]:
+    """Chunks estructurales de un archivo (leído en streaming) con hash, offsets y metadatos"""
+    doc_id = os.path.basename(path)
+    for c in iter_file_legal_chunks(path, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP,
+                                    count_tokens=count_tokens):
+        yield {"text": c.text, "hash": content_hash(c.text), "start": c.start, "end": c.end,
+               **chunk_metadata(doc_id, c)}
+
+
+class ChunkDiff:
+    """
+    Emparejar los chunks de un archivo contra los existentes por hash (multiconjunto)
+
+    `existing` son filas {"rowid", "hash"} (chunks indexados) o {"alias", "hash"}
+    (duplicados registrados en chunk_aliases). `new(chunks)` deja pasar solo los
+    chunks sin pareja; al agotarse, `stale` son las filas que ya no aparecen.
+    """
+
+    def __init__(self, existing: List[Dict]):
+        self.pool: Dict[str, List[Dict]] = {}
+        for row in existing:
+            self.pool.setdefault(row["hash"], []).append(row)
+        self.seen = 0
+
+    def new(self, chunks: Iterable[Dict]) -> Iterator[Dict]:
+        for c in chunks:
+            self.seen += 1
+            rows = self.pool.get(c["hash"])
+            if rows:
+                rows.pop()
+            else:
+                yield c
+
+    @property
+    def stale(self) -> List[Dict]:
+        return [r for rows in self.pool.values() for r in rows]
+
+
+class Deduper:
+    """
+    Near-duplicados de una corrida, en el proceso principal (el orden importa:
+    el primer chunk de un pasaje queda como canónico y los siguientes son alias).
+
+    El LSH parte de los canónicos ya indexados (chunk_minhash); los nuevos
+    canónicos entran con una clave provisional que write_batch resuelve a su
+    rowid. `mark` agrega a cada chunk `canonical`/`similarity` si es duplicado,
+    o `key` si es canónico nuevo.
+    """
+
+    def __init__(self, lsh: Optional[NearDuplicateIndex]):
+        self.lsh = lsh
+        self.resolved: Dict[tuple, int] = {}
+        self.aliased = 0
+        self._seq = 0
+
+    def forget(self, rowids: Iterable[int]):
+        """Canónicos que se van a borrar: ya no pueden recibir alias"""
+        if self.lsh is not None:
+            for rowid in rowids:
+                self.lsh.remove(rowid)
+
+    def mark(self, chunks: Iterable[Dict]) -> Iterator[Dict]:
+        for c in chunks:
+            if self.lsh is not None:
+                if "minhash" not in c:
+                    c["minhash"] = minhash(c["text"])
+                if c["minhash"] is not None:
+                    hit = self.lsh.query(c["minhash"])
+                    if hit:
+                        c["canonical"], c["similarity"] = hit
+                        self.aliased += 1
+                    else:
+                        self._seq += 1
+                        c["key"] = ("new", self._seq)
+                        self.lsh.add(c["key"], c["minhash"])
+            yield c
+
+    def rowid_of(self, key) -> int:
+        return self.resolved[key] if isinstance(key, tuple) else int(key)
+
+
+def _diff_file(path: str, existing: List[Dict]):
+    """Tarea del pool de procesos: chunking, metadatos y diff por hash de un archivo"""
+    t0 = time.perf_counter()
+    diff = ChunkDiff(existing)
+    new = list(diff.new(iter_chunks(path)))
+    if DEDUP_THRESHOLD > 0:
+        for c in new:
+            c["minhash"] = minhash(c["text"])
+    return new, diff.stale, diff.seen, time.perf_counter() - t0
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Lotes de a lo sumo `size` elementos (el pipeline nunca retiene más de un lote de texto)"""
+    it = iter(items)
+    while True:
+        batch = list(islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def make_embedder(kind: str):
+    """Función lista de textos -> embeddings normalizados, con el almacén por hash de contenido"""
+    if kind == "local":
+        from .local_embeddings import LocalEmbeddings
+        from .embedding_store import ChunkEmbeddingStore
+        embedder = LocalEmbeddings()
+        store = ChunkEmbeddingStore(CHUNK_EMBED_STORE_DIR, embedder.model_name) if CHUNK_EMBED_STORE_DIR else None
+
+        def embed(texts):
+            return store.embed(texts, embedder.encode_texts) if store else embedder.encode_texts(texts)
+        return embed
+
+    from .build_index import embed_texts
+    from .embedding_store import ChunkEmbeddingStore
+    # Un solo almacén compartido: los hilos de embeddings no escriben en paralelo
+    store = ChunkEmbeddingStore(CHUNK_EMBED_STORE_DIR, AZURE_OPENAI_EMBEDDING_DEPLOYMENT) \
+        if CHUNK_EMBED_STORE_DIR else None
+    return lambda texts: embed_texts(texts, store_dir="", store=store)
+
+
+def _delete_chunks(con, rowids: List[int]):
+    for start in range(0, len(rowids), 900):
+        part = rowids[start:start + 900]
+        qmarks = ",".join("?" * len(part))
+        con.execute(f"DELETE FROM fts_chunks WHERE rowid IN ({qmarks})", part)
+        con.execute(f"DELETE FROM chunks_meta WHERE chunk_id IN ({qmarks})", [str(r) for r in part])
+        con.execute(f"DELETE FROM citation_index WHERE chunk_id IN ({qmarks})", part)
+        con.execute(f"DELETE FROM term_index WHERE chunk_id IN ({qmarks})", part)
+        con.execute(f"DELETE FROM chunk_minhash WHERE chunk_id IN ({qmarks})", part)
+        con.execute(f"DELETE FROM chunk_aliases WHERE canonical_id IN ({qmarks})", part)
+
+
+def _existing_rows(con, doc_id: str) -> List[Dict]:
+    """Chunks indexados y alias del documento, para ChunkDiff"""
+    rows = [{"rowid": int(r["chunk_id"]), "hash": r["hash"]} for r in con.execute(
+        "SELECT chunk_id, hash FROM chunks_meta WHERE doc_id = ?", (doc_id,)).fetchall()]
+    return rows + [{"alias": r[0], "hash": r[1]} for r in con.execute(
+        "SELECT rowid, hash FROM chunk_aliases WHERE doc_id = ?", (doc_id,)).fetchall()]
+
+
+def _insert_aliases(con, aliases: List[Dict], rowid_of):
+    con.executemany("""INSERT INTO chunk_aliases(doc_id, hash, start, end, heading_path, page_start, page_end,
+                                                 canonical_id, similarity)
+                       VALUES(?,?,?,?,?,?,?,?,?)""",
+                    [(c["doc_id"], c["hash"], c["start"], c["end"], c["heading_path"], c["page_start"],
+                      c["page_end"], rowid_of(c["canonical"]), round(c["similarity"], 4)) for c in aliases])
+
+
+def _orphan_aliases(con, canonical_ids: List[int]) -> Dict[str, List[Dict]]:
+    """Alias guardados de canónicos que se borran, por documento (hay que reevaluarlos)"""
+    found: Dict[str, List[Dict]] = {}
+    for start in range(0, len(canonical_ids), 900):
+        part = canonical_ids[start:start + 900]
+        for r in con.execute(f"SELECT rowid, doc_id, hash FROM chunk_aliases WHERE canonical_id IN "
+                             f"({','.join('?' * len(part))})", part):
+            found.setdefault(r[1], []).append({"alias": r[0], "hash": r[2]})
+    return found
+
+
+def _insert_chunks(con, batch: List[Dict], first_rowid: int, index_terms: bool = True) -> np.ndarray:
+    """
+    Insertar un lote con rowids explícitos (first_rowid, first_rowid + 1, ...):
+    executemany en vez de un INSERT por chunk. Con index_terms=False las citas y
+    términos se construyen al final en bloque (reconstrucción completa)
+    """
+    rowids = np.arange(first_rowid, first_rowid + len(batch), dtype=np.int64)
+    bulk_upsert_chunks(con, batch, first_rowid)
+    if index_terms:
+        for r, c in zip(rowids, batch):
+            index_chunk(con, int(r), c["text"], c["tomo"])
+            index_chunk_terms(con, int(r), c["text"], c["tomo"])
+    return rowids
+
+
+def _published_chunking(snapshots: SnapshotManager, version: str) -> Optional[str]:
+    try:
+        with open(os.path.join(snapshots.path_for(version), "manifest.json"), "r", encoding="utf-8") as f:
+            return json.load(f).get("chunking")
+    except (OSError, ValueError):
+        return None
+
+
+def _current_snapshot(snapshots: SnapshotManager, faiss_path: str, db_path: str) -> Optional[IndexSnapshot]:
+    version = snapshots.current_version()
+    try:
+        if version:
+            return IndexSnapshot(version, snapshots.index_path(version), db_path, mmap=False)
+        if os.path.exists(faiss_path):
+            return IndexSnapshot(LEGACY_VERSION, faiss_path, db_path, mmap=False)
+    except Exception as e:
+        print(f"⚠️ No se pudo abrir el índice actual ({e})")
+    return None
+
+
+def ingest(data_dir: str, db_path: str = DB_PATH, snapshot_dir: str = INDEX_SNAPSHOT_DIR,
+           faiss_path: str = FAISS_PATH, index_type: str = FAISS_INDEX_TYPE, full: bool = False,
+           in_place: bool = False, embedder: str = None, workers: int = INGEST_WORKERS, embed_workers: int = INGEST_EMBED_WORKERS,
+           **index_params) -> Dict:
+    """
+    Sincronizar fts_chunks + índice FAISS con los .txt de data_dir
+
+    Args:
+        full: Reconstruir desde cero
+        in_place: Con `full`, reescribir las tablas de chunks en la BD publicada a través del
+            escritor del pool en vez de reemplazar el archivo (para procesos que sirven: no se
+            pierden las escrituras de la app ni el WAL)
+        workers: Procesos para chunking/metadatos (1 = streaming en un hilo, 0 = todos los núcleos)
+        embed_workers: Hilos que calculan embeddings en paralelo (con workers > 1)
+
+    Returns:
+        Resumen: archivos cambiados/borrados, chunks agregados/borrados, versión publicada
+    """
+    embed = make_embedder(embedder or ("azure" if AZURE_OPENAI_KEY else "local"))
+    snapshots = SnapshotManager(snapshot_dir, keep=INDEX_SNAPSHOT_KEEP)
+
+    with get_conn(db_path) as con:
+        con.executescript(INGEST_SCHEMA + CITATION_SCHEMA + TERM_SCHEMA + DEDUP_SCHEMA)
+        manifest = {r["doc_id"]: dict(r) for r in con.execute("SELECT * FROM ingest_files").fetchall()}
+
+    current = None if full else _current_snapshot(snapshots, faiss_path, db_path)
+    if not manifest or current is None or not current.id_map:
+        if not full:
+            print("ℹ️ Sin manifiesto de ingesta o índice sin ids: reconstrucción completa")
+        full, manifest, current = True, {}, None
+    elif _published_chunking(snapshots, current.version) != CHUNKING:
+        # Otro chunker u otro presupuesto de tokens: los chunks existentes no son comparables
+        print(f"ℹ️ Cambió la configuración de chunking ({CHUNKING}): reconstrucción completa")
+        full, manifest, current = True, {}, None
+
+    # 1. Diff de archivos contra el manifiesto (hash del contenido, no mtime)
+    paths = {os.path.basename(p): p for p in sorted(glob.glob(os.path.join(data_dir, "*.txt")))}
+    digests = {doc_id: file_digest(p) for doc_id, p in paths.items()}
+    changed = [d for d in paths if d not in manifest or manifest[d]["sha256"] != digests[d]["sha256"]]
+    removed = [d for d in manifest if d not in paths]
+    if not changed and not removed:
+        print("✅ Sin cambios en los tomos")
+        return {"changed": [], "removed": [], "added": 0, "deleted": 0, "aliased": 0, "version": None}
+
+    version = snapshots.new_version()
+    staging = snapshots.stage(version)
+    stale: List[int] = []
+    gone_aliases: set = set()
+    orphaned: List[str] = []
+    ids: List[np.ndarray] = []
+    vectors: List[np.ndarray] = []
+    new_rows: List[Dict] = []
+    timing = {"chunk_s": 0.0, "embed_s": 0.0, "write_s": 0.0}
+    next_id = [1]
+    deduper = Deduper(None)
+    workers = workers or os.cpu_count() or 1
+    t_start = time.perf_counter()
+    # Operaciones de escritura en orden: ("batch", lote, X, embed_s), ("file", doc_id, stale, seen),
+    # ("removed", doc_id), ("drop_aliases", rowids). Se planifican (chunking, diff, embeddings)
+    # sin tomar el escritor y se aplican después en una sola transacción corta; la carga masiva
+    # en una BD temporal (nadie más escribe en ella) las aplica a medida que llegan
+    ops: List[tuple] = []
+    sink = [ops.append]
+
+    def emit(op: tuple):
+        sink[0](op)
+
+    def existing_of(doc_id: str) -> List[Dict]:
+        if full:
+            return []
+        with get_conn(db_path, readonly=True) as rc:
+            return _existing_rows(rc, doc_id)
+
+    def embed_batch(batch: List[Dict]):
+        # Los alias (near-duplicados) no se embeben: comparten el vector del canónico
+        t0 = time.perf_counter()
+        texts = [c["text"] for c in batch if "canonical" not in c]
+        X = None
+        if texts:
+            X = np.asarray(embed(texts), dtype=np.float32)
+            faiss.normalize_L2(X)
+        return batch, X, time.perf_counter() - t0
+
+    def write_batch(con, batch: List[Dict], X: Optional[np.ndarray], embed_s: float):
+        # Único escritor: los lotes ya embebidos se insertan aquí, en orden
+        t0 = time.perf_counter()
+        canon = [c for c in batch if "canonical" not in c]
+        if canon:
+            if current is not None and X.shape[1] != current.index.d:
+                raise ValueError(f"Embeddings de {X.shape[1]} dims y el índice tiene {current.index.d}: usar --full")
+            batch_ids = _insert_chunks(con, canon, next_id[0], index_terms=not full)
+            next_id[0] += len(canon)
+            ids.append(batch_ids)
+            vectors.append(X)
+            for i, c in zip(batch_ids, canon):
+                if "key" in c:
+                    deduper.resolved[c["key"]] = int(i)
+            con.executemany("INSERT OR REPLACE INTO chunk_minhash(chunk_id, sig) VALUES(?, ?)",
+                            [(int(i), c["minhash"].tobytes()) for i, c in zip(batch_ids, canon)
+                             if c.get("minhash") is not None])
+            new_rows.extend({"rowid": int(i), "chunk_id": str(int(i)),
+                             **{k: v for k, v in c.items() if k not in ("text", "minhash", "key")}}
+                            for i, c in zip(batch_ids, canon))
+        # Canónico antes que sus alias: en el mismo lote o en uno anterior
+        _insert_aliases(con, [c for c in batch if "canonical" in c], deduper.rowid_of)
+        timing["embed_s"] += embed_s
+        timing["write_s"] += time.perf_counter() - t0
+
+    def drop_aliases(con, rowids: List[int]):
+        for start in range(0, len(rowids), 900):
+            part = rowids[start:start + 900]
+            con.execute(f"DELETE FROM chunk_aliases WHERE rowid IN ({','.join('?' * len(part))})", part)
+
+    def finish_file(con, doc_id: str, doc_stale: List[Dict], seen: int):
+        drop_aliases(con, [r["alias"] for r in doc_stale if "alias" in r])
+        d = digests[doc_id]
+        con.execute("""INSERT OR REPLACE INTO ingest_files(doc_id, sha256, size, mtime_ns, chunks)
+                       VALUES(?,?,?,?,?)""", (doc_id, d["sha256"], d["size"], d["mtime_ns"], seen))
+
+    def apply(con, op: tuple):
+        kind, *args = op
+        if kind == "batch":
+            write_batch(con, *args)
+        elif kind == "file":
+            finish_file(con, *args)
+        elif kind == "removed":
+            con.execute("DELETE FROM chunk_aliases WHERE doc_id = ?", args)
+            con.execute("DELETE FROM ingest_files WHERE doc_id = ?", args)
+        else:
+            drop_aliases(con, *args)
+
+    def plan_file(doc_id: str, doc_stale: List[Dict], seen: int):
+        rowids = [r["rowid"] for r in doc_stale if "rowid" in r]
+        stale.extend(rowids)
+        deduper.forget(rowids)
+        gone_aliases.update(r["alias"] for r in doc_stale if "alias" in r)
+        emit(("file", doc_id, doc_stale, seen))
+
+    def process_stream(doc_id: str):
+        # Camino secuencial: archivo -> diff -> near-duplicados -> lotes, en streaming
+        t0 = time.perf_counter()
+        existing = existing_of(doc_id)
+        if existing and deduper.lsh is not None:
+            # Pasada previa solo con hashes: los chunks que desaparecen no deben recibir alias
+            pre = ChunkDiff(existing)
+            for _ in pre.new(iter_chunks(paths[doc_id])):
+                pass
+            deduper.forget(r["rowid"] for r in pre.stale if "rowid" in r)
+        diff = ChunkDiff(existing)
+        for batch in batched(deduper.mark(diff.new(iter_chunks(paths[doc_id]))), INGEST_BATCH_SIZE):
+            timing["chunk_s"] += time.perf_counter() - t0
+            emit(("batch", *embed_batch(batch)))
+            t0 = time.perf_counter()
+        timing["chunk_s"] += time.perf_counter() - t0
+        plan_file(doc_id, diff.stale, diff.seen)
+
+    def reassign_orphans():
+        # Alias cuyo canónico se borra: sus chunks pasan a alias de otro canónico o a
+        # canónicos nuevos. Pueden ser de esta corrida (todavía sin escribir) o de
+        # corridas anteriores (guardados en chunk_aliases)
+        gone = set(stale)
+        redo = []
+        for op in ops:
+            if op[0] != "batch":
+                continue
+            kept = []
+            for c in op[1]:
+                if "canonical" in c and not isinstance(c["canonical"], tuple) and int(c["canonical"]) in gone:
+                    del c["canonical"], c["similarity"]
+                    deduper.aliased -= 1
+                    redo.append(c)
+                else:
+                    kept.append(c)
+            op[1][:] = kept
+        with get_conn(db_path, readonly=True) as rc:
+            saved = _orphan_aliases(rc, stale)
+        for doc_id, rows in sorted(saved.items()):
+            rows = [r for r in rows if r["alias"] not in gone_aliases]
+            if not rows or doc_id not in paths:
+                continue
+            orphaned.append(doc_id)
+            emit(("drop_aliases", [r["alias"] for r in rows]))
+            # Solo los chunks que eran esos alias (mismo hash); el resto del archivo no cambia
+            wanted = ChunkDiff(rows).pool
+            for c in iter_chunks(paths[doc_id]):
+                if wanted.get(c["hash"]):
+                    wanted[c["hash"]].pop()
+                    redo.append(c)
+        for batch in batched(deduper.mark(redo), INGEST_BATCH_SIZE):
+            emit(("batch", *embed_batch(batch)))
+
+    def plan():
+        if DEDUP_THRESHOLD > 0:
+            if full:
+                deduper.lsh = NearDuplicateIndex(DEDUP_THRESHOLD)
+            else:
+                with get_conn(db_path, readonly=True) as rc:
+                    deduper.lsh = NearDuplicateIndex.load(rc, DEDUP_THRESHOLD)
+        for doc_id in removed:
+            rowids = [r["rowid"] for r in existing_of(doc_id) if "rowid" in r]
+            stale.extend(rowids)
+            deduper.forget(rowids)
+            emit(("removed", doc_id))
+
+        if workers <= 1:
+            for doc_id in changed:
+                process_stream(doc_id)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as procs, \
+                    ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="ingest-embed") as threads:
+                files = {procs.submit(_diff_file, paths[d], existing_of(d)): d for d in changed}
+                inflight = deque()
+                for fut in as_completed(files):
+                    new, doc_stale, seen, chunk_s = fut.result()
+                    timing["chunk_s"] += chunk_s
+                    plan_file(files[fut], doc_stale, seen)
+                    for batch in batched(deduper.mark(new), INGEST_BATCH_SIZE):
+                        inflight.append(threads.submit(embed_batch, batch))
+                        # Cola acotada: no acumular más lotes embebidos de los que se consumen
+                        while len(inflight) > 2 * embed_workers:
+                            emit(("batch", *inflight.popleft().result()))
+                while inflight:
+                    emit(("batch", *inflight.popleft().result()))
+
+        if stale and deduper.lsh is not None:
+            reassign_orphans()
+
+    def prepare(con):
+        # Antes de vaciar las tablas: una reconstrucción no reutiliza los rowids
+        # que los procesos que sirven todavía resuelven contra la BD nueva
+        next_id[0] = next_rowid(con)
+        if full:
+            for table in ("fts_chunks", "chunks_meta", "citation_index", "term_index", "ingest_files",
+                          "chunk_minhash", "chunk_aliases"):
+                con.execute(f"DELETE FROM {table}")
+            fts_defer_merges(con)
+
+    def finish(con):
+        reserve_rowids(con, next_id[0])
+        if full:
+            t0 = time.perf_counter()
+            fts_optimize(con)
+            print(f"📑 Índice de citas: {build_citation_index(con)} encabezados")
+            print(f"🏷️ Índice de códigos/términos: {build_term_index(con)} entradas")
+            timing["write_s"] += time.perf_counter() - t0
+        else:
+            _delete_chunks(con, stale)
+        print(f"📂 {len(changed)} archivos cambiados, {len(removed)} eliminados: "
+              f"+{len(new_rows)} / -{len(stale)} chunks, {deduper.aliased} near-duplicados como alias")
+
+        # 3. Índice: completo desde cero, o borrar/agregar por rowid sobre una copia
+        X = np.vstack(vectors) if vectors else None
+        all_ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        if full:
+            if X is None:
+                raise ValueError(f"No hay chunks para indexar en {data_dir}")
+            index_params.setdefault("pca_dim", FAISS_PCA_DIM)
+            index, index_manifest = build_index(X, index_type, ids=all_ids, **index_params)
+            metas = MetaStore.from_records(new_rows, db_path)
+        else:
+            index, index_manifest = current.index, dict(current.index_manifest)
+            removed_vectors = update_ids(index, np.array(stale, dtype=np.int64), X, all_ids)
+            print(f"🧹 Vectores borrados del índice: {removed_vectors}")
+            gone = set(stale)
+            kept = [i for i, r in enumerate(np.asarray(current.metas.rowids).tolist()) if r not in gone]
+            metas = MetaStore.from_records(current.metas.rows(kept) + new_rows, db_path)
+
+        snap = IndexSnapshot(version, os.path.join(staging, INDEX_FILENAME), db_path,
+                             index=index, metas=metas, index_manifest=index_manifest)
+        snap.save(os.path.join(staging, INDEX_FILENAME))
+        return metas
+
+    # 2. Pipeline: archivo -> chunks + metadatos + diff por hash -> lote -> embeddings -> INSERT.
+    #    workers=1: streaming en un hilo, solo un lote de texto en memoria hasta el escritor.
+    #    workers>1: un proceso por archivo para chunking/metadatos, hilos para embeddings.
+    #    Sobre la BD publicada (incremental): todo se planifica y embebe antes de tomar el
+    #    escritor, que se usa una sola vez, en una transacción sin llamadas a la API.
+    #    Completa: carga masiva en una BD temporal que reemplaza a la publicada al final
+    #    (db.bulk_build), aplicando los lotes a medida que llegan. Completa `in_place`: como
+    #    la incremental, vaciando y recargando solo las tablas de chunks en la transacción.
+    #    El snapshot se escribe antes del commit
+    try:
+        if full and not in_place:
+            with bulk_build(db_path) as con:
+                prepare(con)
+                sink[0] = lambda op: apply(con, op)
+                plan()
+                metas = finish(con)
+        else:
+            plan()
+            with get_conn(db_path) as con:
+                prepare(con)
+                for op in ops:
+                    apply(con, op)
+                metas = finish(con)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    # 4. Publicar: los procesos que sirven toman la versión nueva en el siguiente sondeo
+    snapshots.commit(version, source="ingest", extra={"chunking": CHUNKING, "rows": len(metas), "added": len(new_rows),
+                                                       "deleted": len(stale), "aliased": deduper.aliased,
+                                                       "full": full})
+    snapshots.prune()
+    total_s = time.perf_counter() - t_start
+    rate = sum(digests[d]["size"] for d in changed) / 1e6 / max(total_s, 1e-9)
+    print(f"✅ Ingesta {'completa' if full else 'incremental'}: {len(metas)} chunks en {version}")
+    print(f"⚡ {len(new_rows)} chunks nuevos en {total_s:.1f}s ({len(new_rows) / max(total_s, 1e-9):.1f} chunks/s, "
+          f"{rate:.2f} MB/s) | chunking {timing['chunk_s']:.1f}s · embeddings {timing['embed_s']:.1f}s · "
+          f"SQLite {timing['write_s']:.1f}s (suma por worker; workers={workers}, embed_workers={embed_workers})")
+    return {"changed": changed, "removed": removed, "added": len(new_rows), "deleted": len(stale),
+            "aliased": deduper.aliased, "orphaned": orphaned,
+            "version": version, "seconds": round(total_s, 2), **{k: round(v, 2) for k, v in timing.items()}}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Ingesta incremental de data/*.txt")
+    ap.add_argument("--data_dir", required=True)
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--snapshot_dir", default=INDEX_SNAPSHOT_DIR)
+    ap.add_argument("--full", action="store_true", help="Reconstruir desde cero")
+    ap.add_argument("--in_place", action="store_true",
+                    help="Con --full: reescribir las tablas de chunks en la BD publicada (sin reemplazar el archivo)")
+    ap.add_argument("--embedder", choices=("azure", "local"), help="Por defecto azure si hay clave")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS,
+                    help="Procesos de chunking (1 = secuencial, 0 = todos los núcleos)")
+    ap.add_argument("--embed_workers", type=int, default=INGEST_EMBED_WORKERS, help="Hilos de embeddings")
+    ap.add_argument("--index_type", default=FAISS_INDEX_TYPE, choices=ID_MAP_TYPES)
+    ap.add_argument("--pca_dim", type=int, default=FAISS_PCA_DIM, help="Reducir dimensiones con PCA (0 = no)")
+    args = ap.parse_args()
+    ingest(args.data_dir, db_path=args.db, snapshot_dir=args.snapshot_dir, full=args.full,
+           in_place=args.in_place, embedder=args.embedder, workers=args.workers, embed_workers=args.embed_workers,
+           index_type=args.index_type, pca_dim=args.pca_dim)
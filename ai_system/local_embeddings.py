@@ -41,6 +41,7 @@ import faiss
 from typing import List, Dict, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 import logging
+from .ann_index import build_index, write_index
 
 logger = logging.getLogger(__name__)
 
@@ -62,6 +63,7 @@ class LocalEmbeddings:
         self.cache_dir = cache_dir
         self.model = None
         self.index = None
+        self.index_manifest = None
         self.metadata = []
         self.dimension = 384  # Dimensión del modelo multilingual-e5-small
 
@@ -125,13 +127,16 @@ class LocalEmbeddings:
         return self.encode_texts([query], normalize_embeddings=True)
 
     def create_index(self, embeddings: np.ndarray,
-                    metadata: List[Dict] = None) -> faiss.Index:
+                    metadata: List[Dict] = None,
+                    index_type: str = "flat", **index_params) -> faiss.Index:
         """
         Crear índice FAISS desde embeddings
 
         Args:
             embeddings: Array de embeddings
             metadata: Lista de metadatos correspondiente
+            index_type: flat | hnsw | ivf_flat | ivf_pq | sq8 | fp16 | pq (ver ann_index.py)
+            **index_params: Parámetros del tipo de índice (nlist, nprobe, M, pca_dim, ...)
 
         Returns:
             Índice FAISS creado
@@ -140,8 +145,7 @@ class LocalEmbeddings:
             raise ValueError(f"Dimensión de embeddings {embeddings.shape[1]} no coincide con modelo {self.dimension}")
 
         # Crear índice FAISS con Inner Product (coseno si normalizamos)
-        self.index = faiss.IndexFlatIP(self.dimension)
-        self.index.add(embeddings)
+        self.index, self.index_manifest = build_index(embeddings, index_type, **index_params)
 
         # Guardar metadata si se proporciona
         if metadata:
@@ -233,8 +237,8 @@ class LocalEmbeddings:
         # Crear directorio si no existe
         os.makedirs(os.path.dirname(index_path), exist_ok=True)
 
-        # Guardar índice FAISS
-        faiss.write_index(self.index, index_path)
+        # Guardar índice FAISS (con manifiesto de tipo/parámetros)
+        write_index(self.index, index_path, self.index_manifest)
         logger.info(f"💾 Índice guardado en: {index_path}")
 
         # Guardar metadata si se especifica ruta
@@ -0,0 +1,337 @@
+"""
+Almacén columnar de metadatos para el índice FAISS
+===================================================
+
+Reemplaza la lista de dicts cargada desde `metas.jsonl`. Cada posición del
+índice FAISS corresponde a una fila con columnas de ancho fijo:
+
+- `rowid`: rowid del chunk en `fts_chunks` (de ahí se trae el texto bajo demanda)
+- una columna de códigos int32 por campo de metadatos (tomo, capitulo, ...),
+  codificada por diccionario contra un vocabulario compartido por columna
+
+- `n_tokens`: tokens de cada chunk medidos en la ingesta (0 = desconocido),
+  para armar el contexto contra un presupuesto sin volver a tokenizar
+
+El texto NO se guarda aquí: ya vive en SQLite y solo se necesita para el top-k.
+
+Para el rerank se precalculan los tokens de cada `heading_path` distinto
+(incluye tomo/capítulo/artículo), así la consulta se tokeniza una sola vez y
+el bonus por encabezado se resuelve con un lookup vectorizado por código.
+
+En disco se guarda como un directorio de `.npy` (abiertos con mmap, así los
+workers comparten páginas) más `vocab.json`.
+"""
+
+import os
+import re
+import json
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+from .db import get_conn, fold_accents, SPANISH_STOPWORDS
+from .query_filters import canonical_value
+
+COLUMNS = ("chunk_id", "doc_id", "tomo", "capitulo", "articulo", "tipo_seccion", "fuente", "heading_path")
+STORE_DIRNAME = "metas_store"
+_EMPTY_VALUES = {"", "Desconocido", "None"}
+
+
+def _clean(value) -> str:
+    if value is None:
+        return ""
+    value = str(value)
+    return "" if value in _EMPTY_VALUES else value
+
+
+def derive_heading(meta: Dict) -> str:
+    """Construir heading_path a partir de tomo/capítulo/artículo (igual que fts_search)"""
+    tomo, cap, art = _clean(meta.get("tomo")), _clean(meta.get("capitulo")), _clean(meta.get("articulo"))
+    heading = f"TOMO {tomo}" if tomo else ""
+    if cap:
+        heading += f" > CAPÍTULO {cap}"
+    if art:
+        heading += f" > ARTÍCULO {art}"
+    return heading
+
+
+_TOKEN = re.compile(r"[a-z]+|\d+")
+
+
+def heading_tokens_of(text: str) -> List[str]:
+    """Tokens sin acentos en minúsculas; separa letras de números ("TOMO6_..." -> tomo, 6)"""
+    return sorted(set(_TOKEN.findall(fold_accents(text or "").lower())))
+
+
+def query_tokens(query: str) -> frozenset:
+    """Tokens de la consulta para el bonus por encabezado (sin stopwords)"""
+    return frozenset(t for t in _TOKEN.findall(fold_accents(query or "").lower())
+                     if t not in SPANISH_STOPWORDS)
+
+
+def _rowid_of(meta: Dict) -> int:
+    for key in ("rowid", "id", "chunk_id"):
+        value = meta.get(key)
+        if isinstance(value, int):
+            return value
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+    return -1
+
+
+class _ColumnBuilder:
+    """Codificador por diccionario para una columna"""
+
+    def __init__(self, vocab: Optional[List[str]] = None):
+        self.vocab = list(vocab or [""])
+        self.lookup = {v: i for i, v in enumerate(self.vocab)}
+        self.codes: List[int] = []
+
+    def add(self, value: str):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.vocab)
+            self.vocab.append(value)
+            self.lookup[value] = code
+        self.codes.append(code)
+
+
+class MetaStore:
+    """
+    Metadatos columnar por posición FAISS, con texto perezoso desde SQLite
+    """
+
+    def __init__(self, rowids: np.ndarray, codes: Dict[str, np.ndarray],
+                 vocab: Dict[str, List[str]], db_path: str = None,
+                 heading_tokens: Optional[List[List[str]]] = None,
+                 n_tokens: Optional[np.ndarray] = None):
+        self.rowids = rowids
+        self.n_tokens = n_tokens if n_tokens is not None else np.zeros(len(rowids), dtype=np.int32)
+        self.codes = codes
+        self.vocab = vocab
+        self.db_path = db_path
+        # Tokens por código de heading_path (alineado con vocab["heading_path"])
+        self.heading_tokens = heading_tokens if heading_tokens is not None else \
+            [heading_tokens_of(h) for h in vocab["heading_path"]]
+        self._token_index: Optional[Dict[str, np.ndarray]] = None
+        self._rowid_order: Optional[np.ndarray] = None
+
+    # ------------------------------------------------------------------
+    # Construcción / persistencia
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_records(cls, records: Iterable[Dict], db_path: str = None) -> "MetaStore":
+        """Construir desde dicts de metadatos (se ignoran `content`/`text`)"""
+        builders = {c: _ColumnBuilder() for c in COLUMNS}
+        rowids, n_tokens = [], []
+        for meta in records:
+            rowids.append(_rowid_of(meta))
+            n_tokens.append(int(meta.get("n_tokens") or 0))
+            row = {c: _clean(meta.get(c)) for c in COLUMNS}
+            row["chunk_id"] = str(meta.get("chunk_id") or meta.get("id") or "")
+            row["doc_id"] = row["doc_id"] or row["fuente"] or row["tomo"]
+            row["heading_path"] = _clean(meta.get("heading_path")) or derive_heading(meta)
+            for c in COLUMNS:
+                builders[c].add(row[c])
+        return cls(
+            np.array(rowids, dtype=np.int64),
+            {c: np.array(b.codes, dtype=np.int32) for c, b in builders.items()},
+            {c: b.vocab for c, b in builders.items()},
+            db_path,
+            n_tokens=np.array(n_tokens, dtype=np.int32),
+        )
+
+    @classmethod
+    def from_jsonl(cls, metas_path: str, db_path: str = None) -> "MetaStore":
+        """Construir desde `metas.jsonl` leyendo línea a línea"""
+        with open(metas_path, "r", encoding="utf-8") as f:
+            return cls.from_records((json.loads(l) for l in f if l.strip()), db_path)
+
+    @classmethod
+    def empty(cls, db_path: str = None) -> "MetaStore":
+        return cls.from_records([], db_path)
+
+    def save(self, store_dir: str, source_stat: Optional[Dict] = None):
+        """Guardar columnas como .npy + vocabularios en JSON"""
+        os.makedirs(store_dir, exist_ok=True)
+        np.save(os.path.join(store_dir, "rowid.npy"), np.asarray(self.rowids))
+        np.save(os.path.join(store_dir, "n_tokens.npy"), np.asarray(self.n_tokens))
+        for c in COLUMNS:
+            np.save(os.path.join(store_dir, f"{c}.npy"), np.asarray(self.codes[c]))
+        tmp = os.path.join(store_dir, "vocab.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"rows": len(self), "source": source_stat or {}, "vocab": self.vocab,
+                       "heading_tokens": self.heading_tokens}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(store_dir, "vocab.json"))
+
+    @classmethod
+    def load(cls, store_dir: str, db_path: str = None, mmap: bool = True) -> "MetaStore":
+        """Cargar almacén guardado; con mmap las columnas no se copian al heap"""
+        with open(os.path.join(store_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        mode = "r" if mmap else None
+        rowids = np.load(os.path.join(store_dir, "rowid.npy"), mmap_mode=mode)
+        codes = {c: np.load(os.path.join(store_dir, f"{c}.npy"), mmap_mode=mode) for c in COLUMNS}
+        if len(rowids) != header.get("rows", len(rowids)):
+            raise ValueError(f"Almacén de metadatos inconsistente en {store_dir}")
+        tokens_path = os.path.join(store_dir, "n_tokens.npy")
+        n_tokens = np.load(tokens_path, mmap_mode=mode) if os.path.exists(tokens_path) else None
+        return cls(rowids, codes, header["vocab"], db_path, header.get("heading_tokens"), n_tokens)
+
+    @staticmethod
+    def _source_stat(path: str) -> Dict:
+        st = os.stat(path)
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    @classmethod
+    def open(cls, index_dir: str, db_path: str = None) -> "MetaStore":
+        """
+        Abrir el almacén de `index_dir`, reconstruyéndolo desde `metas.jsonl`
+        si no existe o quedó desactualizado respecto al JSONL
+        """
+        metas_path = os.path.join(index_dir, "metas.jsonl")
+        store_dir = os.path.join(index_dir, STORE_DIRNAME)
+        source = cls._source_stat(metas_path) if os.path.exists(metas_path) else None
+
+        if os.path.exists(os.path.join(store_dir, "vocab.json")):
+            try:
+                with open(os.path.join(store_dir, "vocab.json"), "r", encoding="utf-8") as f:
+                    saved_source = json.load(f).get("source") or None
+                if source is None or saved_source == source:
+                    return cls.load(store_dir, db_path)
+            except Exception as e:
+                print(f"⚠️ Almacén de metadatos ilegible ({e}), reconstruyendo")
+
+        if source is None:
+            print(f"⚠️ Advertencia: {metas_path} no encontrado, usando metadatos vacíos")
+            return cls.empty(db_path)
+
+        store = cls.from_jsonl(metas_path, db_path)
+        try:
+            store.save(store_dir, source)
+        except OSError as e:
+            print(f"⚠️ No se pudo guardar almacén de metadatos: {e}")
+        return store
+
+    def write_jsonl(self, metas_path: str):
+        """Escribir `metas.jsonl` (solo metadatos, sin texto) y sincronizar el almacén"""
+        tmp = metas_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as out:
+            for i in range(len(self)):
+                out.write(json.dumps(self[i], ensure_ascii=False) + "\n")
+        os.replace(tmp, metas_path)
+        self.save(os.path.join(os.path.dirname(metas_path), STORE_DIRNAME), self._source_stat(metas_path))
+
+    # ------------------------------------------------------------------
+    # Acceso
+    # ------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.rowids)
+
+    def __getitem__(self, i: int) -> Dict:
+        row = {c: self.vocab[c][self.codes[c][i]] for c in COLUMNS}
+        row["id"] = int(self.rowids[i])
+        row["n_tokens"] = int(self.n_tokens[i])
+        return row
+
+    def rows(self, positions: Iterable[int]) -> List[Dict]:
+        """Dicts de varias filas: los códigos se leen por columna de una vez"""
+        pos = np.fromiter(positions, dtype=np.int64) if not isinstance(positions, np.ndarray) else positions
+        if len(pos) == 0:
+            return []
+        keys = COLUMNS + ("id", "n_tokens")
+        columns = [[self.vocab[c][code] for code in np.asarray(self.codes[c])[pos].tolist()] for c in COLUMNS]
+        columns.append(np.asarray(self.rowids)[pos].tolist())
+        columns.append(np.asarray(self.n_tokens)[pos].tolist())
+        return [dict(zip(keys, values)) for values in zip(*columns)]
+
+    def positions_of(self, rowids: np.ndarray) -> np.ndarray:
+        """
+        Posiciones de los rowids dados (-1 si no están); para índices FAISS
+        direccionados por rowid. Búsqueda binaria sobre un orden precalculado.
+        """
+        ids = np.asarray(rowids, dtype=np.int64)
+        if self._rowid_order is None:
+            self._rowid_order = np.argsort(np.asarray(self.rowids), kind="stable")
+        if len(self._rowid_order) == 0:
+            return np.full(ids.shape, -1, dtype=np.int64)
+        sorted_ids = np.asarray(self.rowids)[self._rowid_order]
+        at = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[at] == ids, self._rowid_order[at], -1).astype(np.int64)
+
+    def value_codes(self, column: str, value: str) -> Optional[int]:
+        """Código de un valor en la columna (None si no aparece)"""
+        try:
+            return self.vocab[column].index(value)
+        except ValueError:
+            return None
+
+    def positions_where(self, filters: Dict[str, List[str]]) -> np.ndarray:
+        """
+        Posiciones FAISS que cumplen filtros ya normalizados (ver query_filters).
+        Se resuelve sobre los códigos: valores canónicos -> códigos -> np.isin por columna.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for column, values in filters.items():
+            wanted = set(values)
+            codes = [i for i, v in enumerate(self.vocab[column]) if v and canonical_value(column, v) in wanted]
+            mask &= np.isin(np.asarray(self.codes[column]), np.array(codes, dtype=np.int32))
+        return np.flatnonzero(mask).astype(np.int64)
+
+    def heading_matches(self, tokens: frozenset) -> np.ndarray:
+        """
+        Máscara bool por código de heading_path: True si el encabezado comparte
+        algún token con la consulta. Usa un índice invertido token -> códigos.
+        """
+        if self._token_index is None:
+            inverted: Dict[str, List[int]] = {}
+            for code, toks in enumerate(self.heading_tokens):
+                for t in toks:
+                    inverted.setdefault(t, []).append(code)
+            self._token_index = {t: np.array(c, dtype=np.int32) for t, c in inverted.items()}
+        mask = np.zeros(len(self.heading_tokens), dtype=bool)
+        for t in tokens:
+            codes = self._token_index.get(t)
+            if codes is not None:
+                mask[codes] = True
+        return mask
+
+    def copy(self) -> "MetaStore":
+        """Copia en memoria (las columnas mapeadas pasan al heap)"""
+        return MetaStore(np.array(self.rowids), {c: np.array(v) for c, v in self.codes.items()},
+                         {c: list(v) for c, v in self.vocab.items()}, self.db_path,
+                         [list(t) for t in self.heading_tokens], np.array(self.n_tokens))
+
+    def append(self, meta: Dict):
+        """Agregar una fila (usado por add_to_index; copia las columnas)"""
+        other = MetaStore.from_records([meta])
+        self.rowids = np.concatenate([np.asarray(self.rowids), other.rowids])
+        self.n_tokens = np.concatenate([np.asarray(self.n_tokens), other.n_tokens])
+        self._rowid_order = None
+        for c in COLUMNS:
+            value = other.vocab[c][other.codes[c][0]]
+            code = self.value_codes(c, value)
+            if code is None:
+                self.vocab[c] = list(self.vocab[c]) + [value]
+                code = len(self.vocab[c]) - 1
+                if c == "heading_path":
+                    self.heading_tokens = list(self.heading_tokens) + [heading_tokens_of(value)]
+                    self._token_index = None
+            self.codes[c] = np.append(np.asarray(self.codes[c]), np.int32(code))
+
+    def token_counts(self, rowids: Iterable[int]) -> Dict[int, int]:
+        """n_tokens conocidos (> 0) de los rowids dados"""
+        ids = np.fromiter((int(r) for r in rowids), dtype=np.int64)
+        pos = self.positions_of(ids)
+        found = pos >= 0
+        counts = np.asarray(self.n_tokens)[pos[found]]
+        return {int(r): int(n) for r, n in zip(ids[found], counts) if n > 0}
+
+    def fetch_texts(self, positions: Iterable[int]) -> Dict[int, str]:
+        """Traer texto de SQLite solo para las posiciones pedidas"""
+        positions = [int(p) for p in positions]
+        ids = {int(self.rowids[p]): p for p in positions if self.rowids[p] >= 0}
+        if not ids or not self.db_path:
+            return {}
+        qmarks = ",".join("?" * len(ids))
+        with get_conn(self.db_path, readonly=True) as con:
+            cur = con.execute(f"SELECT rowid, content FROM fts_chunks WHERE rowid IN ({qmarks})", list(ids))
+            return {ids[r[0]]: r[1] for r in cur.fetchall()}
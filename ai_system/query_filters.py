@@ -0,0 +1,102 @@
+"""
+Filtros de metadatos para la búsqueda
+======================================
+
+- `parse_query_filters`: extrae referencias como "TOMO 6", "Tomo VI",
+  "Capítulo 3" o "cap. 8" de la consulta del usuario.
+- `canonical_value`: lleva valores de metadatos y de filtros a una forma
+  comparable ("TOMO6_COMPLETO_MEJORADO_2025..." -> "6", "VIII" -> "8").
+- `matches_filters`: verifica un dict de metadatos contra los filtros.
+
+Formato de filtros: {"tomo": ["6"], "capitulo": ["3"], "tipo_seccion": [...], "fuente": [...]}
+(un valor suelto equivale a una lista de un elemento; varias columnas = AND).
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Union
+
+FILTER_COLUMNS = ("tomo", "capitulo", "tipo_seccion", "fuente")
+
+Filters = Dict[str, Union[str, List[str]]]
+
+_ROMAN = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+# Romanos solo bien formados (hasta 399): "tomos civil" no es el tomo "CIVI"
+_ROMAN_NUMBER = r"(?=[ivxlc])c{0,3}(?:xc|xl|l?x{0,3})(?:ix|iv|v?i{0,3})(?<=[ivxlc])"
+_NUMBER = r"(\d{1,3}|" + _ROMAN_NUMBER + r")\b"
+_TOMO_REF = re.compile(r"\btomos?\s*(?:n[uú]m(?:ero)?\.?\s*|no\.?\s*)?" + _NUMBER, re.IGNORECASE)
+_CAP_REF = re.compile(r"\b(?:cap[ií]tulos?|cap\.)\s*" + _NUMBER, re.IGNORECASE)
+_TOMO_IN_VALUE = re.compile(r"tomo[\s_-]*(\d+)", re.IGNORECASE)
+
+
+def _roman_to_int(text: str) -> int:
+    total, prev = 0, 0
+    for ch in reversed(text.lower()):
+        value = _ROMAN.get(ch, 0)
+        total = total - value if value < prev else total + value
+        prev = max(prev, value)
+    return total
+
+
+def _number(text: str) -> str:
+    text = text.strip()
+    if text.isdigit():
+        return str(int(text))
+    return str(_roman_to_int(text)) if re.fullmatch(r"[ivxlc]+", text, re.IGNORECASE) else text
+
+
+def canonical_value(column: str, value) -> str:
+    """Forma comparable de un valor de metadatos o de filtro"""
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode().strip()
+    if column in ("tomo", "fuente"):
+        m = _TOMO_IN_VALUE.search(text)
+        if m:
+            return str(int(m.group(1)))
+        if column == "tomo":
+            return _number(text)
+    if column == "capitulo":
+        return _number(text)
+    return text.casefold()
+
+
+def normalize_filters(filters: Filters) -> Dict[str, List[str]]:
+    """Filtros con listas de valores canónicos (se descartan columnas desconocidas y vacías)"""
+    out = {}
+    for column, values in (filters or {}).items():
+        if column not in FILTER_COLUMNS or values in (None, "", []):
+            continue
+        if isinstance(values, (str, int)):
+            values = [values]
+        out[column] = sorted({canonical_value(column, v) for v in values})
+    return out
+
+
+def parse_query_filters(query: str) -> Dict[str, List[str]]:
+    """
+    Extraer filtros de tomo/capítulo de la consulta
+
+    Ejemplo: "requisitos del Capítulo 3 del Tomo VI" -> {"tomo": ["6"], "capitulo": ["3"]}
+    """
+    filters = {}
+    tomos = sorted({_number(m.group(1)) for m in _TOMO_REF.finditer(query or "")})
+    caps = sorted({_number(m.group(1)) for m in _CAP_REF.finditer(query or "")})
+    if tomos:
+        filters["tomo"] = tomos
+    if caps:
+        filters["capitulo"] = caps
+    return filters
+
+
+def matches_filters(meta: Dict, filters: Dict[str, List[str]]) -> bool:
+    """True si el dict de metadatos cumple todos los filtros (ya normalizados)"""
+    for column, values in filters.items():
+        raw = meta.get(column)
+        if column == "tomo" and not raw:
+            raw = meta.get("fuente") or meta.get("doc_id")
+        if canonical_value(column, raw) not in values:
+            return False
+    return True
+
+
+def describe_filters(filters: Dict[str, Iterable[str]]) -> str:
+    return ", ".join(f"{c}={'|'.join(v)}" for c, v in filters.items())
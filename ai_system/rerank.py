@@ -0,0 +1,157 @@
+"""
+Rerank de candidatos vectoriales
+=================================
+
+Puntaje = similitud + 0.1 al primer candidato de cada documento (diversidad)
++ 0.05 si el encabezado comparte algún token con la consulta.
+
+Todo se calcula con arrays sobre las posiciones FAISS del candidato: los
+códigos de doc_id/heading_path vienen del MetaStore, los tokens de cada
+encabezado están precalculados y la consulta se tokeniza una sola vez.
+Solo se materializan dicts para el top-k final.
+
+`CrossEncoderReranker` es una etapa opcional posterior a la fusión híbrida:
+un cross-encoder pequeño en CPU reordena los candidatos fusionados y se
+devuelven solo los top-n.
+"""
+
+import time
+import threading
+import numpy as np
+from collections import deque
+from typing import Dict, List, Tuple
+from .meta_store import MetaStore
+
+DIVERSITY_BONUS = 0.1
+HEADING_BONUS = 0.05
+# Sin costo por par medido todavía, el primer lote es una muestra chica
+RERANK_PROBE_PAIRS = 4
+
+
+def rerank_arrays(metas: MetaStore, ids: np.ndarray, scores: np.ndarray, tokens: frozenset,
+                  k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Rerankear candidatos (ya filtrados, en orden de similitud descendente)
+
+    Returns:
+        Tuple de (ids, similitud, puntaje rerankeado) del top-k, ordenados
+    """
+    if len(ids) == 0:
+        return ids, scores, scores.astype(np.float64)
+
+    reranked = scores.astype(np.float64)
+
+    # Diversidad: bonus a la primera aparición (mejor similitud) de cada documento
+    doc_codes = np.asarray(metas.codes["doc_id"])[ids]
+    _, first = np.unique(doc_codes, return_index=True)
+    reranked[first] += DIVERSITY_BONUS
+
+    # Relevancia de encabezado: lookup por código contra la máscara de la consulta
+    if tokens:
+        matches = metas.heading_matches(tokens)
+        reranked += HEADING_BONUS * matches[np.asarray(metas.codes["heading_path"])[ids]]
+
+    order = np.argsort(-reranked, kind="stable")[:k]
+    return ids[order], scores[order], reranked[order]
+
+
+def vector_hits(metas: MetaStore, ids: np.ndarray, scores: np.ndarray, tokens: frozenset,
+                k: int, similarity_threshold: float) -> List[Dict]:
+    """Filtrar una fila de resultados FAISS, rerankear y materializar el top-k"""
+    keep = (ids != -1) & (ids < len(metas)) & (scores >= similarity_threshold)
+    ids, sims, reranked = rerank_arrays(metas, ids[keep], scores[keep], tokens, k)
+    return [{"score": float(s), "reranked_score": float(r), **m}
+            for s, r, m in zip(sims, reranked, metas.rows(ids))]
+
+
+class CrossEncoderReranker:
+    """
+    Rerank opcional con un cross-encoder multilingüe local (CPU)
+
+    Puntúa pares (consulta, texto) en lotes. Antes de cada lote se compara el
+    presupuesto restante con el costo por par medido (media móvil): el lote se
+    achica para caber y, si no cabe ningún par, los candidatos sin puntuar
+    conservan el orden de la fusión detrás de los ya puntuados. Sin medición
+    previa el primer lote es de RERANK_PROBE_PAIRS pares. Requiere
+    `sentence-transformers` (import perezoso).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, budget_ms: float = 300,
+                 max_chars: int = 1200, max_length: int = 512):
+        from sentence_transformers import CrossEncoder  # dependencia opcional
+
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.budget_ms = budget_ms
+        self.max_chars = max_chars
+        self.model = CrossEncoder(model_name, device="cpu", max_length=max_length)
+        self._latencies: "deque[float]" = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._pair_ms = None
+        self.calls = 0
+        self.budget_exceeded = 0
+        print(f"✅ Cross-encoder cargado para rerank: {model_name}")
+
+    def _batch_limit(self, remaining_ms: float) -> int:
+        """Pares que caben en el presupuesto restante (0 = no puntuar más)"""
+        if remaining_ms <= 0:
+            return 0
+        if self._pair_ms is None:
+            return min(self.batch_size, RERANK_PROBE_PAIRS)
+        return min(self.batch_size, int(remaining_ms // max(self._pair_ms, 1e-3)))
+
+    def _observe(self, pair_ms: float):
+        with self._lock:
+            self._pair_ms = pair_ms if self._pair_ms is None else 0.8 * self._pair_ms + 0.2 * pair_ms
+
+    def rerank(self, query: str, candidates: List[Dict], top_n: int) -> List[Dict]:
+        """
+        Reordenar candidatos (con `text`) y truncar a top_n
+
+        Cada candidato puntuado recibe `rerank_score`; `rerank_rank` es su posición final.
+        """
+        if not candidates:
+            return candidates
+        t0 = time.perf_counter()
+        scores = np.full(len(candidates), -np.inf)
+        scored = 0
+        while scored < len(candidates):
+            n = self._batch_limit(self.budget_ms - (time.perf_counter() - t0) * 1000)
+            if n < 1:
+                break  # presupuesto agotado: el resto queda en orden de fusión
+            batch = candidates[scored:scored + n]
+            pairs = [(query, (c.get("text") or c.get("snippet") or "")[:self.max_chars]) for c in batch]
+            tb = time.perf_counter()
+            scores[scored:scored + len(batch)] = self.model.predict(pairs, batch_size=len(batch),
+                                                                    show_progress_bar=False)
+            self._observe((time.perf_counter() - tb) * 1000 / len(batch))
+            scored += len(batch)
+
+        order = np.argsort(-scores[:scored], kind="stable").tolist() + list(range(scored, len(candidates)))
+        result = []
+        for rank, i in enumerate(order[:top_n]):
+            cand = candidates[i]
+            if i < scored:
+                cand["rerank_score"] = float(scores[i])
+            cand["rerank_rank"] = rank
+            result.append(cand)
+
+        elapsed = (time.perf_counter() - t0) * 1000
+        with self._lock:
+            self.calls += 1
+            self.budget_exceeded += int(scored < len(candidates))
+            self._latencies.append(elapsed)
+        return result
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lat = np.array(self._latencies) if self._latencies else np.zeros(1)
+            return {
+                "model": self.model_name,
+                "calls": self.calls,
+                "budget_ms": self.budget_ms,
+                "budget_exceeded": self.budget_exceeded,
+                "pair_ms": round(self._pair_ms, 3) if self._pair_ms is not None else None,
+                "p50_ms": round(float(np.percentile(lat, 50)), 2),
+                "p99_ms": round(float(np.percentile(lat, 99)), 2),
+            }
@@ -0,0 +1,96 @@
+"""
+Cache de resultados de búsqueda híbrida
+========================================
+
+Clave: versión del índice + consulta normalizada + parámetros de hybrid().
+Valor: los resultados fusionados SIN texto (chunk_id, puntajes, encabezado);
+el texto se vuelve a leer de SQLite en una sola consulta al acertar.
+
+LRU acotado con TTL. El retriever lo vacía en cada hot-swap del índice
+(add_to_index, rebuild_index o versión publicada por otro proceso).
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from .embedding_cache import normalize_query
+
+# Campos pesados que no se guardan en el cache
+_HEAVY_FIELDS = ("text", "snip", "snippet")
+
+
+class ResultCache:
+    """
+    Cache LRU + TTL de resultados de hybrid()
+    """
+
+    def __init__(self, max_size: int = 512, ttl_seconds: float = 600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(version: str, query: str, **params) -> tuple:
+        """Clave estable: versión, consulta normalizada y parámetros ordenados"""
+        items = []
+        for name in sorted(params):
+            value = params[name]
+            if isinstance(value, dict):
+                value = tuple(sorted(value.items()))
+            items.append((name, value))
+        return (version, normalize_query(query), tuple(items))
+
+    def get(self, key: tuple) -> Optional[List[Dict]]:
+        """Copias de los resultados guardados (sin texto), o None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return [dict(r) for r in entry[1]]
+
+    def put(self, key: tuple, results: List[Dict]):
+        if not self.enabled:
+            return
+        slim = tuple({k: v for k, v in r.items() if k not in _HEAVY_FIELDS} for r in results)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), slim)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Invalidar todo (cambió el índice)"""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
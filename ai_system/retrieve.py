@@ -1,17 +1,37 @@
-import os, json, numpy as np, faiss
-from typing import List, Dict
+import os, json, time, sqlite3, threading, numpy as np, faiss
+from typing import List, Dict, Optional, Tuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from openai import AzureOpenAI, OpenAI
 from .config import (
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_API_VERSION,
     AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH, FAISS_PATH,
-    OPENAI_API_KEY, MODEL_EMBED
+    OPENAI_API_KEY, MODEL_EMBED, EMBED_CACHE_SIZE, EMBED_CACHE_DB,
+    INDEX_SNAPSHOT_DIR, INDEX_SNAPSHOT_KEEP, INDEX_SNAPSHOT_POLL_SECONDS,
+    HYBRID_FUSION, HYBRID_RRF_K, HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT,
+    HYBRID_CONCURRENT, HYBRID_WORKERS, RESULT_CACHE_SIZE, RESULT_CACHE_TTL,
+    SEARCH_AUTO_FILTERS, RERANK_ENABLED, RERANK_MODEL, RERANK_CANDIDATES, RERANK_TOP_N,
+    RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_MAX_CHARS, CITATION_LOOKUP,
+    TERM_LOOKUP
 )
 from .local_embeddings import LocalEmbeddings
-from .db import get_conn, fts_search
-import uuid
+from .db import get_conn, fts_search, pool_stats, ensure_fts_schema
+from .embedding_cache import EmbeddingCache
+from .index_snapshots import IndexSnapshot, SnapshotManager, LEGACY_VERSION
+from .fusion import fuse
+from .result_cache import ResultCache
+from .ann_index import selector_search_params
+from .meta_store import query_tokens
+from .dedup import aliases_for
+from .rerank import vector_hits, CrossEncoderReranker
+from .citations import parse_citations, lookup_citations, ensure_citation_index, index_chunk
+from .term_index import parse_terms, lookup_terms, ensure_term_index, index_chunk_terms
+from .query_filters import (
+    Filters, normalize_filters, parse_query_filters, matches_filters, describe_filters
+)
 
 class HybridRetriever:
-    def __init__(self, db_path=DB_PATH, faiss_path=FAISS_PATH):
+    def __init__(self, db_path=DB_PATH, faiss_path=FAISS_PATH, snapshot_dir=INDEX_SNAPSHOT_DIR):
         # Validar configuración Azure OpenAI antes de crear cliente
         if not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_ENDPOINT.startswith('http'):
             raise ValueError(f"AZURE_OPENAI_ENDPOINT inválido: '{AZURE_OPENAI_ENDPOINT}'. Debe comenzar con https://")
@@ -73,41 +93,257 @@ class HybridRetriever:
             except Exception as e3:
                 print(f"❌ Embeddings locales también fallaron: {str(e3)[:100]}...")
                 print("⚠️ Sistema funcionando solo con búsqueda textual")
+
+        # Cache de embeddings de consultas (evita repetir llamadas a la API)
+        self.embedding_cache = EmbeddingCache(max_size=EMBED_CACHE_SIZE, db_path=EMBED_CACHE_DB)
+        # Cache de resultados de hybrid() (se invalida en cada cambio de índice)
+        self.result_cache = ResultCache(max_size=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL)
+
+        # Rerank opcional con cross-encoder local después de la fusión
+        self.reranker = None
+        if RERANK_ENABLED:
+            try:
+                self.reranker = CrossEncoderReranker(
+                    RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=RERANK_BUDGET_MS,
+                    max_chars=RERANK_MAX_CHARS)
+            except Exception as e:
+                print(f"⚠️ Cross-encoder no disponible ({str(e)[:100]}), rerank desactivado")
+
         self.db_path = db_path
         self.faiss_path = faiss_path
-        self.index = faiss.read_index(self.faiss_path)
-        metas_path = os.path.join(os.path.dirname(self.faiss_path), "metas.jsonl")
+
+        # fts_chunks con tokenizer sin acentos (migración única si es una BD antigua)
+        try:
+            ensure_fts_schema(self.db_path)
+        except Exception as e:
+            print(f"⚠️ No se pudo verificar/migrar fts_chunks: {e}")
+
+        # Índice de citas exactas (Regla/Sección/Artículo -> chunk + offsets)
+        self.citation_lookup = CITATION_LOOKUP
+        if self.citation_lookup:
+            try:
+                ensure_citation_index(self.db_path)
+            except Exception as e:
+                print(f"⚠️ Índice de citas no disponible ({e}), consultas por cita usan búsqueda normal")
+                self.citation_lookup = False
+
+        # Índice exacto de códigos de zonificación (R-1, C-2, ...) y términos del glosario
+        self.term_lookup = TERM_LOOKUP
+        if self.term_lookup:
+            try:
+                ensure_term_index(self.db_path)
+            except Exception as e:
+                print(f"⚠️ Índice de códigos/términos no disponible ({e})")
+                self.term_lookup = False
+
+        # Índice + metadatos viven en un snapshot versionado que se intercambia
+        # atómicamente; sin snapshots publicados se usa faiss_path (modo legacy)
+        self.snapshots = SnapshotManager(snapshot_dir, keep=INDEX_SNAPSHOT_KEEP)
+        self._swap_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot = None
+        self._generation = 0  # cambia en cada swap (add_to_index en legacy no cambia la versión)
+        self._pointer_checked_at = 0.0
+        self._pointer_mtime = self.snapshots.pointer_mtime()
+        self._swap(self._open_snapshot(self.snapshots.current_version()))
+
+        # Executor compartido para solapar embedding+FAISS con FTS en hybrid()
+        self.concurrent = HYBRID_CONCURRENT
+        self._executor = None
+        self._executor_pid = None
+        self._executor_lock = threading.Lock()
+        self._timing_lock = threading.Lock()
+        self._timing_totals: Dict[str, float] = {}
+        self._timing_calls = 0
+
+    # ------------------------------------------------------------------
+    # Snapshots del índice
+    # ------------------------------------------------------------------
+    def _open_snapshot(self, version: str = None) -> IndexSnapshot:
+        """Cargar un snapshot publicado, o el índice de faiss_path si version es None"""
+        if version:
+            snap = IndexSnapshot(version, self.snapshots.index_path(version), self.db_path)
+        else:
+            snap = IndexSnapshot(LEGACY_VERSION, self.faiss_path, self.db_path)
+        print(f"📐 Índice FAISS {snap.version}: {snap.index_manifest.get('index_type', 'flat')} "
+              f"({snap.index.ntotal} vectores{', mmap' if snap.index_mmapped else ''})")
+        return snap
+
+    def _swap(self, snap: IndexSnapshot):
+        """Publicar un snapshot en este proceso; el anterior se libera al terminar sus búsquedas"""
+        with self._swap_lock:
+            old, self._snapshot = self._snapshot, snap
+            self._generation += 1
+            self.result_cache.clear()
+        if old is not None:
+            old.retire()
+
+    def _maybe_refresh(self):
+        """Detectar (cada INDEX_SNAPSHOT_POLL_SECONDS) si otro proceso publicó una versión nueva"""
+        now = time.monotonic()
+        if now - self._pointer_checked_at < INDEX_SNAPSHOT_POLL_SECONDS:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # otro hilo ya está recargando; seguir con la versión actual
+        try:
+            self._pointer_checked_at = now
+            mtime = self.snapshots.pointer_mtime()
+            if mtime == self._pointer_mtime:
+                return
+            self._pointer_mtime = mtime
+            version = self.snapshots.current_version()
+            if version and version != self._snapshot.version:
+                self._swap(self._open_snapshot(version))
+        except Exception as e:
+            print(f"⚠️ Error recargando snapshot de índice: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    @contextmanager
+    def _use_snapshot(self):
+        """Fijar el snapshot actual durante una búsqueda"""
+        self._maybe_refresh()
+        with self._swap_lock:
+            snap = self._snapshot.acquire()
         try:
-            self.metas = [json.loads(l) for l in open(metas_path, "r", encoding="utf-8")]
-        except FileNotFoundError:
-            # Si no existe metas.jsonl, crear lista vacía y advertir
-            print(f"⚠️ Advertencia: {metas_path} no encontrado, usando metadatos vacíos")
-            self.metas = []
+            yield snap
+        finally:
+            snap.release()
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    @property
+    def metas(self):
+        return self._snapshot.metas
+
+    @property
+    def index_version(self) -> str:
+        return self._snapshot.version
+
+    def _publish_snapshot(self, snap: IndexSnapshot, source: str):
+        """Guardar un snapshot nuevo (versionado, o en faiss_path en modo legacy) y activarlo"""
+        if self._snapshot.version == LEGACY_VERSION and self.snapshots.current_version() is None:
+            snap.version = LEGACY_VERSION
+            snap.save(self.faiss_path)
+        else:
+            snap.version = self.snapshots.new_version()
+            staging = self.snapshots.stage(snap.version)
+            snap.save(os.path.join(staging, "faiss_index.bin"))
+            self.snapshots.commit(snap.version, source, {"rows": len(snap.metas)})
+            snap.index_path = self.snapshots.index_path(snap.version)
+            self._pointer_mtime = self.snapshots.pointer_mtime()
+        self._swap(snap)
+        self._prune_snapshots()
+
+    def _prune_snapshots(self):
+        if self.snapshots.current_version() is not None:
+            self.snapshots.prune(in_use={self._snapshot.version})
+
+    # ------------------------------------------------------------------
+    # Ejecución concurrente y tiempos por etapa
+    # ------------------------------------------------------------------
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Executor perezoso; se recrea en el hijo si el proceso hizo fork"""
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=HYBRID_WORKERS,
+                                                    thread_name_prefix="hybrid")
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _record_timings(self, timings: Dict[str, float]):
+        with self._timing_lock:
+            self._timing_calls += 1
+            for stage, ms in timings.items():
+                self._timing_totals[stage] = self._timing_totals.get(stage, 0.0) + ms
+
+    def timing_stats(self) -> Dict:
+        """Promedio en ms por etapa de hybrid()"""
+        with self._timing_lock:
+            calls = self._timing_calls
+            avg = {stage: round(total / calls, 2) for stage, total in self._timing_totals.items()} if calls else {}
+        return {"calls": calls, "avg_ms": avg}
+
+    @property
+    def embedding_model_id(self) -> str:
+        """Identificador del modelo de embeddings activo (clave del cache)"""
+        if self.embedding_client is not None:
+            return self.embedding_model
+        if self.local_embedder is not None:
+            return f"local:{self.local_embedder.model_name}"
+        return ""
 
     def embed(self, text: str) -> np.ndarray:
-        # Prioridad: API externa > LocalEmbeddings > Vector vacío
+        # Prioridad: Cache > API externa > LocalEmbeddings > Vector vacío
+        model_id = self.embedding_model_id
+        if model_id:
+            cached = self.embedding_cache.get(model_id, text)
+            if cached is not None:
+                return cached
+
         if self.embedding_client is not None:
             # Usar API externa (Azure u OpenAI)
             e = self.embedding_client.embeddings.create(model=self.embedding_model, input=[text]).data[0].embedding
             v = np.array([e], dtype="float32")
             faiss.normalize_L2(v)
+            self.embedding_cache.put(model_id, text, v)
             return v
         elif self.local_embedder is not None:
             # Usar embeddings locales
-            return self.local_embedder.encode_query(text)
+            v = self.local_embedder.encode_query(text)
+            self.embedding_cache.put(model_id, text, v)
+            return v
         else:
             # Sin embeddings disponibles, retornar vector vacío
             print("⚠️ Embeddings no disponibles, usando vector vacío")
             return np.array([[0.0]], dtype="float32")
 
-    def search_vectors(self, query: str, k=12, similarity_threshold=0.7) -> List[Dict]:
+    def get_stats(self) -> Dict:
+        """Estadísticas del retriever (cache de embeddings, índice)"""
+        return {
+            "embedding_model": self.embedding_model_id,
+            "index": self._snapshot.describe(),
+            "embedding_cache": self.embedding_cache.get_stats(),
+            "result_cache": self.result_cache.get_stats(),
+            "sqlite_pools": pool_stats(),
+            "hybrid_timings": self.timing_stats(),
+            "cross_encoder": self.reranker.get_stats() if self.reranker else None,
+        }
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        """Embeddings (n x dim) de varias consultas: una sola llamada/pasada para las no cacheadas"""
+        model_id = self.embedding_model_id
+        vectors: List[Optional[np.ndarray]] = [
+            self.embedding_cache.get(model_id, t) if model_id else None for t in texts]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+
+        if missing and self.embedding_client is not None:
+            response = self.embedding_client.embeddings.create(
+                model=self.embedding_model, input=[texts[i] for i in missing])
+            batch = np.array([d.embedding for d in response.data], dtype="float32")
+            faiss.normalize_L2(batch)
+        elif missing and self.local_embedder is not None:
+            batch = self.local_embedder.encode_texts([texts[i] for i in missing], normalize_embeddings=True)
+        elif missing:
+            print("⚠️ Embeddings no disponibles, usando vectores vacíos")
+            return np.zeros((len(texts), 1), dtype="float32")
+
+        for row, i in enumerate(missing):
+            vectors[i] = batch[row:row + 1]
+            self.embedding_cache.put(model_id, texts[i], vectors[i])
+        return np.vstack(vectors) if vectors else np.zeros((0, 1), dtype="float32")
+
+    def _vector_search_ready(self) -> bool:
+        """Hay embeddings disponibles y compatibles con el índice activo"""
         # Verificar si tenemos algún tipo de embeddings disponible
         has_embeddings = self.embedding_client is not None or self.local_embedder is not None
 
         if not has_embeddings:
             # Sin embeddings, retornar lista vacía
             print("⚠️ Búsqueda vectorial no disponible, usando solo búsqueda textual")
-            return []
+            return False
 
         # Si usamos embeddings locales pero el índice FAISS es incompatible (diferente dimensión)
         # por ahora retornamos vacío hasta que se regenere el índice
@@ -118,84 +354,127 @@ class HybridRetriever:
             if index_dim != local_dim:
                 print(f"⚠️ Índice FAISS incompatible: {index_dim} dims vs {local_dim} dims (embeddings locales)")
                 print("💡 Solución: Regenerar índice con embeddings locales usando build_index.py")
-                return []
-
-        qv = self.embed(query)
-
-        # Verificar que el índice existe y tiene vectores
-        if self.index is None or self.index.ntotal == 0:
-            print("⚠️ No hay índice FAISS disponible")
-            return []
-
-        # Buscar más resultados para luego filtrar y rerankear
-        search_k = min(k * 3, self.index.ntotal)
-        D, I = self.index.search(qv, search_k)
-
-        candidates = []
-        for score, i in zip(D[0], I[0]):
-            if i == -1:
-                continue
-            if i < len(self.metas):  # Verificar que el índice es válido
-                m = self.metas[i]
-                # Filtrar por umbral de similitud
-                if score >= similarity_threshold:
-                    candidates.append({"score": float(score), **m})
-
-        # Rerankear por diversidad y relevancia
-        candidates = self._rerank_candidates(candidates, query, k)
-        return candidates[:k]
-
-    def _rerank_candidates(self, candidates: List[Dict], query: str, top_k: int) -> List[Dict]:
-        """Rerankear candidatos por diversidad y relevancia"""
-        if not candidates:
-            return candidates
-
-        # Puntaje compuesto: similitud + diversidad + recencia (si hay metadata de tiempo)
-        scored_candidates = []
-        seen_docs = set()
-
-        for cand in candidates:
-            score = cand.get("score", 0.0)
-
-            # Bonus por diversidad de documentos
-            doc_id = cand.get("doc_id", "")
-            if doc_id not in seen_docs:
-                score += 0.1  # Bonus por documento nuevo
-                seen_docs.add(doc_id)
-
-            # Bonus por relevancia de encabezado
-            heading = cand.get("heading_path", "").lower()
-            query_lower = query.lower()
-            if any(word in heading for word in query_lower.split()):
-                score += 0.05
-
-            cand["reranked_score"] = score
-            scored_candidates.append(cand)
-
-        # Ordenar por puntaje rerankeado
-        scored_candidates.sort(key=lambda x: x.get("reranked_score", 0), reverse=True)
-        return scored_candidates
-
-    def search_lexical(self, query: str, k=12) -> List[Dict]:
-        # Usa FTS5 con query literal; permite "permiso NEAR/3 construcción"
-        with get_conn(self.db_path) as con:
-            rows = fts_search(con, query, limit=k)
-        # Adaptado para nueva estructura de BD
-        return [{"score": 0.0, 
-                "chunk_id": str(r.get("chunk_id", r.get("rowid", "unknown"))),  # Asegurar que sea string
-                "doc_id": r["doc_id"], 
-                "heading_path": r["heading_path"], 
-                "page_start": r.get("page_start"), 
-                "page_end": r.get("page_end"), 
-                "text": r.get("text", ""), 
-                "snippet": r["snip"]} for r in rows]
+                return False
+        return True
+
+    def _resolve_filters(self, query: str, filters: Optional[Filters]) -> Tuple[Dict[str, List[str]], bool]:
+        """
+        Filtros normalizados y si fueron detectados automáticamente.
+        filters=None -> se extraen de la consulta ("TOMO 6", "Capítulo 3"); {} -> sin filtros.
+        """
+        if filters is None:
+            return (parse_query_filters(query) if SEARCH_AUTO_FILTERS else {}), True
+        return normalize_filters(filters), False
+
+    def search_vectors(self, query: str, k=12, similarity_threshold=0.7,
+                       timings: Optional[Dict[str, float]] = None,
+                       filters: Optional[Filters] = None) -> List[Dict]:
+        """
+        Búsqueda vectorial; con filtros de tomo/capítulo/tipo_seccion/fuente FAISS solo
+        evalúa las posiciones que los cumplen (IDSelector) y basta un k menor
+        """
+        return self.search_vectors_many([query], k=k, similarity_threshold=similarity_threshold,
+                                        timings=timings, filters=filters)[0]
+
+    def search_vectors_many(self, queries: List[str], k=12, similarity_threshold=0.7,
+                            timings: Optional[Dict[str, float]] = None,
+                            filters: Optional[Filters] = None) -> List[List[Dict]]:
+        """
+        search_vectors para varias consultas: embeddings en lote y un index.search
+        matricial por grupo de consultas con los mismos filtros
+        """
+        if not queries or not self._vector_search_ready():
+            return [[] for _ in queries]
+
+        t0 = time.perf_counter()
+        Q = self.embed_many(queries)
+        t1 = time.perf_counter()
+
+        resolved = [self._resolve_filters(q, filters) for q in queries]
+        groups: Dict[str, List[int]] = {}
+        for i, (f, auto) in enumerate(resolved):
+            groups.setdefault(json.dumps([f, auto], sort_keys=True), []).append(i)
+
+        tokens = [query_tokens(q) for q in queries]
+        per_query: List[List[Dict]] = [[] for _ in queries]
+        # Índice y metadatos de la misma versión aunque haya un hot-swap en curso
+        with self._use_snapshot() as snap:
+            # Verificar que el índice existe y tiene vectores
+            if snap.index is None or snap.index.ntotal == 0:
+                print("⚠️ No hay índice FAISS disponible")
+                return per_query
+
+            for rows in groups.values():
+                f, auto = resolved[rows[0]]
+                # Buscar más resultados para luego filtrar y rerankear
+                search_k, params = min(k * 3, snap.index.ntotal), None
+                if f:
+                    positions = snap.metas.positions_where(f)
+                    if len(positions):
+                        params = selector_search_params(snap.index, snap.search_params,
+                                                        snap.selector_ids(positions))
+                        search_k = min(k * 2, len(positions))
+                        print(f"🎯 Filtro {describe_filters(f)}: {len(positions)} de {snap.index.ntotal} vectores")
+                    elif auto:
+                        print(f"⚠️ Filtro detectado sin coincidencias ({describe_filters(f)}), búsqueda sin filtrar")
+                    else:
+                        continue
+                D, I = snap.index.search(Q[rows], search_k, params=params)
+                I = snap.to_positions(I)
+                # Filtrar, rerankear por diversidad y relevancia (vectorizado) y materializar el top-k
+                for row, i in enumerate(rows):
+                    per_query[i] = vector_hits(snap.metas, I[row], D[row], tokens[i], k, similarity_threshold)
+
+        if timings is not None:
+            timings["embed_ms"] = (t1 - t0) * 1000
+            timings["faiss_ms"] = (time.perf_counter() - t1) * 1000
+        return per_query
+
+    def search_lexical(self, query: str, k=12, timings: Optional[Dict[str, float]] = None,
+                       filters: Optional[Filters] = None) -> List[Dict]:
+        # FTS5 rankeado por bm25; el planificador arma OR/NEAR/prefijos desde lenguaje
+        # natural y respeta sintaxis FTS5 explícita, p. ej. 'NEAR(permiso construcción, 3)'
+        return self.search_lexical_many([query], k=k, timings=timings, filters=filters)[0]
+
+    def search_lexical_many(self, queries: List[str], k=12,
+                            timings: Optional[Dict[str, float]] = None,
+                            filters: Optional[Filters] = None) -> List[List[Dict]]:
+        """search_lexical para varias consultas reutilizando una sola conexión"""
+        t0 = time.perf_counter()
+        rows = []
+        with get_conn(self.db_path, readonly=True) as con:
+            for q in queries:
+                f, auto = self._resolve_filters(q, filters)
+                if not f:
+                    rows.append(fts_search(con, q, limit=k))
+                    continue
+                # FTS no conoce los valores canónicos: se filtra sobre un top-k ampliado
+                hits = fts_search(con, q, limit=k * 4)
+                kept = [r for r in hits if matches_filters(r, f)]
+                rows.append(kept[:k] if kept or not auto else hits[:k])
+        if timings is not None:
+            timings["fts_ms"] = (time.perf_counter() - t0) * 1000
+        # score: bm25 normalizado contra el mejor resultado (0-1)
+        return [[{"score": r.get("score", 0.0),
+                  "bm25": r.get("bm25"),
+                  "chunk_id": str(r.get("chunk_id", r.get("rowid", "unknown"))),  # Asegurar que sea string
+                  "doc_id": r["doc_id"],
+                  "heading_path": r["heading_path"],
+                  "page_start": r.get("page_start"),
+                  "page_end": r.get("page_end"),
+                  "text": r.get("text", ""),
+                  "snippet": r["snip"],
+                  "tomo": r.get("tomo"),
+                  "capitulo": r.get("capitulo"),
+                  "tipo_seccion": r.get("tipo_seccion"),
+                  "fuente": r.get("fuente")} for r in query_rows] for query_rows in rows]
 
     def fetch_texts(self, chunk_ids: List[str]) -> Dict[str, str]:
         # Recupera texto desde FTS por rowid (adaptado para estructura actual)
         if not chunk_ids:
             return {}
         
-        with get_conn(self.db_path) as con:
+        with get_conn(self.db_path, readonly=True) as con:
             # Convertir chunk_ids a enteros para la consulta SQL (rowid es entero)
             try:
                 int_chunk_ids = [int(cid) for cid in chunk_ids if cid and cid != "unknown"]
@@ -212,53 +491,268 @@ class HybridRetriever:
             # Retornar con chunk_id como string (clave del dict)
             return {str(r[0]): r[1] for r in cur.fetchall()}
 
-    def hybrid(self, query: str, k_vec=12, k_lex=12, final_k=6, similarity_threshold=0.7) -> List[Dict]:
-        vec = self.search_vectors(query, k=k_vec, similarity_threshold=similarity_threshold)
-        lex = self.search_lexical(query, k=k_lex)
-        # Fusión inteligente: combina resultados vectoriales y léxicos con diversidad
-        seen, fused = set(), []
-
-        # Priorizar resultados vectoriales (semánticos) primero
-        for cand in vec:
-            cid = cand["chunk_id"]
-            if cid in seen:
-                continue
-            seen.add(cid)
-            # Marcar como resultado semántico
-            cand["search_type"] = "semantic"
-            fused.append(cand)
-
-        # Agregar resultados léxicos si no hay suficientes
-        for cand in lex:
-            cid = cand["chunk_id"]
-            if cid in seen:
-                continue
-            seen.add(cid)
-            # Marcar como resultado léxico
-            cand["search_type"] = "lexical"
-            fused.append(cand)
-            if len(fused) >= final_k * 2:  # Buscar más para luego filtrar
-                break
-
-        # Ordenar por relevancia combinada
+    def _result_cache_key(self, query: str, k_vec, k_lex, final_k, similarity_threshold,
+                          fusion: str, weights: Optional[Dict[str, float]],
+                          filters: Optional[Filters] = None, rerank: bool = False) -> tuple:
+        return ResultCache.make_key(
+            f"{self.index_version}#{self._generation}", query, k_vec=k_vec, k_lex=k_lex, final_k=final_k,
+            similarity_threshold=similarity_threshold, fusion=fusion, weights=weights or {},
+            filters=None if filters is None else json.dumps(filters, sort_keys=True, default=str),
+            rerank=rerank)
+
+    def _fuse(self, vec: List[Dict], lex: List[Dict], final_k: int, fusion: str,
+              weights: Optional[Dict[str, float]], terms: Optional[List[Dict]] = None,
+              citations: Optional[List[Dict]] = None) -> List[Dict]:
+        weights = {"semantic": HYBRID_VECTOR_WEIGHT, "lexical": HYBRID_LEXICAL_WEIGHT, **(weights or {})}
+        # Los aciertos exactos por código/término van como fuente propia, primero en la fusión;
+        # las citas no exactas, al final (si el chunk ya vino de otra fuente, vale su texto completo)
+        fused = fuse({"terms": terms or [], "semantic": vec, "lexical": lex, "citations": citations or []},
+                     method=fusion, weights=weights, rrf_k=HYBRID_RRF_K, limit=final_k)
         for cand in fused:
-            base_score = cand.get("score", 0.0)
-            # Bonus por tipo de búsqueda
-            if cand.get("search_type") == "semantic":
-                base_score += 0.1
-            # Bonus por reranked_score si existe
-            reranked = cand.get("reranked_score")
-            if reranked:
-                base_score = reranked
-            cand["combined_score"] = base_score
-
-        fused.sort(key=lambda x: x.get("combined_score", 0), reverse=True)
-
-        # Traer textos para los mejores resultados
-        texts = self.fetch_texts([c["chunk_id"] for c in fused[:final_k]])
-        for c in fused:
-            c["text"] = texts.get(c["chunk_id"], "")
-        return fused[:final_k]
+            cand["combined_score"] = cand["fused_score"]
+        return fused
+
+    def search_citations(self, query: str, k: int = 6) -> List[Dict]:
+        """
+        Fragmentos de las Reglas/Secciones/Artículos citados en la consulta
+
+        Vacío si la consulta no cita encabezados numerados o si no existen.
+        hybrid() los sirve directo solo si todos son `exact` (mismo tipo y
+        tomo); si no, entran a la fusión junto a la búsqueda normal.
+        """
+        if not self.citation_lookup:
+            return []
+        citations = parse_citations(query)
+        if not citations:
+            return []
+        try:
+            with get_conn(self.db_path, readonly=True) as con:
+                return lookup_citations(con, citations, limit=k)
+        except Exception as e:
+            print(f"⚠️ Error en búsqueda por cita: {e}")
+            return []
+
+    def search_terms(self, query: str, k: int = 12, filters: Optional[Filters] = None) -> List[Dict]:
+        """Chunks con los códigos de zonificación / términos del glosario de la consulta"""
+        if not self.term_lookup:
+            return []
+        parsed = parse_terms(query)
+        if not parsed.codes and not parsed.terms:
+            return []
+        f, auto = self._resolve_filters(query, filters)
+        try:
+            with get_conn(self.db_path, readonly=True) as con:
+                hits = lookup_terms(con, parsed, limit=k * 4 if f else k)
+        except Exception as e:
+            print(f"⚠️ Error en búsqueda por códigos/términos: {e}")
+            return []
+        if not f:
+            return hits
+        kept = [h for h in hits if matches_filters(h, f)]
+        return kept[:k] if kept or not auto else hits[:k]
+
+    def _attach_texts(self, results: List[Dict]):
+        """Completar `text` con una sola consulta para los resultados que no lo traen"""
+        missing = [c["chunk_id"] for c in results if not c.get("text")]
+        texts = self.fetch_texts(missing) if missing else {}
+        for c in results:
+            if not c.get("text"):
+                text = texts.get(c["chunk_id"], "")
+                # Resultados por cita: solo el fragmento del encabezado citado
+                c["text"] = text[slice(*c["offsets"])] if c.get("offsets") else text
+        self._attach_token_counts(results)
+        self._attach_aliases(results)
+
+    def _attach_aliases(self, results: List[Dict]):
+        """
+        `aliases`: documentos/páginas donde la ingesta encontró el mismo pasaje
+        (near-duplicados colapsados en este chunk), con una sola consulta
+        """
+        missing = [c for c in results if "aliases" not in c and str(c.get("chunk_id", "")).isdigit()]
+        if not missing:
+            return
+        try:
+            with get_conn(self.db_path, readonly=True) as con:
+                aliases = aliases_for(con, (int(c["chunk_id"]) for c in missing))
+        except sqlite3.OperationalError:
+            # BD sin chunk_aliases (construida antes de la deduplicación)
+            aliases = {}
+        for c in missing:
+            c["aliases"] = aliases.get(int(c["chunk_id"]), [])
+
+    def _attach_token_counts(self, results: List[Dict]):
+        """
+        `n_tokens` medido en la ingesta (MetaStore) para resultados léxicos o por
+        término que no lo traen; los fragmentos por cita (offsets) se miden aparte
+        """
+        missing = [c for c in results
+                   if not c.get("n_tokens") and not c.get("offsets") and str(c.get("chunk_id", "")).isdigit()]
+        if not missing:
+            return
+        try:
+            with self._use_snapshot() as snap:
+                if snap.metas is None:
+                    return
+                counts = snap.metas.token_counts(int(c["chunk_id"]) for c in missing)
+        except Exception as e:
+            print(f"⚠️ No se pudieron leer los conteos de tokens: {e}")
+            return
+        for c in missing:
+            n = counts.get(int(c["chunk_id"]))
+            if n:
+                c["n_tokens"] = n
+
+    def hybrid(self, query: str, k_vec=12, k_lex=12, final_k=6, similarity_threshold=0.7,
+               fusion: str = None, weights: Dict[str, float] = None,
+               concurrent: bool = None, timings: Optional[Dict[str, float]] = None,
+               filters: Optional[Filters] = None, rerank: bool = None) -> List[Dict]:
+        """
+        Búsqueda híbrida: vectorial + léxica fusionadas en un solo ranking
+
+        Args:
+            fusion: "rrf", "minmax" o "zscore" (por defecto HYBRID_FUSION)
+            weights: Peso por fuente, p. ej. {"semantic": 1.0, "lexical": 0.5}
+            concurrent: Solapar embedding+FAISS con FTS (por defecto HYBRID_CONCURRENT)
+            timings: Dict opcional que se llena con los ms de cada etapa
+            filters: {"tomo": "6", "capitulo": "3", ...}; None = detectarlos en la consulta, {} = ninguno
+            rerank: Reordenar con el cross-encoder y devolver min(final_k, RERANK_TOP_N)
+                    resultados (por defecto, si está cargado)
+        """
+        timings = {} if timings is None else timings
+        t_start = time.perf_counter()
+        concurrent = self.concurrent if concurrent is None else concurrent
+        fusion = fusion or HYBRID_FUSION
+        rerank = self.reranker is not None and (rerank is None or rerank)
+
+        # Consultas repetidas sobre la misma versión del índice no repiten la búsqueda
+        cache_key = self._result_cache_key(query, k_vec, k_lex, final_k, similarity_threshold,
+                                           fusion, weights, filters, rerank)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            self._attach_texts(cached)
+            timings["cache_hit_ms"] = (time.perf_counter() - t_start) * 1000
+            print(f"⚡ hybrid desde cache ({timings['cache_hit_ms']:.1f}ms)")
+            return cached
+
+        # Citas exactas ("Sección 10.1.5.1"): se sirven directo, sin embeddings ni FTS.
+        # Si el tipo o el tomo no coinciden ("Regla 6.1" -> "Capítulo 6.1") van a la fusión
+        cited = self.search_citations(query, k=final_k)
+        if cited and all(c["exact"] for c in cited):
+            timings["citation_ms"] = timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+            self.result_cache.put(cache_key, cited)
+            self._record_timings(timings)
+            print(f"📑 hybrid por cita: {', '.join(c['citation'] for c in cited)} ({timings['citation_ms']:.1f}ms)")
+            return cited
+
+        if concurrent:
+            # La llamada de embeddings (red) corre en el executor mientras este hilo hace FTS
+            vec_future = self._get_executor().submit(
+                self.search_vectors, query, k_vec, similarity_threshold, timings, filters)
+            lex = self.search_lexical(query, k=k_lex, timings=timings, filters=filters)
+            terms = self.search_terms(query, k=k_lex, filters=filters)
+            vec = vec_future.result()
+        else:
+            vec = self.search_vectors(query, k=k_vec, similarity_threshold=similarity_threshold,
+                                      timings=timings, filters=filters)
+            lex = self.search_lexical(query, k=k_lex, timings=timings, filters=filters)
+            terms = self.search_terms(query, k=k_lex, filters=filters)
+        timings["retrieval_ms"] = (time.perf_counter() - t_start) * 1000
+
+        t0 = time.perf_counter()
+        fused = self._fuse(vec, lex, max(final_k, RERANK_CANDIDATES) if rerank else final_k, fusion, weights,
+                           terms, cited)
+        timings["fusion_ms"] = (time.perf_counter() - t0) * 1000
+
+        # FTS ya trajo `content`; solo se consultan textos de resultados puramente vectoriales
+        t0 = time.perf_counter()
+        self._attach_texts(fused)
+        timings["fetch_texts_ms"] = (time.perf_counter() - t0) * 1000
+
+        if rerank:
+            t0 = time.perf_counter()
+            fused = self.reranker.rerank(query, fused, top_n=min(final_k, RERANK_TOP_N))
+            timings["cross_encoder_ms"] = (time.perf_counter() - t0) * 1000
+        timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+
+        self.result_cache.put(cache_key, fused)
+        self._record_timings(timings)
+        print("⏱️ hybrid: " + " | ".join(f"{k[:-3]} {v:.1f}ms" for k, v in timings.items()))
+        return fused
+
+    def hybrid_many(self, queries: List[str], k_vec=12, k_lex=12, final_k=6, similarity_threshold=0.7,
+                    fusion: str = None, weights: Dict[str, float] = None,
+                    timings: Optional[Dict[str, float]] = None,
+                    filters: Optional[Filters] = None, rerank: bool = None) -> List[List[Dict]]:
+        """
+        hybrid() para un lote de consultas (evaluación, precalentar cache, subconsultas)
+
+        Embeddings en una sola llamada/pasada, un `index.search` matricial, FTS sobre
+        una sola conexión y una sola consulta de textos para todo el lote.
+
+        Returns:
+            Lista de resultados por consulta, en el mismo orden que `queries`
+        """
+        timings = {} if timings is None else timings
+        t_start = time.perf_counter()
+        fusion = fusion or HYBRID_FUSION
+        rerank = self.reranker is not None and (rerank is None or rerank)
+        results: List[Optional[List[Dict]]] = [None] * len(queries)
+
+        keys = [self._result_cache_key(q, k_vec, k_lex, final_k, similarity_threshold, fusion, weights,
+                                       filters, rerank)
+                for q in queries]
+        for i, key in enumerate(keys):
+            results[i] = self.result_cache.get(key)
+        pending = [i for i, r in enumerate(results) if r is None]
+        # Los aciertos se cuentan en result_cache (get_stats()["result_cache"]); timings es solo de ms
+        cache_hits = len(queries) - len(pending)
+
+        # Consultas con citas exactas no pasan por embeddings ni FTS; las demás citas van a la fusión
+        t0 = time.perf_counter()
+        loose: Dict[int, List[Dict]] = {}
+        for i in pending:
+            hits = self.search_citations(queries[i], k=final_k)
+            if hits and all(c["exact"] for c in hits):
+                results[i] = hits
+            elif hits:
+                loose[i] = hits
+        cited = [i for i in pending if results[i] is not None]
+        for i in cited:
+            self.result_cache.put(keys[i], results[i])
+        pending = [i for i in pending if results[i] is None]
+        timings["citation_ms"] = (time.perf_counter() - t0) * 1000
+
+        if pending:
+            pending_queries = [queries[i] for i in pending]
+            vec_future = self._get_executor().submit(
+                self.search_vectors_many, pending_queries, k_vec, similarity_threshold, timings, filters)
+            lex_lists = self.search_lexical_many(pending_queries, k=k_lex, timings=timings, filters=filters)
+            term_lists = [self.search_terms(q, k=k_lex, filters=filters) for q in pending_queries]
+            vec_lists = vec_future.result()
+            timings["retrieval_ms"] = (time.perf_counter() - t_start) * 1000
+
+            t0 = time.perf_counter()
+            limit = max(final_k, RERANK_CANDIDATES) if rerank else final_k
+            for i, vec, lex, terms in zip(pending, vec_lists, lex_lists, term_lists):
+                results[i] = self._fuse(vec, lex, limit, fusion, weights, terms, loose.get(i))
+            timings["fusion_ms"] = (time.perf_counter() - t0) * 1000
+
+        t0 = time.perf_counter()
+        self._attach_texts([c for r in results for c in r])
+        timings["fetch_texts_ms"] = (time.perf_counter() - t0) * 1000
+
+        if rerank and pending:
+            t0 = time.perf_counter()
+            for i in pending:
+                results[i] = self.reranker.rerank(queries[i], results[i], top_n=min(final_k, RERANK_TOP_N))
+            timings["cross_encoder_ms"] = (time.perf_counter() - t0) * 1000
+        for i in pending:
+            self.result_cache.put(keys[i], results[i])
+        timings["total_ms"] = (time.perf_counter() - t_start) * 1000
+
+        print(f"⏱️ hybrid_many ({len(queries)} consultas, {cache_hits} desde cache): "
+              + " | ".join(f"{k[:-3]} {v:.1f}ms" for k, v in timings.items() if k.endswith("_ms")))
+        return results
 
     def add_to_index(self, texts: List[str], metadata: List[Dict], batch_size: int = 64):
         """Agregar nuevos textos al índice FAISS incrementalmente"""
@@ -268,8 +762,8 @@ class HybridRetriever:
 
         print(f"🔄 Agregando {len(texts)} nuevos textos al índice...")
 
-        # Generar embeddings en lotes
-        all_embeddings = []
+        # Generar embeddings en lotes (conservando qué textos tienen vector)
+        all_embeddings, embedded = [], []
         for i in range(0, len(texts), batch_size):
             batch_texts = texts[i:i+batch_size]
             try:
@@ -280,6 +774,7 @@ class HybridRetriever:
                 batch_embeddings = [np.array(data.embedding, dtype=np.float32)
                                   for data in response.data]
                 all_embeddings.extend(batch_embeddings)
+                embedded.extend(zip(batch_texts, metadata[i:i+batch_size]))
             except Exception as e:
                 print(f"⚠️ Error generando embeddings para lote {i//batch_size}: {e}")
                 continue
@@ -287,42 +782,68 @@ class HybridRetriever:
         if not all_embeddings:
             return
 
+        # El texto vive en SQLite (fts_chunks); el almacén de metadatos guarda el rowid
+        with get_conn(self.db_path) as con:
+            for text, meta in embedded:
+                cur = con.execute(
+                    """INSERT INTO fts_chunks(content, tomo, capitulo, articulo, tipo_seccion, fuente)
+                       VALUES(?,?,?,?,?,?)""",
+                    (text, meta.get("tomo"), meta.get("capitulo"), meta.get("articulo"),
+                     meta.get("tipo_seccion"), meta.get("fuente") or meta.get("doc_id"))
+                )
+                meta["rowid"] = cur.lastrowid
+                meta["chunk_id"] = meta.get("chunk_id") or str(cur.lastrowid)
+                if self.citation_lookup:
+                    index_chunk(con, cur.lastrowid, text, meta.get("tomo") or meta.get("fuente"))
+                if self.term_lookup:
+                    index_chunk_terms(con, cur.lastrowid, text, meta.get("tomo") or meta.get("fuente"))
+
         # Normalizar y agregar al índice
         embeddings_array = np.array(all_embeddings)
         faiss.normalize_L2(embeddings_array)
 
-        # Agregar al índice FAISS
-        self.index.add(embeddings_array)
+        # Agregar sobre una copia: las búsquedas en curso siguen con la versión actual
+        snap = self._snapshot.writable_copy()
+        if snap.id_map:
+            snap.index.add_with_ids(embeddings_array, np.array([m["rowid"] for _, m in embedded], dtype=np.int64))
+        else:
+            snap.index.add(embeddings_array)
 
         # Agregar metadatos
-        for meta in metadata:
-            meta["chunk_id"] = meta.get("chunk_id", str(uuid.uuid4()))
-            self.metas.append(meta)
-
-        # Guardar índice actualizado
-        self._save_index()
-        print(f"✅ Agregados {len(all_embeddings)} vectores al índice. Total: {len(self.metas)}")
+        for _, meta in embedded:
+            snap.metas.append(meta)
 
-    def _save_index(self):
-        """Guardar índice y metadatos"""
+        # Guardar índice actualizado y activarlo
         try:
-            faiss.write_index(self.index, self.faiss_path)
-            metas_path = os.path.join(os.path.dirname(self.faiss_path), "metas.jsonl")
-            with open(metas_path, "w", encoding="utf-8") as out:
-                for m in self.metas:
-                    out.write(json.dumps(m, ensure_ascii=False) + "\n")
+            self._publish_snapshot(snap, source="add_to_index")
             print("💾 Índice guardado exitosamente")
         except Exception as e:
             print(f"⚠️ Error guardando índice: {e}")
+            self._swap(snap)
+        print(f"✅ Agregados {len(all_embeddings)} vectores al índice. Total: {len(snap.metas)}")
 
     def rebuild_index(self, data_dir: str):
-        """Reconstruir índice completo desde cero"""
+        """
+        Reconstruir índice completo en un snapshot nuevo y activarlo sin reinicio
+
+        Usa la ingesta completa (`ingest.ingest(full=True, in_place=True)`): mismo
+        esquema de fts_chunks y rowids como ids del índice. Las tablas de chunks se
+        recargan en una transacción del escritor del pool, sin reemplazar el archivo:
+        conversaciones y métricas que la app escribe mientras tanto se conservan
+        """
         print(f"🔄 Reconstruyendo índice desde {data_dir}...")
-        from .build_index import main as build_main
-        build_main(data_dir)
-        # Recargar índice
-        self.index = faiss.read_index(self.faiss_path)
-        metas_path = os.path.join(os.path.dirname(self.faiss_path), "metas.jsonl")
-        with open(metas_path, "r", encoding="utf-8") as f:
-            self.metas = [json.loads(l) for l in f]
-        print("✅ Índice reconstruido y recargado")
+        from .ingest import ingest
+        # Los chunks se embeben con el mismo modelo que las consultas de este proceso
+        embedder = "local" if self.local_embedder is not None else "azure"
+        # Si falla, ingest descarta su staging y la versión activa no se toca
+        summary = ingest(data_dir, db_path=self.db_path, snapshot_dir=self.snapshots.root,
+                         faiss_path=self.faiss_path, full=True, in_place=True, embedder=embedder)
+        version = summary["version"]
+        if version is None:
+            print(f"⚠️ No hay tomos en {data_dir}: se mantiene {self._snapshot.version}")
+            return
+        self._pointer_mtime = self.snapshots.pointer_mtime()
+        # Las búsquedas en curso terminan sobre la versión anterior
+        self._swap(self._open_snapshot(version))
+        self._prune_snapshots()
+        print(f"✅ Índice reconstruido y activado: {version}")
@@ -12,9 +12,11 @@ from datetime import datetime, timedelta
 from openai import AzureOpenAI
 from .config import (
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_API_VERSION,
-    AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH
+    AZURE_OPENAI_EMBEDDING_DEPLOYMENT, DB_PATH, FAISS_MMAP,
+    MEMORY_INDEX_TYPE, MEMORY_VECTOR_DTYPE
 )
 from .db import get_conn
+from .ann_index import load_index, save_index_atomic, empty_index, encode_vector_blob
 
 class SemanticMemory:
     """
@@ -90,13 +92,16 @@ class SemanticMemory:
     def _load_or_create_memory_index(self):
         """Cargar o crear índice FAISS para memoria"""
         try:
-            self.memory_index = faiss.read_index(self.memory_index_path)
+            # Mapeado de solo lectura hasta la primera escritura
+            self.memory_index, self.memory_index_mmapped = load_index(self.memory_index_path, mmap=FAISS_MMAP)
             with open(self.memory_metas_path, 'r', encoding='utf-8') as f:
                 self.memory_metas = [json.loads(line) for line in f]
             print(f"✅ Índice de memoria cargado: {len(self.memory_metas)} memorias")
         except:
             # Crear índice vacío
-            self.memory_index = faiss.IndexFlatIP(1536)  # Dimensión de text-embedding-3-small
+            # Dimensión de text-embedding-3-small; fp16 ocupa la mitad que float32 y no requiere entrenamiento
+            self.memory_index = empty_index(1536, MEMORY_INDEX_TYPE)
+            self.memory_index_mmapped = False
             self.memory_metas = []
             print("🆕 Índice de memoria semántica creado")
 
@@ -124,7 +129,7 @@ class SemanticMemory:
         combined_text = f"Pregunta: {user_query}\nRespuesta: {assistant_response}"
 
         embedding = self._embed_text(combined_text)
-        embedding_blob = embedding.tobytes() if embedding is not None else None
+        embedding_blob = encode_vector_blob(embedding, MEMORY_VECTOR_DTYPE) if embedding is not None else None
 
         with get_conn(self.memory_db_path) as conn:
             cursor = conn.execute("""
@@ -137,6 +142,9 @@ class SemanticMemory:
 
         # Agregar al índice FAISS si tenemos embedding
         if embedding is not None:
+            if self.memory_index_mmapped:
+                # Un índice mapeado no admite add(): pasar a copia propia
+                self.memory_index, self.memory_index_mmapped = load_index(self.memory_index_path, mmap=False)
             self.memory_index.add(embedding.reshape(1, -1))
             meta = {
                 "id": memory_id,
@@ -192,7 +200,7 @@ class SemanticMemory:
         """Búsqueda léxica como fallback cuando no hay embeddings"""
         cutoff_date = datetime.now() - timedelta(days=days_back)
 
-        with get_conn(self.memory_db_path) as conn:
+        with get_conn(self.memory_db_path, readonly=True) as conn:
             if conversation_id:
                 cursor = conn.execute("""
                     SELECT id, conversation_id, user_query, assistant_response,
@@ -259,7 +267,7 @@ class SemanticMemory:
     def _save_memory_index(self):
         """Guardar índice FAISS y metadatos"""
         try:
-            faiss.write_index(self.memory_index, self.memory_index_path)
+            save_index_atomic(self.memory_index, self.memory_index_path)
             with open(self.memory_metas_path, 'w', encoding='utf-8') as f:
                 for meta in self.memory_metas:
                     f.write(json.dumps(meta, ensure_ascii=False) + '\n')
@@ -269,7 +277,7 @@ class SemanticMemory:
     def consolidate_memories(self, conversation_id: str = None):
         """Consolidar memorias importantes en conocimiento a largo plazo"""
         # Obtener memorias con alta importancia y frecuencia de acceso
-        with get_conn(self.memory_db_path) as conn:
+        with get_conn(self.memory_db_path, readonly=True) as conn:
             if conversation_id:
                 cursor = conn.execute("""
                     SELECT user_query, assistant_response, importance_score, access_count
@@ -330,7 +338,7 @@ class SemanticMemory:
     def _add_long_term_memory(self, memory_type: str, content: str, confidence: float = 1.0):
         """Agregar memoria a largo plazo"""
         embedding = self._embed_text(content)
-        embedding_blob = embedding.tobytes() if embedding is not None else None
+        embedding_blob = encode_vector_blob(embedding, MEMORY_VECTOR_DTYPE) if embedding is not None else None
 
         with get_conn(self.memory_db_path) as conn:
             conn.execute("""
@@ -351,7 +359,7 @@ class SemanticMemory:
             return []
 
         # Obtener todas las memorias a largo plazo con embeddings
-        with get_conn(self.memory_db_path) as conn:
+        with get_conn(self.memory_db_path, readonly=True) as conn:
             cursor = conn.execute("""
                 SELECT id, memory_type, content, confidence
                 FROM long_term_memories
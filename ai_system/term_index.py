@@ -0,0 +1,201 @@
+"""
+Índice exacto de códigos de zonificación y términos del glosario
+=================================================================
+
+FTS5 parte "R-1" en los tokens "r" y "1", y un `LIKE '%R-1%'` recorre todo
+el corpus. En la ingesta se registra cada código (R-1, C-2, RT-1, CR-3,
+JP-RP-41, ...) y cada término definido en el glosario (TOMO 12) en la tabla
+`term_index`:
+
+    term, kind, chunk_id (rowid en fts_chunks), start, end, hits
+
+- kind = "codigo": `start`/`end` marcan la primera aparición, `hits` cuenta
+  las apariciones en el chunk (los chunks que más lo mencionan van primero).
+- kind = "termino": `start`/`end` delimitan la definición numerada
+  ("18. Acre - Medida de terreno ...") dentro de `content`.
+
+En el request, `parse_terms` extrae de la consulta los códigos y los n-gramas
+candidatos a término, y `lookup_terms` los resuelve con el índice (term, kind).
+"""
+
+import re
+import sqlite3
+from typing import Dict, List, NamedTuple, Optional
+from .db import get_conn, fold_accents, SPANISH_STOPWORDS
+from .query_filters import canonical_value
+
+GLOSSARY_TOMO = "12"
+MAX_TERM_WORDS = 8      # el término más largo del glosario; tope de los n-gramas de la consulta
+MAX_QUERY_TERMS = 64    # n-gramas por consulta
+
+# Códigos en el texto: "R-1", "RT-1", "C-2A", "JP-RP-41", "LT-CR-3"
+_CODE = re.compile(r"(?<![\w-])([A-Z]{1,4}(?:-[A-Z]{1,4})*-\d{1,3}[A-Z]?)(?![\w-])")
+# Códigos en la consulta: también en minúsculas o sin guion ("r1", "rt-1")
+_QUERY_CODE = re.compile(r"(?<![\w-])([a-z]{1,4}(?:-[a-z]{1,4})*)(-?)(\d{1,3}[a-z]?)(?![\w-])", re.IGNORECASE)
+# Definiciones del glosario: "18. Acre - Medida de terreno ..." (guion, raya o semiraya)
+_DEFINITION = re.compile(r"(?m)^[ \t]*\d{1,4}\.[ \t]+([A-ZÁÉÍÓÚÑ][^\n]{0,100}?)[ \t]+[-—–][ \t]")
+_ACRONYM = re.compile(r"\(([A-Z]{2,10})\)")
+# Preguntas de definición: habilitan términos de una sola palabra ("¿qué es un acre?")
+_DEFINITION_CUE = re.compile(r"\b(que es|que son|que significa|significado|defin\w*|concepto|glosario)\b")
+
+TERM_SCHEMA = """
+CREATE TABLE IF NOT EXISTS term_index (
+    term TEXT NOT NULL,          -- 'R-1' | 'acometida de acueductos'
+    kind TEXT NOT NULL,          -- codigo | termino
+    chunk_id INTEGER NOT NULL,   -- rowid en fts_chunks
+    start INTEGER NOT NULL,      -- primera aparición / inicio de la definición
+    end INTEGER NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_term ON term_index(term, kind);
+CREATE INDEX IF NOT EXISTS idx_term_chunk ON term_index(chunk_id);
+"""
+
+
+class TermQuery(NamedTuple):
+    codes: List[str]   # ya normalizados ("R-1")
+    terms: List[str]   # n-gramas normalizados, los más largos primero
+
+
+def normalize_term(text: str) -> str:
+    """Forma de búsqueda de un término: sin acentos, minúsculas y espacios simples"""
+    return " ".join(fold_accents(text).lower().split())
+
+
+def extract_codes(text: str) -> Dict[str, List[int]]:
+    """Códigos de zonificación del texto -> offsets de cada aparición"""
+    found: Dict[str, List[int]] = {}
+    for m in _CODE.finditer(text or ""):
+        found.setdefault(m.group(1), []).append(m.start(1))
+    return found
+
+
+def extract_definitions(text: str) -> List[Dict]:
+    """Términos definidos en un chunk del glosario con los offsets de su definición"""
+    matches = list(_DEFINITION.finditer(text or ""))
+    found = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        label = m.group(1).strip()
+        names = [_ACRONYM.sub("", label)] + _ACRONYM.findall(label)
+        for name in names:
+            term = normalize_term(name)
+            if term and len(term.split()) <= MAX_TERM_WORDS:
+                found.append({"term": term, "start": m.start(1), "end": end})
+    return found
+
+
+def parse_terms(query: str) -> TermQuery:
+    """Códigos y n-gramas candidatos a término de la consulta"""
+    codes = []
+    for m in _QUERY_CODE.finditer(query or ""):
+        if not m.group(2) and len(m.group(1)) > 3:
+            continue  # sin guion solo formas cortas ("r1", "rt1"), no palabras con números
+        code = f"{m.group(1)}-{m.group(3)}".upper()
+        if code not in codes:
+            codes.append(code)
+    words = normalize_term(re.sub(r"[^\w\s-]", " ", query or "")).split()
+    min_words = 1 if _DEFINITION_CUE.search(normalize_term(query or "")) else 2
+    # Consultas largas: se acortan los n-gramas antes que perder los cortos (casi
+    # todos los términos del glosario tienen 1-4 palabras)
+    longest = min(MAX_TERM_WORDS, len(words))
+    while longest > min_words and sum(len(words) - n + 1 for n in range(min_words, longest + 1)) > MAX_QUERY_TERMS:
+        longest -= 1
+    # Ningún término del glosario termina en stopword ("que", "area de")
+    terms = [" ".join(words[i:i + n])
+             for n in range(longest, min_words - 1, -1)
+             for i in range(len(words) - n + 1)
+             if words[i + n - 1] not in SPANISH_STOPWORDS]
+    return TermQuery(codes, terms[:MAX_QUERY_TERMS])
+
+
+def index_chunk_terms(con: sqlite3.Connection, chunk_id: int, text: str, tomo: Optional[str]) -> int:
+    """Registrar códigos y (si es glosario) términos de un chunk; retorna cuántas filas"""
+    con.execute("DELETE FROM term_index WHERE chunk_id = ?", (chunk_id,))
+    rows = [(code, "codigo", chunk_id, offsets[0], offsets[0] + len(code), len(offsets))
+            for code, offsets in extract_codes(text).items()]
+    if tomo and canonical_value("tomo", tomo) == GLOSSARY_TOMO:
+        rows += [(d["term"], "termino", chunk_id, d["start"], d["end"], 1) for d in extract_definitions(text)]
+    con.executemany(
+        "INSERT INTO term_index(term, kind, chunk_id, start, end, hits) VALUES(?,?,?,?,?,?)", rows)
+    return len(rows)
+
+
+def build_term_index(con: sqlite3.Connection) -> int:
+    """Reconstruir el índice completo desde fts_chunks"""
+    con.executescript(TERM_SCHEMA)
+    con.execute("DELETE FROM term_index")
+    total = 0
+    for rowid, content, tomo in con.execute("SELECT rowid, content, tomo FROM fts_chunks").fetchall():
+        total += index_chunk_terms(con, rowid, content, tomo)
+    return total
+
+
+def ensure_term_index(db_path: str) -> bool:
+    """Crear y poblar el índice si no existe (BD anteriores a esta versión). True si lo construyó."""
+    with get_conn(db_path, readonly=True) as con:
+        exists = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'term_index'").fetchone()
+        has_fts = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'fts_chunks'").fetchone()
+    if exists or not has_fts:
+        return False
+    with get_conn(db_path) as con:
+        total = build_term_index(con)
+    print(f"🏷️ Índice de códigos/términos construido: {total} entradas")
+    return True
+
+
+def lookup_terms(con: sqlite3.Connection, parsed: TermQuery, limit: int = 6) -> List[Dict]:
+    """
+    Chunks de los códigos y términos de la consulta (solo búsquedas por índice)
+
+    Los códigos se intercalan (un chunk por código por turno) para que
+    "diferencia entre R-1 y C-2" traiga ambos. Del glosario se usa el término
+    más largo que exista.
+    """
+    select = """SELECT t.term, t.kind, t.chunk_id, t.start, t.end, f.content, f.tomo, f.capitulo,
+                       f.articulo, f.tipo_seccion, f.fuente
+                FROM term_index t JOIN fts_chunks f ON f.rowid = t.chunk_id"""
+    per_code = []
+    for code in parsed.codes:
+        per_code.append(con.execute(
+            select + " WHERE t.term = ? AND t.kind = 'codigo' ORDER BY t.hits DESC, t.chunk_id LIMIT ?",
+            (code, limit)).fetchall())
+    rows = [r for turn in zip(*[c + [None] * (limit - len(c)) for c in per_code]) for r in turn if r]
+
+    if parsed.terms and len(rows) < limit:
+        qmarks = ",".join("?" * len(parsed.terms))
+        rows += con.execute(
+            select + f" WHERE t.term IN ({qmarks}) AND t.kind = 'termino' ORDER BY length(t.term) DESC LIMIT ?",
+            parsed.terms + [limit]).fetchall()
+
+    results, seen = [], set()
+    for row in rows:
+        if row["chunk_id"] in seen:
+            continue
+        seen.add(row["chunk_id"])
+        hit = {
+            "chunk_id": str(row["chunk_id"]),
+            "doc_id": row["fuente"] or row["tomo"] or "",
+            "heading_path": f"TOMO {row['tomo']}" if row["tomo"] else "",
+            "term": row["term"],
+            "text": row["content"],
+            "tomo": row["tomo"],
+            "capitulo": row["capitulo"],
+            "articulo": row["articulo"],
+            "tipo_seccion": row["tipo_seccion"],
+            "fuente": row["fuente"],
+            "page_start": None,
+            "page_end": None,
+            "score": 1.0,
+            "search_type": "terms",
+        }
+        if row["kind"] == "termino":
+            # Del glosario basta la definición
+            hit["text"] = row["content"][row["start"]:row["end"]]
+            hit["offsets"] = (row["start"], row["end"])
+        else:
+            hit["match_start"] = row["start"]
+        results.append(hit)
+    return results[:limit]
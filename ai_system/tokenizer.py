@@ -0,0 +1,55 @@
+"""
+Conteo de tokens compatible con el modelo desplegado
+=====================================================
+
+Los presupuestos de chunking (CHUNK_TOKENS/CHUNK_OVERLAP) y de contexto
+(CONTEXT_TOKEN_BUDGET) se miden con el mismo tokenizer BPE del deployment
+(`tiktoken`, encoding TOKENIZER_ENCODING), localmente y sin llamadas a la API.
+
+tiktoken descarga el archivo BPE la primera vez (se cachea en
+TIKTOKEN_CACHE_DIR). Es opcional: sin él, o sin el archivo, se usa la
+estimación de ~4 caracteres por token de `chunker.approx_tokens` y se avisa
+una vez. `tokenizer_name()` entra en la firma de chunking de la ingesta, así
+que instalarlo (o cambiar de encoding) provoca una reconstrucción con
+conteos exactos.
+
+En la ingesta cada chunk guarda su conteo (`n_tokens` en el MetaStore); en
+el request el contexto se arma contra el presupuesto sin volver a tokenizar.
+"""
+
+from functools import lru_cache
+from .config import TOKENIZER_ENCODING
+from .chunker import approx_tokens
+
+
+@lru_cache(maxsize=4)
+def _encoding(name: str = TOKENIZER_ENCODING):
+    try:
+        import tiktoken  # dependencia opcional
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        print(f"⚠️ Tokenizer {name} no disponible ({e}): conteo estimado por caracteres")
+        return None
+
+
+def tokenizer_name() -> str:
+    """Encoding en uso ('approx' si no hay tiktoken)"""
+    return TOKENIZER_ENCODING if _encoding() is not None else "approx"
+
+
+def count_tokens(text: str) -> int:
+    enc = _encoding()
+    if enc is None:
+        return approx_tokens(text or "")
+    return len(enc.encode(text or "", disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Prefijo de `text` con a lo sumo max_tokens tokens"""
+    if max_tokens <= 0:
+        return ""
+    enc = _encoding()
+    if enc is None:
+        return text[:max_tokens * 4]
+    tokens = enc.encode(text or "", disallowed_special=())
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max_tokens])
@@ -252,7 +252,8 @@ else:
 try:
     from ai_system.retrieve import HybridRetriever
     from ai_system.answer import AnswerEngine
-    from ai_system.db import get_conn, fts_search
+    from ai_system.db import get_conn, fts_search, build_fts_query
+    from ai_system.term_index import parse_terms, lookup_terms, ensure_term_index
     SISTEMA_AI_DISPONIBLE = True
     logger.info("✅ Sistema de IA reorganizado importado correctamente")
 except ImportError as e:
@@ -594,57 +595,41 @@ try:
             
             cursor = conn.cursor()
             results = []
+            vistos = set()
             
-            # Estrategia 1: Intentar búsqueda FTS con términos limpios
-            try:
-                # Limpiar consulta para FTS (quitar caracteres problemáticos)
-                consulta_fts = consulta.replace("-", " ").replace(".", " ").replace(",", " ")
-                cursor.execute("""
-                    SELECT content, tomo, capitulo, articulo 
-                    FROM fts_chunks 
-                    WHERE content MATCH ? 
-                    LIMIT 5
-                """, (consulta_fts,))
-                results = cursor.fetchall()
-                logger.debug(f"Búsqueda FTS exitosa: {len(results)} resultados")
-            except Exception as e:
-                logger.debug(f"Búsqueda FTS falló: {e}")
-                results = []
+            # Estrategia 1: Códigos de zonificación (R-1, C-2, ...) y términos del glosario
+            # por índice exacto (FTS parte "R-1" en "r" y "1")
+            if SISTEMA_AI_DISPONIBLE:
+                try:
+                    for hit in lookup_terms(conn, parse_terms(consulta), limit=5):
+                        vistos.add(int(hit["chunk_id"]))
+                        # La vista previa arranca cerca de la primera mención del código
+                        texto = hit["text"][max(0, hit.get("match_start", 0) - 150):]
+                        results.append((texto, hit["tomo"], hit["capitulo"], hit["articulo"]))
+                    logger.debug(f"Búsqueda por códigos/términos: {len(results)} resultados")
+                except Exception as e:
+                    logger.debug(f"Índice de códigos/términos no disponible: {e}")
             
-            # Estrategia 2: Si FTS falla o no encuentra nada, usar LIKE con términos originales
-            if not results:
-                palabras_clave = consulta.split()
-                like_conditions = []
-                params = []
-                
-                for palabra in palabras_clave:
-                    if len(palabra) > 2:  # Solo palabras de 3+ caracteres
-                        like_conditions.append("content LIKE ?")
-                        params.append(f"%{palabra}%")
-                
-                if like_conditions:
-                    query = f"""
-                        SELECT content, tomo, capitulo, articulo 
+            # Estrategia 2: Búsqueda FTS rankeada (bm25) con la consulta planificada (OR/prefijos, sin stopwords)
+            # Ninguna estrategia recorre la tabla completa: sin índice no hay resultado
+            if len(results) < 5:
+                try:
+                    if SISTEMA_AI_DISPONIBLE:
+                        consulta_fts = build_fts_query(consulta)
+                    else:
+                        consulta_fts = consulta.replace("-", " ").replace(".", " ").replace(",", " ")
+                    cursor.execute("""
+                        SELECT rowid, content, tomo, capitulo, articulo 
                         FROM fts_chunks 
-                        WHERE {' OR '.join(like_conditions)}
-                        LIMIT 5
-                    """
-                    cursor.execute(query, params)
-                    results = cursor.fetchall()
-                    logger.debug(f"Búsqueda LIKE exitosa: {len(results)} resultados")
-            
-            # Estrategia 3: Búsqueda específica para códigos de zonificación
-            if not results and any(term in consulta.upper() for term in ['R-1', 'R-2', 'R-3', 'C-1', 'C-2', 'I-1']):
-                # Buscar códigos de zonificación específicamente
-                cursor.execute("""
-                    SELECT content, tomo, capitulo, articulo 
-                    FROM fts_chunks 
-                    WHERE content LIKE '%R-1%' OR content LIKE '%R-2%' OR 
-                          content LIKE '%comercial%' OR content LIKE '%residencial%'
-                    LIMIT 5
-                """)
-                results = cursor.fetchall()
-                logger.debug(f"Búsqueda zonificación específica: {len(results)} resultados")
+                        WHERE fts_chunks MATCH ? 
+                        ORDER BY bm25(fts_chunks)
+                        LIMIT ?
+                    """, (consulta_fts, 5 + len(vistos)))
+                    fts_results = [tuple(r[1:]) for r in cursor.fetchall() if r[0] not in vistos]
+                    results.extend(fts_results[:5 - len(results)])
+                    logger.debug(f"Búsqueda FTS exitosa: {len(fts_results)} resultados")
+                except Exception as e:
+                    logger.debug(f"Búsqueda FTS falló: {e}")
             
             conn.close()
             
@@ -669,6 +654,13 @@ try:
             logger.error(f"Error en búsqueda general: {e}")
             return f"Error en búsqueda: {str(e)}"
     
+    # Índice de códigos/términos para BD creadas antes de esta versión (construcción única)
+    if SISTEMA_AI_DISPONIBLE:
+        try:
+            ensure_term_index("database/hybrid_knowledge.db")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo verificar el índice de códigos/términos: {e}")
+    
     logger.info("✅ Sistema Híbrido Simplificado cargado exitosamente")
     sistema_hibrido_disponible = True
     version_sistema = "v3.2_simple_sqlite"
@@ -1860,6 +1852,13 @@ def api_diagnostico():
                 }
             except Exception as e:
                 diagnostico_info['error_sistema_hibrido'] = str(e)
+
+        # Estadísticas del retriever (caches, índice) si el sistema de IA está activo
+        if SISTEMA_AI_DISPONIBLE and 'retriever' in globals():
+            try:
+                diagnostico_info['retriever'] = retriever.get_stats()
+            except Exception as e:
+                diagnostico_info['error_retriever'] = str(e)
         
         return jsonify(diagnostico_info)
     except Exception as e:
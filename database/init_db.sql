@@ -28,15 +28,53 @@ CREATE TABLE IF NOT EXISTS chunks_meta(
   hash TEXT
 );
 
+CREATE INDEX IF NOT EXISTS idx_chunks_meta_doc ON chunks_meta(doc_id);
+
+-- Manifiesto de la ingesta incremental (ai_system.ingest): hash por archivo de data/
+CREATE TABLE IF NOT EXISTS ingest_files(
+  doc_id TEXT PRIMARY KEY,
+  sha256 TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  chunks INTEGER NOT NULL,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Full-text search para chunks (búsqueda léxica)
+-- rowid = chunk_id en chunks_meta y en el índice FAISS; mismo esquema que ai_system.ingest
 CREATE VIRTUAL TABLE IF NOT EXISTS fts_chunks USING fts5(
-  chunk_text,
-  chunk_id UNINDEXED,
-  doc_id UNINDEXED,
-  heading_path UNINDEXED,
-  page_start UNINDEXED,
-  page_end UNINDEXED
+  content,
+  tomo,
+  capitulo,
+  articulo,
+  tipo_seccion,
+  fuente,
+  tokenize = 'unicode61 remove_diacritics 2'  -- búsqueda insensible a acentos
+);
+
+-- Citas exactas: encabezados numerados (Regla/Sección/...) -> chunk + offsets en el texto
+CREATE TABLE IF NOT EXISTS citation_index(
+  kind TEXT NOT NULL,
+  number TEXT NOT NULL,
+  tomo TEXT,
+  chunk_id INTEGER NOT NULL,
+  start INTEGER NOT NULL,
+  end INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_citation_number ON citation_index(number, kind);
+CREATE INDEX IF NOT EXISTS idx_citation_chunk ON citation_index(chunk_id);
+
+-- Códigos de zonificación (R-1, C-2, ...) y términos del glosario -> chunk + offsets
+CREATE TABLE IF NOT EXISTS term_index(
+  term TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  chunk_id INTEGER NOT NULL,
+  start INTEGER NOT NULL,
+  end INTEGER NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 1
 );
+CREATE INDEX IF NOT EXISTS idx_term ON term_index(term, kind);
+CREATE INDEX IF NOT EXISTS idx_term_chunk ON term_index(chunk_id);
 
 -- Logs mínimos
 CREATE TABLE IF NOT EXISTS query_logs(
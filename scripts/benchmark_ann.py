@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK_ANN.PY - Compara tipos de índice FAISS para el índice documental
+===========================================================================
+
+🎯 FUNCIÓN PRINCIPAL:
+   Medir recall@k contra la búsqueda exacta (Flat float32), latencia por consulta
+   y memoria de cada tipo de índice (flat, hnsw, ivf_flat, ivf_pq, sq8, fp16, pq),
+   opcionalmente también con reducción PCA (--pca_dim), sobre:
+   1. El corpus real (vectores del índice existente o un .npy de embeddings)
+   2. Una copia sintéticamente escalada del corpus (--scale N)
+
+🏗️ PROCESO:
+   1. Cargar vectores del corpus
+   2. Generar consultas: vectores del corpus con ruido gaussiano, renormalizados
+   3. Construir cada índice con ai_system.ann_index.build_index
+   4. Medir recall@k, latencia p50/p99 y tamaño serializado
+
+🚀 USO:
+   python scripts/benchmark_ann.py
+   python scripts/benchmark_ann.py --scale 50 --k 10 --queries 500
+   python scripts/benchmark_ann.py --pca_dim 128
+
+=======================================================================
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import faiss
+
+# Agregar directorio padre al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_system.config import FAISS_PATH
+from ai_system.ann_index import INDEX_TYPES, build_index
+
+
+def load_corpus_vectors(index_path: str, embeddings_path: str = None) -> np.ndarray:
+    """Cargar vectores desde un .npy o reconstruyéndolos del índice existente"""
+    if embeddings_path:
+        X = np.load(embeddings_path).astype(np.float32)
+    else:
+        index = faiss.read_index(index_path)
+        X = index.reconstruct_n(0, index.ntotal)
+    faiss.normalize_L2(X)
+    return X
+
+
+def perturb(X: np.ndarray, n: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """Muestrear n vectores de X con ruido gaussiano y renormalizar"""
+    base = X[rng.integers(0, len(X), size=n)]
+    out = (base + rng.normal(0, noise, size=base.shape)).astype(np.float32)
+    faiss.normalize_L2(out)
+    return out
+
+
+def scale_corpus(X: np.ndarray, factor: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """Copia escalada: el corpus original más (factor-1) réplicas con ruido"""
+    if factor <= 1:
+        return X
+    return np.vstack([X] + [perturb(X, len(X), noise, rng) for _ in range(factor - 1)])
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t[t >= 0]) & set(f[f >= 0])) for t, f in zip(truth, found))
+    return hits / max(1, (truth >= 0).sum())
+
+
+def bench_one(X: np.ndarray, Q: np.ndarray, truth: np.ndarray, index_type: str, k: int,
+              pca_dim: int = 0) -> dict:
+    t0 = time.perf_counter()
+    index, manifest = build_index(X, index_type, pca_dim=pca_dim)
+    build_s = time.perf_counter() - t0
+
+    latencies = []
+    found = np.empty((len(Q), k), dtype=np.int64)
+    for i in range(len(Q)):
+        t = time.perf_counter()
+        _, I = index.search(Q[i:i + 1], k)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found[i] = I[0]
+
+    return {
+        "type": index_type + (f"+pca{pca_dim}" if pca_dim else ""),
+        "recall": recall_at_k(truth, found),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "build_s": build_s,
+        "mem_mb": faiss.serialize_index(index).nbytes / 1e6,
+        "bytes_per_vector": manifest.get("bytes_per_vector", 0.0),
+        "params": manifest.get("params", {}),
+    }
+
+
+def run(X: np.ndarray, label: str, k: int, n_queries: int, noise: float, rng: np.random.Generator,
+        pca_dim: int = 0):
+    print(f"\n📊 {label}: {len(X)} vectores x {X.shape[1]} dims, {n_queries} consultas, k={k}")
+    Q = perturb(X, n_queries, noise, rng)
+    exact = faiss.IndexFlatIP(X.shape[1])
+    exact.add(X)
+    _, truth = exact.search(Q, k)
+
+    print(f"   {'tipo':<16} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'mem MB':>8} "
+          f"{'B/vec':>7}  params")
+    for index_type in INDEX_TYPES:
+        for pca in ([0, pca_dim] if pca_dim else [0]):
+            try:
+                r = bench_one(X, Q, truth, index_type, k, pca_dim=pca)
+            except Exception as e:
+                print(f"   {index_type:<16} ❌ {e}")
+                continue
+            params = ", ".join(f"{a}={b}" for a, b in r["params"].items())
+            print(f"   {r['type']:<16} {r['recall']:>9.3f} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} "
+                  f"{r['build_s']:>8.2f} {r['mem_mb']:>8.2f} {r['bytes_per_vector']:>7.0f}  {params}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de tipos de índice FAISS")
+    ap.add_argument("--index", default=FAISS_PATH, help="Índice existente del que leer vectores")
+    ap.add_argument("--embeddings", help="Alternativa: archivo .npy con embeddings (n x d)")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--scale", type=int, default=20, help="Factor de escalado sintético (1 = omitir)")
+    ap.add_argument("--noise", type=float, default=0.02, help="Desviación del ruido de consultas/réplicas")
+    ap.add_argument("--pca_dim", type=int, default=0, help="Medir también cada tipo con PCA a esta dimensión")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    X = load_corpus_vectors(args.index, args.embeddings)
+
+    run(X, "Corpus real", args.k, args.queries, args.noise, rng, args.pca_dim)
+    if args.scale > 1:
+        run(scale_corpus(X, args.scale, args.noise, rng), f"Corpus escalado x{args.scale}",
+            args.k, args.queries, args.noise, rng, args.pca_dim)
+
+
+if __name__ == "__main__":
+    main()
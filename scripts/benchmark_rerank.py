@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+BENCHMARK_RERANK.PY - Costo del rerank de candidatos vectoriales
+=================================================================
+
+🎯 FUNCIÓN PRINCIPAL:
+   1. Comparar el rerank anterior (bucle sobre dicts, split de la consulta y
+      búsqueda de substrings por candidato) contra el vectorizado de
+      ai_system.rerank, para k creciente, sobre los metadatos reales.
+   2. Con --cross_encoder: latencia p50/p99 que agrega el cross-encoder
+      (RERANK_MODEL) según el número de candidatos, con textos reales de FTS.
+
+🏗️ PROCESO:
+   1. Abrir el almacén de metadatos del índice (database/metas_store)
+   2. Generar candidatos: posiciones al azar con similitudes decrecientes
+   3. Medir ambos reranks (incluyendo materializar los dicts del top-k)
+
+🚀 USO:
+   python scripts/benchmark_rerank.py
+   python scripts/benchmark_rerank.py --k 12 48 192 735 --repeat 200
+   python scripts/benchmark_rerank.py --cross_encoder --candidates 6 12 24
+
+=======================================================================
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Agregar directorio padre al path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_system.config import (
+    FAISS_PATH, DB_PATH, RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_MAX_CHARS, RERANK_TOP_N
+)
+from ai_system.db import get_conn, fts_search
+from ai_system.meta_store import MetaStore, query_tokens
+from ai_system.rerank import vector_hits, rerank_arrays
+
+QUERIES = [
+    "¿Cuáles son los parámetros de la zona R-1 en el Tomo 6?",
+    "requisitos de estacionamiento para uso comercial",
+    "procedimiento de permiso de construcción capítulo 8",
+]
+
+
+def legacy_rerank(metas: MetaStore, ids: np.ndarray, scores: np.ndarray, query: str, k: int):
+    """Rerank anterior: dicts para todos los candidatos y bucle en Python"""
+    candidates = [{"score": float(s), **m} for s, m in zip(scores, metas.rows(ids))]
+    seen_docs = set()
+    for cand in candidates:
+        score = cand.get("score", 0.0)
+        doc_id = cand.get("doc_id", "")
+        if doc_id not in seen_docs:
+            score += 0.1
+            seen_docs.add(doc_id)
+        heading = cand.get("heading_path", "").lower()
+        query_lower = query.lower()
+        if any(word in heading for word in query_lower.split()):
+            score += 0.05
+        cand["reranked_score"] = score
+    candidates.sort(key=lambda x: x.get("reranked_score", 0), reverse=True)
+    return candidates[:k]
+
+
+def time_us(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+def bench_cross_encoder(db_path: str, candidates: list, repeat: int, budget_ms: float):
+    """p50/p99 de la etapa de cross-encoder sobre candidatos reales (textos de FTS)"""
+    from ai_system.rerank import CrossEncoderReranker
+
+    reranker = CrossEncoderReranker(RERANK_MODEL, batch_size=RERANK_BATCH_SIZE, budget_ms=budget_ms,
+                                    max_chars=RERANK_MAX_CHARS)
+    with get_conn(db_path, readonly=True) as con:
+        pools = {q: fts_search(con, q, limit=max(candidates)) for q in QUERIES}
+
+    reranker.rerank(QUERIES[0], [dict(c) for c in pools[QUERIES[0]]], RERANK_TOP_N)  # calentamiento
+    print(f"\n📊 Cross-encoder {RERANK_MODEL} (lote {RERANK_BATCH_SIZE}, presupuesto {budget_ms:.0f} ms)")
+    print(f"   {'candidatos':>10} {'p50 ms':>8} {'p99 ms':>8} {'sobre presupuesto':>18}")
+    for n in candidates:
+        latencies, over = [], 0
+        for _ in range(repeat):
+            for q in QUERIES:
+                cands = [dict(c) for c in pools[q][:n]]
+                t0 = time.perf_counter()
+                reranker.rerank(q, cands, RERANK_TOP_N)
+                latencies.append((time.perf_counter() - t0) * 1000)
+                over += int(latencies[-1] > budget_ms)
+        print(f"   {n:>10} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f} "
+              f"{over / len(latencies):>17.1%}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark del rerank de candidatos")
+    ap.add_argument("--index_dir", default=os.path.dirname(FAISS_PATH))
+    ap.add_argument("--k", type=int, nargs="+", default=[12, 48, 192, 735])
+    ap.add_argument("--repeat", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--cross_encoder", action="store_true", help="Medir también el cross-encoder")
+    ap.add_argument("--candidates", type=int, nargs="+", default=[6, 12, 24])
+    ap.add_argument("--budget_ms", type=float, default=RERANK_BUDGET_MS)
+    ap.add_argument("--db", default=DB_PATH)
+    args = ap.parse_args()
+
+    metas = MetaStore.open(args.index_dir)
+    rng = np.random.default_rng(args.seed)
+    print(f"📊 {len(metas)} filas de metadatos, {len(QUERIES)} consultas, {args.repeat} repeticiones")
+    print(f"   {'k':>5} {'candidatos':>10} {'anterior µs':>12} {'vectorizado µs':>15} {'x':>6} {'solo rerank µs':>15}")
+
+    for k in args.k:
+        # Igual que search_vectors: se rerankean k*3 candidatos para devolver k
+        n = min(k * 3, len(metas))
+        ids = rng.choice(len(metas), size=n, replace=False).astype(np.int64)
+        scores = np.sort(rng.uniform(0.7, 0.95, size=n)).astype(np.float32)[::-1]
+        old = new = arrays = 0.0
+        for q in QUERIES:
+            old += time_us(lambda: legacy_rerank(metas, ids, scores, q, k), args.repeat)
+            # La tokenización de la consulta cuenta dentro del costo por request
+            new += time_us(lambda: vector_hits(metas, ids, scores, query_tokens(q), k, 0.0), args.repeat)
+            # Sin materializar dicts: el costo propio del rerank
+            arrays += time_us(lambda: rerank_arrays(metas, ids, scores, query_tokens(q), k), args.repeat)
+        old, new, arrays = old / len(QUERIES), new / len(QUERIES), arrays / len(QUERIES)
+        print(f"   {k:>5} {n:>10} {old:>12.1f} {new:>15.1f} {old / new:>6.1f} {arrays:>15.1f}")
+
+    if args.cross_encoder:
+        bench_cross_encoder(args.db, args.candidates, max(1, args.repeat // 10), args.budget_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,9 @@ REBUILD_INDEX_LOCAL.PY - Reconstruye el índice FAISS con embeddings locales
    - Espacio suficiente para el nuevo índice (~2-3x tamaño original)
 
 ⚠️ ATENCIÓN:
+   - Solo para instalaciones sin snapshots: si ya hay uno publicado (CURRENT en
+     INDEX_SNAPSHOT_DIR) el retriever ignora FAISS_PATH y el script no corre.
+     En ese caso: python -m ai_system.ingest --data_dir data --full --embedder local
    - Este proceso puede tomar tiempo dependiendo del número de documentos
    - El índice anterior será sobrescrito
    - Asegúrate de tener backup antes de ejecutar
@@ -39,7 +42,10 @@ from tqdm import tqdm
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from ai_system.local_embeddings import LocalEmbeddings
-from ai_system.config import DB_PATH, FAISS_PATH
+from ai_system.embedding_store import ChunkEmbeddingStore
+from ai_system.config import DB_PATH, FAISS_PATH, FAISS_INDEX_TYPE, FAISS_PCA_DIM, CHUNK_EMBED_STORE_DIR
+from ai_system.config import INDEX_SNAPSHOT_DIR
+from ai_system.index_snapshots import SnapshotManager
 
 def get_documents_from_db(db_path: str) -> List[Dict]:
     """
@@ -99,6 +105,12 @@ def rebuild_index_with_local_embeddings():
 
     # 1. Verificar archivos existentes
     print("\n1. Verificando archivos existentes...")
+    version = SnapshotManager(INDEX_SNAPSHOT_DIR).current_version()
+    if version is not None:
+        print(f"❌ Hay un snapshot publicado ({version}): el retriever no usaría {FAISS_PATH}")
+        print("   Reconstruir con: python -m ai_system.ingest --data_dir data --full --embedder local")
+        return False
+
     if not os.path.exists(DB_PATH):
         print(f"❌ Base de datos no encontrada: {DB_PATH}")
         return False
@@ -132,7 +144,12 @@ def rebuild_index_with_local_embeddings():
     texts = [doc["content"] for doc in documents]
 
     try:
-        embeddings = embedder.encode_texts(texts)
+        if CHUNK_EMBED_STORE_DIR:
+            # Solo se embeben los chunks nuevos o modificados (clave: modelo + hash del texto)
+            store = ChunkEmbeddingStore(CHUNK_EMBED_STORE_DIR, embedder.model_name)
+            embeddings = store.embed(texts, embedder.encode_texts)
+        else:
+            embeddings = embedder.encode_texts(texts)
         print(f"✅ Embeddings generados: shape {embeddings.shape}")
     except Exception as e:
         print(f"❌ Error generando embeddings: {e}")
@@ -141,8 +158,8 @@ def rebuild_index_with_local_embeddings():
     # 5. Crear nuevo índice FAISS
     print("\n5. Creando nuevo índice FAISS...")
     try:
-        embedder.create_index(embeddings, documents)
-        print(f"✅ Índice creado con {embedder.index.ntotal} vectores")
+        embedder.create_index(embeddings, documents, index_type=FAISS_INDEX_TYPE, pca_dim=FAISS_PCA_DIM)
+        print(f"✅ Índice {FAISS_INDEX_TYPE} creado con {embedder.index.ntotal} vectores")
     except Exception as e:
         print(f"❌ Error creando índice: {e}")
         return False
@@ -201,9 +218,11 @@ def test_rebuilt_index():
         print(f"🔍 Consulta de prueba: '{query}'")
         print(f"📊 Resultados encontrados: {len(results)}")
 
+        # El texto no viaja en los metadatos; se trae de SQLite para el top-k
+        texts = retriever.fetch_texts([r['chunk_id'] for r in results])
         for i, result in enumerate(results, 1):
             score = result.get('score', 0)
-            content = result.get('content', '')[:100]
+            content = texts.get(result['chunk_id'], '')[:100]
             print(f"   {i}. Score={score:.3f} | {content}...")
 
         return len(results) > 0
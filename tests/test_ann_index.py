@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+faiss = pytest.importorskip("faiss")
+
+from ai_system.ann_index import build_index
+
+
+def _normalized(n, d, seed):
+    # Vectores con varianza concentrada en pocas dimensiones, como los embeddings reales
+    rng = np.random.default_rng(seed)
+    X = (rng.standard_normal((n, d)) * np.linspace(3.0, 0.05, d)).astype(np.float32)
+    faiss.normalize_L2(X)
+    return X
+
+
+def test_pca_scores_are_cosines_and_keep_flat_order():
+    X = _normalized(500, 64, seed=0)
+    Q = _normalized(20, 64, seed=1)
+    ids = np.arange(1, len(X) + 1, dtype=np.int64)
+    flat, _ = build_index(X, "flat", ids=ids)
+    pca, manifest = build_index(X, "flat", ids=ids, pca_dim=48)
+    assert manifest["params"]["pca_dim"] == 48
+
+    scores, pca_ids = pca.search(Q, 10)
+    assert scores.max() <= 1.0 + 1e-5 and scores.min() >= -1.0 - 1e-5
+    _, flat_ids = flat.search(Q, 10)
+    overlap = np.mean([len(set(a) & set(b)) / 10 for a, b in zip(pca_ids, flat_ids)])
+    assert overlap >= 0.8
+    assert np.mean(pca_ids[:, 0] == flat_ids[:, 0]) >= 0.9
+
+
+def test_pca_self_match_scores_one():
+    X = _normalized(300, 64, seed=2)
+    index, _ = build_index(X, "flat", pca_dim=16)
+    scores, found = index.search(X[:10], 1)
+    assert (found[:, 0] == np.arange(10)).all()
+    assert np.allclose(scores[:, 0], 1.0, atol=1e-4)
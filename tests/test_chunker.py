@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from ai_system.chunker import _LEGAL_LINE, iter_legal_chunks
+
+
+@pytest.mark.parametrize("line", [
+    "Regla 6.1.2 del Capítulo 6 aplica.",
+    "Regla 6.1 del Tomo 6 aplica.",
+    "Sección 3.2.1 establece los requisitos.",
+    "Capítulo VI de la ley.",
+])
+def test_referencia_al_inicio_de_linea_no_es_encabezado(line):
+    assert _LEGAL_LINE.match(line) is None
+
+
+@pytest.mark.parametrize("line, number", [
+    ("REGLA 6.1.2 DEFINICIONES", "6.1.2"),
+    ("REGLA 6.1. Texto", "6.1"),
+    ("Regla 6.1", "6.1"),
+])
+def test_encabezado_conserva_el_numero_completo(line, number):
+    assert _LEGAL_LINE.match(line)["articulo_n"] == number
+
+
+def test_referencia_queda_dentro_de_la_regla_vigente():
+    lines = ["TOMO 6\n", "CAPÍTULO 6 GENERAL\n", "REGLA 6.1 ALCANCE\n", "Texto de la regla.\n",
+             "Regla 6.1.2 del Capítulo 6 aplica.\n"]
+    chunks = list(iter_legal_chunks(lines))
+    assert len(chunks) == 1
+    assert chunks[0].articulo == "6.1"
+    assert chunks[0].text.endswith("Regla 6.1.2 del Capítulo 6 aplica.")
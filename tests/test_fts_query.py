@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from ai_system.db import build_fts_query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Artículo 5", '"articulo 5"'),
+    ("¿qué dice la Regla 6.1.2?", '"regla 6 1 2"'),
+    ("requisitos de zonificación", "requisitos* OR zonificacion* OR NEAR(requisitos zonificacion, 10)"),
+])
+def test_rotulos_con_numero_son_frases(query, expected):
+    assert build_fts_query(query) == expected
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("¿qué dice el tomo 6?", '"tomo 6"'),
+    ("¿y el capítulo?", "capitulo"),
+    ("¿qué dice el 6?", "6"),
+])
+def test_consulta_solo_de_estructura_no_queda_vacia(query, expected):
+    assert build_fts_query(query) == expected
+
+
+def test_solo_stopwords_queda_vacia():
+    assert build_fts_query("¿qué es?") == ""
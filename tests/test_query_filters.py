@@ -0,0 +1,18 @@
+import pytest
+
+from ai_system.query_filters import parse_query_filters
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("requisitos del Capítulo 3 del Tomo VI", {"tomo": ["6"], "capitulo": ["3"]}),
+    ("tomo vi", {"tomo": ["6"]}),
+    ("TOMO 6", {"tomo": ["6"]}),
+    ("tomo xiv y cap. iv", {"tomo": ["14"], "capitulo": ["4"]}),
+])
+def test_referencias_de_tomo_y_capitulo(query, expected):
+    assert parse_query_filters(query) == expected
+
+
+@pytest.mark.parametrize("query", ["a tomos civil", "cap. lic", "tomo de la ley"])
+def test_palabras_no_son_romanos(query):
+    assert parse_query_filters(query) == {}
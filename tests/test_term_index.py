@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from ai_system.term_index import MAX_QUERY_TERMS, parse_terms
+
+
+def test_sin_stopwords_sueltas():
+    terms = parse_terms("¿qué es un acre?").terms
+    assert "acre" in terms and "un acre" in terms
+    assert not {"que", "es", "un"} & set(terms)
+
+
+def test_consulta_larga_acotada_sin_perder_terminos_cortos():
+    query = "que es " + " ".join(f"palabra{i}" for i in range(40))
+    terms = parse_terms(query).terms
+    assert len(terms) <= MAX_QUERY_TERMS
+    assert "palabra0" in terms and "palabra39" in terms